@@ -0,0 +1,64 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from dflow import download_artifact, upload_artifact
+
+
+class DiskUsageMonitor:
+    """Sample used space of the filesystem to estimate the peak usage"""
+
+    def __init__(self, path, interval=0.01):
+        self.path = path
+        self.interval = interval
+        self.baseline = shutil.disk_usage(path).used
+        self.peak = self.baseline
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, shutil.disk_usage(self.path).used)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.peak - self.baseline
+
+
+def benchmark(n_files, file_size, repeat):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "src")
+        os.makedirs(src)
+        for i in range(n_files):
+            with open(os.path.join(src, "%s.dat" % i), "wb") as f:
+                f.write(os.urandom(file_size))
+        art = upload_artifact(src, archive="tar")
+        print("%-10s %-12s %-16s" % ("stream", "time (s)", "peak disk (MB)"))
+        for stream in [False, True]:
+            for _ in range(repeat):
+                dst = os.path.join(tmpdir, "dst")
+                monitor = DiskUsageMonitor(tmpdir)
+                start = time.time()
+                download_artifact(art, path=dst, stream=stream)
+                elapsed = time.time() - start
+                peak = monitor.stop()
+                shutil.rmtree(dst)
+                print("%-10s %-12.2f %-16.2f" % (stream, elapsed,
+                                                 peak / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Wall-clock time and peak disk usage of downloading a "
+        "compressed artifact with and without streaming extraction")
+    parser.add_argument("-n", "--n-files", type=int, default=100)
+    parser.add_argument("-s", "--file-size", type=int, default=1024 * 1024)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.n_files, args.file_size, args.repeat)
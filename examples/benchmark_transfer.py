@@ -0,0 +1,42 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from dflow import download_s3, upload_s3
+
+
+def benchmark(n_files, file_size, concurrencies):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "src")
+        os.makedirs(src)
+        for i in range(n_files):
+            with open(os.path.join(src, "%s.dat" % i), "wb") as f:
+                f.write(os.urandom(file_size))
+        total = n_files * file_size / 1024 / 1024
+        print("%-12s %-16s %-16s" % ("concurrency", "upload (MB/s)",
+                                     "download (MB/s)"))
+        for c in concurrencies:
+            start = time.time()
+            key = upload_s3(src, max_concurrency=c)
+            t_up = time.time() - start
+
+            dst = os.path.join(tmpdir, "dst")
+            start = time.time()
+            download_s3(key, path=dst, max_concurrency=c)
+            t_down = time.time() - start
+            shutil.rmtree(dst)
+            print("%-12s %-16.2f %-16.2f" % (c, total / t_up, total / t_down))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of upload_s3/download_s3 vs. concurrency")
+    parser.add_argument("-n", "--n-files", type=int, default=1000)
+    parser.add_argument("-s", "--file-size", type=int, default=4096)
+    parser.add_argument("-c", "--concurrencies", type=str,
+                        default="1,2,4,8,16,32")
+    args = parser.parse_args()
+    benchmark(args.n_files, args.file_size,
+              [int(c) for c in args.concurrencies.split(",")])
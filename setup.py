@@ -31,7 +31,7 @@ setup(
         "typeguard<3",
         "argo-workflows==5.0.0",
         "jsonpickle",
-        "minio",
+        "minio>=7.2,<8",
         "kubernetes",
         "pyyaml",
         "cloudpickle==2.2.0",
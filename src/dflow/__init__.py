@@ -18,8 +18,10 @@ from .step import (Step, argo_concat, argo_len, argo_range, argo_sequence,
                    argo_sum)
 from .steps import Steps
 from .task import Task
-from .utils import (copy_artifact, copy_s3, download_artifact, download_s3,
-                    path_list_of_artifact, randstr, upload_artifact, upload_s3)
+from .utils import (async_copy_artifact, async_download_artifact,
+                    async_upload_artifact, copy_artifact, copy_s3,
+                    download_artifact, download_s3, path_list_of_artifact,
+                    randstr, upload_artifact, upload_s3)
 from .workflow import (DockerSecret, Workflow, query_archived_workflows,
                        query_workflows)
 
@@ -36,7 +38,8 @@ __all__ = ["S3Artifact", "DAG", "Executor", "RemoteExecutor", "AutonamedDict",
            "set_s3_config", "DockerSecret", "argo_sum", "argo_concat",
            "LineageClient", "Secret", "query_workflows",
            "query_archived_workflows", "ContainerExecutor", "ArgoStep",
-           "ArgoWorkflow"]
+           "ArgoWorkflow", "async_copy_artifact", "async_download_artifact",
+           "async_upload_artifact"]
 
 
 def import_func(s):
@@ -51,6 +54,8 @@ def import_func(s):
 
 if os.environ.get("DFLOW_LINEAGE"):
     config["lineage"] = import_func(os.environ.get("DFLOW_LINEAGE"))()
-if os.environ.get("DFLOW_S3_STORAGE_CLIENT"):
+# URLs of local storage backends are resolved when the client is used
+if os.environ.get("DFLOW_S3_STORAGE_CLIENT") and "://" not in \
+        os.environ.get("DFLOW_S3_STORAGE_CLIENT"):
     s3_config["storage_client"] = import_func(os.environ.get(
         "DFLOW_S3_STORAGE_CLIENT"))()
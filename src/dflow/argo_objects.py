@@ -13,7 +13,7 @@ import jsonpickle
 from .config import config, s3_config
 from .io import S3Artifact
 from .op_template import get_k8s_client
-from .utils import download_artifact, get_key, upload_s3
+from .utils import download_artifact, get_archive_codec, get_key, upload_s3
 
 try:
     import kubernetes
@@ -197,11 +197,13 @@ class ArgoStep(ArgoObjectDict):
         elif s3_config["repo_type"] == "oss":
             self.outputs.artifacts[name].oss = ArgoObjectDict(
                 s3.oss().to_dict())
-        if s3.key[-4:] == ".tgz" and hasattr(self.outputs.artifacts[name],
-                                             "archive"):
+        # Argo only extracts gzip tarballs, zstd and lz4 tarballs are placed
+        # as files and extracted in the pods of Python OPs
+        gzipped = get_archive_codec(s3.key) in ["tar", "indexed"]
+        if gzipped and hasattr(self.outputs.artifacts[name], "archive"):
             del self.outputs.artifacts[name]["archive"]
-        elif s3.key[-4:] != ".tgz" and not hasattr(self.outputs.artifacts[
-                name], "archive"):
+        elif not gzipped and not hasattr(self.outputs.artifacts[name],
+                                         "archive"):
             self.outputs.artifacts[name]["archive"] = {"none": {}}
         self.outputs.artifacts[name].modified = {"old_key": old_key}
 
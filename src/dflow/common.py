@@ -1,7 +1,5 @@
 import abc
 import logging
-import os
-import shutil
 from abc import ABC
 from copy import copy, deepcopy
 from typing import Any, Dict, List, Union
@@ -50,6 +48,7 @@ class S3Artifact(V1alpha1S3Artifact):
         self.urn = urn
         self.slice = None
         self.parent = None
+        self.parts = None
 
     def __getitem__(self, key):
         art = copy(self)
@@ -65,7 +64,8 @@ class S3Artifact(V1alpha1S3Artifact):
         if s3_config["storage_client"] is None:
             d.update(s3_config)
         else:
-            d.update(s3_config["storage_client"].to_dict())
+            from .utils import get_plugin_storage_client
+            d.update(get_plugin_storage_client().to_dict())
         return d
 
     @classmethod
@@ -86,6 +86,17 @@ class S3Artifact(V1alpha1S3Artifact):
         from .utils import download_artifact
         download_artifact(self, **kwargs)
 
+    @classmethod
+    def concat(cls, artifacts: List["S3Artifact"], **kwargs) -> "S3Artifact":
+        """
+        Concatenate artifacts into a composite artifact without copying data
+
+        Args:
+            artifacts: artifacts to be concatenated
+        """
+        from .utils import concat_artifacts
+        return concat_artifacts(artifacts, **kwargs)
+
     def oss(self):
         config = Configuration()
         config.client_side_validation = False
@@ -113,16 +124,9 @@ class HTTPArtifact:
     def __init__(self, url):
         self.url = url
 
-    def download(self, path="."):
-        os.makedirs(path, exist_ok=True)
-        file_path = os.path.join(path, os.path.basename(self.url))
-        import requests
-        sess = requests.session()
-        with sess.get(self.url, stream=True, verify=False) as req:
-            req.raise_for_status()
-            with open(file_path, 'w') as f:
-                shutil.copyfileobj(req.raw, f.buffer)
-        return file_path
+    def download(self, path=".", cache_dir=None):
+        from .utils import download_http
+        return download_http(self.url, path, cache_dir)
 
 
 class LineageClient(ABC):
@@ -39,7 +39,14 @@ config = {
     "save_path_as_parameter": boolize(os.environ.get(
         "DFLOW_SAVE_PATH_AS_PARAMETER", False)),
     "catalog_dir_name": os.environ.get("DFLOW_CATALOG_DIR_NAME", ".dflow"),
+    "catalog_manifest_name": os.environ.get("DFLOW_CATALOG_MANIFEST_NAME",
+                                            "manifest"),
+    "catalog_compact_threshold": int(os.environ.get(
+        "DFLOW_CATALOG_COMPACT_THRESHOLD", 0)),
     "archive_mode": nullable(os.environ.get("DFLOW_ARCHIVE_MODE", "tar")),
+    "archive_level": int(os.environ["DFLOW_ARCHIVE_LEVEL"]) if os.environ.get(
+        "DFLOW_ARCHIVE_LEVEL") else None,
+    "archive_threads": int(os.environ.get("DFLOW_ARCHIVE_THREADS", -1)),
     "util_image": os.environ.get("DFLOW_UTIL_IMAGE", "python:3.8"),
     "util_image_pull_policy": os.environ.get("DFLOW_UTIL_IMAGE_PULL_POLICY",
                                              None),
@@ -61,6 +68,7 @@ config = {
         "DFLOW_WORKFLOW_ANNOTATIONS", "{}")),
     "overwrite_reused_artifact": boolize(os.environ.get(
         "DFLOW_OVERWRITE_REUSED_ARTIFACT", True)),
+    "transfer_metrics": os.environ.get("DFLOW_TRANSFER_METRICS", None),
 }
 
 
@@ -81,7 +89,18 @@ def set_config(
         private_key_host_path: path of private key on the Kubernetes nodes
         save_path_as_parameter: save catalog of artifacts as parameters
         catalog_dir_name: catalog directory name for artifacts
-        archive_mode: "tar" for archiving with tar, None for no archive
+        catalog_manifest_name: name of the compact manifest in the catalog
+        directory
+        catalog_compact_threshold: compact the catalog of an artifact when
+        reading more fragments than it, 0 for never
+        archive_mode: "tar" for archiving with tar and gzip, "zstd" or "lz4"
+        for archiving with tar and a fast codec (output artifacts of steps
+        use "tar" instead and input artifacts are extracted by Python OPs
+        only), "auto" for choosing "tar" or None by sampling the content,
+        None for no archive
+        archive_level: compression level, None for the default of the codec
+        archive_threads: number of compression threads for zstd, -1 for the
+        number of CPUs
         util_image: image for util step
         util_image_pull_policy: image pull policy for util step
         extender_image: image for dflow extender
@@ -94,6 +113,9 @@ def set_config(
         http_headers: HTTP headers for requesting Argo server
         workflow_annotations: default annotations for workflows
         overwrite_reused_artifact: overwrite reused artifact
+        transfer_metrics: sink of metrics of storage transfers, "logging",
+        "prometheus:<path of text file>" or a function called with the
+        metrics, None for no metrics
     """
     config.update(kwargs)
 
@@ -110,9 +132,30 @@ s3_config = {
     "repo_type": os.environ.get("DFLOW_S3_REPO_TYPE", "s3"),
     "repo_prefix": os.environ.get("DFLOW_S3_REPO_PREFIX", ""),
     "prefix": os.environ.get("DFLOW_S3_PREFIX", ""),
-    "storage_client": None,
+    "storage_client": os.environ.get("DFLOW_S3_STORAGE_CLIENT", None),
     "extra_prefixes": os.environ.get("DFLOW_S3_EXTRA_PREFIXES").split(";") if
     os.environ.get("DFLOW_S3_EXTRA_PREFIXES") else [],
+    "max_concurrency": int(os.environ.get("DFLOW_S3_MAX_CONCURRENCY", 8)),
+    "pool_size": int(os.environ["DFLOW_S3_POOL_SIZE"]) if os.environ.get(
+        "DFLOW_S3_POOL_SIZE") else None,
+    "keep_alive": boolize(os.environ.get("DFLOW_S3_KEEP_ALIVE", True)),
+    "part_size": int(os.environ.get("DFLOW_S3_PART_SIZE", 16 * 1024 * 1024)),
+    "cache_dir": os.environ.get("DFLOW_S3_CACHE_DIR", None),
+    "cache_size": int(os.environ.get("DFLOW_S3_CACHE_SIZE", 10 * 1024 ** 3)),
+    "multipart_threshold": int(os.environ.get(
+        "DFLOW_S3_MULTIPART_THRESHOLD", 64 * 1024 * 1024)),
+    "checkpoint_dir": os.environ.get("DFLOW_S3_CHECKPOINT_DIR", None),
+    "max_retries": int(os.environ.get("DFLOW_S3_MAX_RETRIES", 0)),
+    "retry_errors": json.loads(os.environ.get("DFLOW_S3_RETRY_ERRORS", "{}")),
+    "retry_backoff": float(os.environ.get("DFLOW_S3_RETRY_BACKOFF", 0.5)),
+    "retry_max_backoff": float(os.environ.get("DFLOW_S3_RETRY_MAX_BACKOFF",
+                                              30)),
+    "hedge_percentile": float(os.environ["DFLOW_S3_HEDGE_PERCENTILE"]) if
+    os.environ.get("DFLOW_S3_HEDGE_PERCENTILE") else None,
+    "bandwidth_limit": float(os.environ["DFLOW_S3_BANDWIDTH_LIMIT"]) if
+    os.environ.get("DFLOW_S3_BANDWIDTH_LIMIT") else None,
+    "async_storage_client": None,
+    "async_workers": int(os.environ.get("DFLOW_S3_ASYNC_WORKERS", 32)),
 }
 
 
@@ -134,7 +177,39 @@ def set_s3_config(
         repo_type: s3 or oss, parsed from repo_key
         repo_prefix: prefix of artifact repository, parsed from repo_key
         prefix: prefix of storage key
-        storage_client: client for plugin storage backend
+        storage_client: client for plugin storage backend, or URL of a
+        local storage backend, "memory://" or "localfs:///path/to/root",
+        with optional query "?latency=<seconds>" for injected latency, and
+        "link=<reflink|hardlink|symlink|copy>&index=1" for localfs on a
+        shared filesystem
         extra_prefixes: extra prefixes ignored by auto-prefixing
+        max_concurrency: maximum number of concurrent object transfers
+        pool_size: size of HTTP connection pool of the storage client, no
+        less than max_concurrency by default
+        keep_alive: enable TCP keep-alive for pooled connections
+        part_size: part size in bytes for multipart transfers
+        cache_dir: directory of the local object cache for downloads, None
+        for no cache
+        cache_size: size limit in bytes of the local object cache
+        multipart_threshold: objects larger than it are transferred in
+        resumable parts by storage clients supporting multipart transfers
+        checkpoint_dir: directory of checkpoints of resumable transfers,
+        dflow_checkpoints under the temporary directory by default, stale
+        checkpoints are removed by dflow.utils.clean_checkpoints
+        max_retries: number of retries of a failed storage request
+        retry_errors: numbers of retries keyed by class names of errors,
+        overriding max_retries for those errors
+        retry_backoff: base delay in seconds of exponential backoff between
+        retries, with full jitter
+        retry_max_backoff: maximum delay in seconds between retries
+        hedge_percentile: issue a duplicate ranged read or stream open if
+        the first one has not responded within this percentile of recent
+        latencies (per byte for ranged reads) since it started and a worker
+        of the hedge pool is idle, None for no hedged requests
+        bandwidth_limit: bandwidth limit in bytes per second shared by the
+        transfers of the whole process, None for no limit
+        async_storage_client: asyncio client for plugin storage backend, the
+        storage client wrapped in a thread pool by default
+        async_workers: number of threads shared by async storage helpers
     """
     s3_config.update(kwargs)
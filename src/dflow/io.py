@@ -13,7 +13,8 @@ from .utils import randstr, s3_config, upload_s3
 
 try:
     from argo.workflows.client import (V1alpha1ArchiveStrategy, V1alpha1Inputs,
-                                       V1alpha1Outputs, V1alpha1RawArtifact)
+                                       V1alpha1Outputs, V1alpha1RawArtifact,
+                                       V1alpha1TarStrategy)
 
     from .client import V1alpha1Artifact, V1alpha1Parameter, V1alpha1ValueFrom
 except Exception:
@@ -29,6 +30,16 @@ class ObjectDict(UserDict):
         return self.data[key]
 
 
+def get_argo_archive_mode() -> Optional[str]:
+    """
+    Default archive mode of output artifacts, "zstd" and "lz4" fall back to
+    "tar" as Argo only archives with gzip
+    """
+    if config["archive_mode"] in ["zstd", "lz4"]:
+        return "tar"
+    return config["archive_mode"]
+
+
 def to_expr(var):
     if isinstance(var, ArgoVar):
         return var.expr
@@ -933,7 +944,10 @@ class OutputArtifact(ArgoVar):
         type: artifact type
         save: place to store the output artifact instead of default storage,
             can be a list
-        archive: compress format of the artifact, None for no compression
+        archive: compress format of the artifact, None for no compression,
+            "auto" for the fastest gzip level, "zstd" and "lz4" are not
+            supported as Argo only archives with gzip, a default archive
+            mode of "zstd" or "lz4" falls back to "tar"
         global_name: global name of the artifact within the workflow
         from_expression: the artifact is from an expression
     """
@@ -962,7 +976,7 @@ class OutputArtifact(ArgoVar):
             save = [save]
         self.save = save
         if archive == "default":
-            archive = config["archive_mode"]
+            archive = get_argo_archive_mode()
         self.archive = archive
         self._sub_path = None
         self.global_name = global_name
@@ -1105,8 +1119,18 @@ class OutputArtifact(ArgoVar):
 
         if self.archive is None:
             kwargs["archive"] = V1alpha1ArchiveStrategy(_none={})
-        elif self.archive == "tar":
+        elif self.archive in ["tar", "indexed"]:
+            # Argo does not write the index of entries
             kwargs["archive"] = None
+        elif self.archive == "auto":
+            # the content is unknown before the step runs, use the fastest
+            # level of gzip instead
+            kwargs["archive"] = V1alpha1ArchiveStrategy(
+                tar=V1alpha1TarStrategy(compression_level=1))
+        elif self.archive in ["zstd", "lz4"]:
+            raise RuntimeError("Archive type %s not supported for output "
+                               "artifacts as Argo only archives with gzip" %
+                               self.archive)
         else:
             raise RuntimeError("Archive type %s not supported" % self.archive)
 
@@ -4,6 +4,7 @@ from typing import List, Optional
 
 from dflow import (S3Artifact, Workflow, download_artifact, query_workflows,
                    upload_artifact)
+from dflow.utils import compact_catalog
 
 
 def main_parser():
@@ -173,6 +174,13 @@ def main_parser():
         default=".",
         help="the path to which the artifact will be downloaded",
     )
+    parser_download.add_argument(
+        "-s",
+        "--slices",
+        type=str,
+        default=None,
+        help="comma-separated slices of the artifact to download",
+    )
 
     parser_upload = subparsers.add_parser(
         "upload",
@@ -222,6 +230,19 @@ def main_parser():
         help="properties for registering dataset",
     )
 
+    parser_compact = subparsers.add_parser(
+        "compact",
+        help="Compact the catalog of an artifact into a single manifest",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_compact.add_argument(
+        "-k",
+        "--key",
+        type=str,
+        required=True,
+        help="storage key of the artifact",
+    )
+
     parser_submit = subparsers.add_parser(
         "submit",
         help="Submit a workflow from a YAML file",
@@ -409,7 +430,10 @@ def main():
         assert args.key is not None or args.urn is not None, \
             "one of -k/--key and -u/--urn must be specified"
         art = S3Artifact(key=args.key, urn=args.urn)
-        path = download_artifact(art, path=args.path)
+        slices = None
+        if args.slices is not None:
+            slices = [int(i) for i in args.slices.split(",")]
+        path = download_artifact(art, path=args.path, slices=slices)
         print("Downloaded artifact to %s" % path)
     elif args.command == "upload":
         if "=" in args.path:
@@ -434,6 +458,9 @@ def main():
         print("Storage key: %s" % art.key)
         if art.urn:
             print("Dataset URN: %s" % art.urn)
+    elif args.command == "compact":
+        catalog = compact_catalog(S3Artifact(key=args.key))
+        print("Compacted catalog with %s items" % len(catalog))
     elif args.command == "submit":
         with open(args.FILE, "r") as f:
             wf = Workflow.from_yaml(f.read())
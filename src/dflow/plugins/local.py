@@ -0,0 +1,433 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from ..config import boolize
+from ..utils import StorageClient, get_md5
+
+
+def list_children(keys: List[str], prefix: str,
+                  recursive: bool = False) -> List[str]:
+    """
+    Keys starting with the prefix, the keys in subdirectories are folded
+    into their directories ending with "/" unless recursive
+    """
+    res = []
+    for key in sorted(keys):
+        if not key.startswith(prefix):
+            continue
+        if not recursive:
+            i = key.find("/", len(prefix))
+            if i != -1:
+                key = key[:i+1]
+                if res and res[-1] == key:
+                    continue
+        res.append(key)
+    return res
+
+
+class MemoryStorageClient(StorageClient):
+    """
+    Storage client keeping objects in memory of the current process, for
+    tests and benchmarks without an object storage
+
+    Args:
+        latency: seconds slept before each request to simulate the round
+            trip of a remote storage
+    """
+    resumable = True
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = float(latency)
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def delay(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def to_dict(self) -> dict:
+        return {"latency": self.latency}
+
+    def get(self, key: str) -> bytes:
+        with self.lock:
+            if key not in self.objects:
+                raise RuntimeError("Object %s not found" % key)
+            return self.objects[key][0]
+
+    def put(self, key: str, data: bytes, etag: Optional[str] = None) -> None:
+        if etag is None:
+            etag = hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.objects[key] = (data, etag)
+
+    def upload(self, key: str, path: str) -> None:
+        self.delay()
+        with open(path, "rb") as f:
+            self.put(key, f.read())
+
+    def upload_stream(self, key: str, stream) -> None:
+        self.delay()
+        self.put(key, stream.read())
+
+    def download(self, key: str, path: str) -> None:
+        self.delay()
+        data = self.get(key)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        self.delay()
+        yield io.BytesIO(self.get(key))
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        self.delay()
+        return self.get(key)[start:end]
+
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        self.delay()
+        with self.lock:
+            keys = list(self.objects)
+        return list_children(keys, prefix, recursive)
+
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        self.delay()
+        with self.lock:
+            objects = dict(self.objects)
+        return [{"key": key, "etag": objects[key][1],
+                 "size": len(objects[key][0])} if key in objects
+                else {"key": key}
+                for key in list_children(list(objects), prefix, recursive)]
+
+    def copy(self, src: str, dst: str) -> None:
+        self.delay()
+        with self.lock:
+            if src not in self.objects:
+                raise RuntimeError("Object %s not found" % src)
+            self.objects[dst] = self.objects[src]
+
+    def get_md5(self, key: str) -> str:
+        self.delay()
+        with self.lock:
+            if key not in self.objects:
+                raise RuntimeError("Object %s not found" % key)
+            return self.objects[key][1]
+
+    def create_multipart_upload(self, key: str) -> str:
+        self.delay()
+        upload_id = str(uuid.uuid4())
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        self.delay()
+        etag = hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.uploads[upload_id][part_number] = (data, etag)
+        return etag
+
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        self.delay()
+        with self.lock:
+            return {i: etag for i, (_, etag) in
+                    self.uploads[upload_id].items()}
+
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        self.delay()
+        with self.lock:
+            uploaded = self.uploads.pop(upload_id)
+        data = b"".join(uploaded[i][0] for i, _ in sorted(parts))
+        md5 = hashlib.md5(b"".join(bytes.fromhex(uploaded[i][1])
+                                   for i, _ in sorted(parts)))
+        self.put(key, data, "%s-%s" % (md5.hexdigest(), len(parts)))
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.delay()
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+
+
+# ioctl request cloning a file on Btrfs, XFS and other filesystems
+# supporting reflinks
+FICLONE = 0x40049409
+
+
+def clone_file(src: str, dst: str) -> None:
+    """
+    Create dst sharing the data blocks of src copy-on-write
+    """
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+class LocalFSStorageClient(StorageClient):
+    """
+    Storage client keeping objects as files under a root directory, which
+    can be a filesystem shared by the nodes of a cluster so that artifacts
+    are transferred by linking files instead of copying data
+
+    Args:
+        root: root directory of the storage, a temporary directory by
+            default
+        latency: seconds slept before each request to simulate the round
+            trip of a remote storage
+        link: how files are downloaded from the storage, "reflink"
+            (copy-on-write clone, the default), "hardlink" (the downloaded
+            file shares its data with the object and must not be modified
+            in place), "symlink" (downloaded files are symbolic links to the
+            objects) or "copy", falling back to copy if the filesystem does
+            not support the links. Files are put into the storage by
+            reflink in all modes but "copy", so that objects never share
+            data with files which may be modified
+        index: record sizes of objects in an index file of each directory
+            so that listing objects with metadata does not stat every
+            file, which is expensive on parallel filesystems like Lustre
+    """
+    link_modes = ["hardlink", "reflink", "symlink", "copy"]
+    index_name = ".dflow_index"
+
+    def __init__(self, root: Optional[str] = None,
+                 latency: float = 0.0,
+                 link: str = "reflink",
+                 index: bool = False) -> None:
+        if root is None:
+            root = tempfile.mkdtemp(prefix="dflow_storage_")
+        if link not in self.link_modes:
+            raise RuntimeError("Link mode %s not supported" % link)
+        self.root = os.path.abspath(root)
+        self.latency = float(latency)
+        self.link_mode = link
+        self.index = boolize(index)
+
+    def delay(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def to_dict(self) -> dict:
+        return {"root": self.root, "latency": self.latency,
+                "link": self.link_mode, "index": self.index}
+
+    @property
+    def storage_id(self) -> str:
+        return "localfs://%s" % self.root
+
+    def get_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise RuntimeError("Key %s is out of the storage" % key)
+        return path
+
+    def get_file(self, key: str) -> str:
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            raise RuntimeError("Object %s not found" % key)
+        return path
+
+    def link(self, src: str, dst: str, mode: str = "hardlink") -> None:
+        """
+        Link or copy a file to dst atomically
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+        tmp = "%s.%s.dflow_tmp" % (dst, uuid.uuid4().hex)
+        try:
+            if mode == "symlink":
+                os.symlink(src, tmp)
+            elif mode == "reflink":
+                clone_file(src, tmp)
+            elif mode == "hardlink":
+                os.link(src, tmp)
+            else:
+                shutil.copyfile(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        try:
+            os.replace(tmp, dst)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def put(self, src: str, key: str) -> None:
+        """
+        Put a file into the storage as an object
+        """
+        path = self.get_path(key)
+        # objects never share their inodes with files out of the storage
+        self.link(src, path, "copy" if self.link_mode == "copy"
+                  else "reflink")
+        self.update_index(path)
+
+    def update_index(self, path: str) -> None:
+        if not self.index:
+            return
+        import fcntl
+        line = json.dumps({"name": os.path.basename(path),
+                           "size": os.path.getsize(path)}) + "\n"
+        index_path = os.path.join(os.path.dirname(path), self.index_name)
+        with open(index_path, "a") as f:
+            # appends from different nodes are serialized by the lock
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_index(self, dirname: str) -> Dict[str, int]:
+        """
+        Sizes of the indexed objects in a directory keyed by names
+        """
+        sizes = {}
+        index_path = os.path.join(dirname, self.index_name)
+        if not os.path.isfile(index_path):
+            return sizes
+        with open(index_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # partial line of an interrupted write
+                    continue
+                sizes[record["name"]] = record["size"]
+        return sizes
+
+    def upload(self, key: str, path: str) -> None:
+        self.delay()
+        self.put(os.path.realpath(path), key)
+
+    def upload_stream(self, key: str, stream) -> None:
+        self.delay()
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%s.dflow_tmp" % (path, uuid.uuid4().hex)
+        try:
+            with open(tmp, "wb") as f:
+                shutil.copyfileobj(stream, f, 1 << 20)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.update_index(path)
+
+    def download(self, key: str, path: str) -> None:
+        self.delay()
+        self.link(self.get_file(key), path, self.link_mode)
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        self.delay()
+        with open(self.get_file(key), "rb") as f:
+            yield f
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        self.delay()
+        with open(self.get_file(key), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def walk(self, prefix: str):
+        """
+        Yield the directories covering the prefix with their paths relative
+        to the root and names of their files, only the deepest directory
+        covering the prefix is walked
+        """
+        dirname = prefix[:prefix.rfind("/") + 1]
+        top = self.get_path(dirname) if dirname else self.root
+        for dn, ds, fs in os.walk(top):
+            rel_path = os.path.relpath(dn, self.root).replace(os.sep, "/")
+            rel_path = "" if rel_path == "." else rel_path + "/"
+            if not rel_path.startswith(prefix) and \
+                    not prefix.startswith(rel_path):
+                ds.clear()
+                continue
+            yield dn, rel_path, [f for f in fs if f != self.index_name and
+                                 not f.endswith(".dflow_tmp")]
+
+    def scan(self, prefix: str) -> Tuple[str, str, List[str], List[str]]:
+        """
+        Scan the directory of the prefix without walking its subtree,
+        return its path, its path relative to the root, names of its files
+        and names of its subdirectories
+        """
+        rel_path = prefix[:prefix.rfind("/") + 1]
+        dn = self.get_path(rel_path) if rel_path else self.root
+        fs = []
+        ds = []
+        try:
+            with os.scandir(dn) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        ds.append(entry.name)
+                    elif entry.name != self.index_name and \
+                            not entry.name.endswith(".dflow_tmp"):
+                        fs.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return dn, rel_path, fs, ds
+
+    def list_dirs(self, prefix: str, recursive: bool = False):
+        """
+        Directories to be listed for the prefix with their paths relative to
+        the root and names of their files, and keys of the subdirectories
+        folded if not recursive
+        """
+        if recursive:
+            return list(self.walk(prefix)), []
+        dn, rel_path, fs, ds = self.scan(prefix)
+        return [(dn, rel_path, fs)], [rel_path + d + "/" for d in ds]
+
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        self.delay()
+        dirs, keys = self.list_dirs(prefix, recursive)
+        for _, rel_path, fs in dirs:
+            keys += [rel_path + f for f in fs]
+        return list_children(keys, prefix, recursive)
+
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        self.delay()
+        sizes = {}
+        dirs, keys = self.list_dirs(prefix, recursive)
+        for dn, rel_path, fs in dirs:
+            index = self.read_index(dn) if self.index else {}
+            for f in fs:
+                key = rel_path + f
+                keys.append(key)
+                if not key.startswith(prefix) or (
+                        not recursive and "/" in key[len(prefix):]):
+                    continue
+                # files written out of the client are not indexed
+                sizes[key] = index[f] if f in index else \
+                    os.path.getsize(os.path.join(dn, f))
+        return [{"key": key, "size": sizes[key]} if key in sizes
+                else {"key": key}
+                for key in list_children(keys, prefix, recursive)]
+
+    def copy(self, src: str, dst: str) -> None:
+        self.delay()
+        self.put(self.get_file(src), dst)
+
+    def get_md5(self, key: str) -> str:
+        self.delay()
+        return get_md5(self.get_file(key))
@@ -1,18 +1,24 @@
+import contextlib
 import os
 from typing import Optional
 
 import oss2
 
-from ..utils import StorageClient
+from ..utils import StorageClient, get_copy_ranges, parallel_transfer
 
 
 class OSSClient(StorageClient):
+    max_copy_size = 1 << 30
+    resumable = True
+
     def __init__(
             self,
             endpoint: Optional[str] = None,
             bucket_name: Optional[str] = None,
             access_key_id: Optional[str] = None,
             access_key_secret: Optional[str] = None,
+            part_size: Optional[int] = None,
+            max_concurrency: Optional[int] = None,
     ) -> None:
         if endpoint is None:
             endpoint = os.environ.get("OSS_ENDPOINT")
@@ -26,6 +32,8 @@ class OSSClient(StorageClient):
         self.bucket_name = bucket_name
         self.access_key_id = access_key_id
         self.access_key_secret = access_key_secret
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
         auth = oss2.Auth(access_key_id, access_key_secret)
         bucket = oss2.Bucket(auth, endpoint, bucket_name)
         self.bucket = bucket
@@ -33,11 +41,30 @@ class OSSClient(StorageClient):
     def upload(self, key, path):
         self.bucket.put_object_from_file(key, path)
 
+    def upload_stream(self, key, stream):
+        # chunked transfer encoding is used for data of unknown length
+        self.bucket.put_object(key, stream)
+
     def download(self, key, path):
         if os.path.dirname(path):
             os.makedirs(os.path.dirname(path), exist_ok=True)
         self.bucket.get_object_to_file(key, path)
 
+    @contextlib.contextmanager
+    def download_stream(self, key):
+        result = self.bucket.get_object(key)
+        try:
+            yield result
+        finally:
+            result.close()
+
+    def download_range(self, key, start, end):
+        result = self.bucket.get_object(key, byte_range=(start, end - 1))
+        try:
+            return result.read()
+        finally:
+            result.close()
+
     def list(self, prefix, recursive=False):
         keys = []
         if recursive:
@@ -66,8 +93,62 @@ class OSSClient(StorageClient):
                 marker = r.next_marker
         return keys
 
+    def list_with_meta(self, prefix, recursive=False):
+        if not recursive:
+            return super().list_with_meta(prefix, recursive)
+        objs = []
+        marker = ""
+        while True:
+            r = self.bucket.list_objects(prefix, marker=marker)
+            for obj in r.object_list:
+                if not obj.key.endswith("/"):
+                    objs.append({"key": obj.key, "etag": obj.etag.strip('"'),
+                                 "size": obj.size})
+            if not r.is_truncated:
+                break
+            marker = r.next_marker
+        return objs
+
     def copy(self, src, dst):
         self.bucket.copy_object(self.bucket_name, src, dst)
 
+    def create_multipart_upload(self, key):
+        return self.bucket.init_multipart_upload(key).upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        return self.bucket.upload_part(key, upload_id, part_number,
+                                       data).etag
+
+    def list_parts(self, key, upload_id):
+        parts = {}
+        for part in oss2.PartIterator(self.bucket, key, upload_id):
+            parts[part.part_number] = part.etag
+        return parts
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.bucket.complete_multipart_upload(key, upload_id, [
+            oss2.models.PartInfo(n, etag) for n, etag in parts])
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.bucket.abort_multipart_upload(key, upload_id)
+
+    def copy_multipart(self, src, dst, size, max_concurrency=None):
+        upload_id = self.create_multipart_upload(dst)
+
+        def copy_part(part_number, start, end):
+            r = self.bucket.upload_part_copy(
+                self.bucket_name, src, (start, end - 1), dst, upload_id,
+                part_number)
+            return part_number, r.etag
+
+        tasks = [{"part_number": i + 1, "start": start, "end": end}
+                 for i, (start, end) in enumerate(get_copy_ranges(size))]
+        try:
+            parts = parallel_transfer(copy_part, tasks, max_concurrency)
+            self.complete_multipart_upload(dst, upload_id, parts)
+        except Exception:
+            self.abort_multipart_upload(dst, upload_id)
+            raise
+
     def get_md5(self, key):
         return self.bucket.get_object_meta(key).etag
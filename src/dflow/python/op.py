@@ -13,7 +13,7 @@ from typeguard import check_type
 
 from ..argo_objects import ArgoObjectDict
 from ..config import config
-from ..utils import get_key, s3_config
+from ..utils import get_archive_codec, get_key, s3_config
 from .opio import (OPIO, Artifact, BigParameter, OPIOSign, Parameter,
                    type_to_str)
 
@@ -58,7 +58,7 @@ class OP(ABC):
         """
 
     def _get_s3_link(self, key):
-        if key[-4:] != ".tgz":
+        if get_archive_codec(key) is None:
             key += "/"
         encoded_key = base64.b64encode(key.encode()).decode()
         return "%s/buckets/%s/browse/%s" % (
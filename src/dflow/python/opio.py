@@ -6,8 +6,7 @@ from typing import Any, Dict, List, Optional, Set, Union
 import jsonpickle
 
 from ..common import S3Artifact
-from ..config import config
-from ..io import PVC
+from ..io import PVC, get_argo_archive_mode
 
 
 class nested_dict:
@@ -48,7 +47,9 @@ class Artifact:
         type: str, Path, Set[str], Set[Path], List[str], List[Path],
             Dict[str, str], Dict[str, Path], NestedDict[str] or
             NestedDict[Path]
-        archive: compress format of the artifact, None for no compression
+        archive: compress format of the artifact, None for no compression,
+            "auto" for the fastest gzip level, a default archive mode of
+            "zstd" or "lz4" falls back to "tar" for output artifacts
         save: place to store the output artifact instead of default storage,
             can be a list
         optional: optional input artifact or not
@@ -67,7 +68,7 @@ class Artifact:
     ) -> None:
         self.type = type
         if archive == "default":
-            archive = config["archive_mode"]
+            archive = get_argo_archive_mode()
         self.archive = archive
         self.save = save
         self.optional = optional
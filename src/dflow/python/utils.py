@@ -8,7 +8,8 @@ import jsonpickle
 
 from ..config import config
 from ..utils import (assemble_path_list, assemble_path_nested_dict,
-                     convert_dflow_list, copy_file, expand, flatten,
+                     convert_dflow_list, copy_file, empty_dir_tag, expand,
+                     extract_archive_file, extract_shards, flatten,
                      remove_empty_dir_tag)
 from .opio import Artifact, BigParameter, NestedDict, Parameter
 
@@ -52,7 +53,9 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
         path_dict = []
         for i in range(n_parts):
             art_path = '%s/inputs/artifacts/dflow_%s_%s' % (data_root, name, i)
+            extract_archive_file(art_path)
             remove_empty_dir_tag(art_path)
+            extract_shards(art_path)
             pl = assemble_path_list(art_path)
             if require_dict:
                 pd = assemble_path_nested_dict(art_path)
@@ -71,7 +74,9 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
         path_dict = {}
         for i in keys_of_parts:
             art_path = '%s/inputs/artifacts/dflow_%s_%s' % (data_root, name, i)
+            extract_archive_file(art_path)
             remove_empty_dir_tag(art_path)
+            extract_shards(art_path)
             pl = assemble_path_list(art_path)
             pd = assemble_path_nested_dict(art_path)
             if slices is not None:
@@ -88,11 +93,13 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
     else:
         art_path = '%s/inputs/artifacts/%s' % (data_root, name) \
             if path is None else path
+        extract_archive_file(art_path)
         if sub_path is not None:
             art_path = os.path.join(art_path, sub_path)
         if not os.path.exists(art_path):  # for optional artifact
             return None
         remove_empty_dir_tag(art_path)
+        extract_shards(art_path)
         path_list = assemble_path_list(art_path)
         if require_dict:
             path_dict = assemble_path_nested_dict(art_path)
@@ -291,7 +298,7 @@ def handle_empty_dir(path):
     # empty dirs
     for dn, ds, fs in os.walk(path, followlinks=True):
         if len(ds) == 0 and len(fs) == 0:
-            with open(os.path.join(dn, ".empty_dir"), "w"):
+            with open(os.path.join(dn, empty_dir_tag), "w"):
                 pass
 
 
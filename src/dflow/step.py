@@ -18,8 +18,8 @@ from .op_template import (OPTemplate, PythonScriptOPTemplate, ScriptOPTemplate,
 from .python import Slices
 from .resource import Resource
 from .util_ops import CheckNumSuccess, CheckSuccessRatio, InitArtifactForSlices
-from .utils import (catalog_of_artifact, flatten, merge_dir, randstr,
-                    upload_artifact)
+from .utils import (catalog_of_artifact, flatten, is_concat_artifact,
+                    merge_dir, parts_of_artifact, randstr, upload_artifact)
 
 try:
     from argo.workflows.client import (V1alpha1Arguments, V1alpha1ContinueOn,
@@ -316,7 +316,9 @@ class Step:
             if len(hit) > 0:
                 self.set_artifacts({"dflow_python_packages": hit[0][1]})
             else:
-                artifact = upload_artifact(self.template.python_packages)
+                # extracted by Argo before the Python OP runs
+                artifact = upload_artifact(self.template.python_packages,
+                                           archive="tar")
                 self.set_artifacts({"dflow_python_packages": artifact})
                 uploaded_python_packages.append(
                     (self.template.python_packages, artifact))
@@ -1172,6 +1174,16 @@ class Step:
 
     def set_artifacts(self, artifacts):
         for k, v in artifacts.items():
+            if isinstance(v, S3Artifact) and is_concat_artifact(v):
+                if v.slice is not None:
+                    raise RuntimeError(
+                        "Slicing a concatenated artifact %s is not "
+                        "supported for inputs of steps" % v.key)
+                # a concatenated artifact is passed as the list of its parts,
+                # which are read from the storage when the step is rendered
+                # if not known yet
+                if getattr(v, "parts", None) is not None:
+                    v = [S3Artifact(key=part) for part in v.parts]
             if v is None:
                 del self.inputs.artifacts[k]
                 self.template.inputs.artifacts[k].optional = True
@@ -1379,6 +1391,13 @@ class Step:
         elif context is not None:
             self.template = context.render(self.template)
 
+    def resolve_concat_artifacts(self):
+        for k, art in list(self.inputs.artifacts.items()):
+            if isinstance(art.source, S3Artifact) and \
+                    is_concat_artifact(art.source):
+                self.set_artifacts({k: [S3Artifact(key=part) for part in
+                                        parts_of_artifact(art.source)]})
+
     def prepare_argo_arguments(self, context=None):
         if isinstance(self.with_param, ArgoVar):
             self.with_param = "{{=%s}}" % self.with_param.expr
@@ -1386,6 +1405,7 @@ class Step:
                                                             str):
             self.with_param = jsonpickle.dumps(list(self.with_param))
 
+        self.resolve_concat_artifacts()
         self.render_by_executor(context)
 
         self.argo_parameters = []
@@ -1527,7 +1547,8 @@ class Step:
                 elif isinstance(art.source, HTTPArtifact) and not hasattr(
                         art.source, "local_path"):
                     path = os.path.abspath("download/%s" % randstr())
-                    art.source.local_path = art.source.download(path=path)
+                    art.source.local_path = art.source.download(
+                        path=path, cache_dir=get_http_cache_dir())
                 if not hasattr(art.source, "local_path") and art.optional:
                     continue
                 steps.inputs.artifacts[name].local_path = art.source.local_path
@@ -1757,7 +1778,8 @@ class Step:
             elif isinstance(art.source, HTTPArtifact) and not hasattr(
                     art.source, "local_path"):
                 path = os.path.abspath("download/%s" % randstr())
-                art.source.local_path = art.source.download(path=path)
+                art.source.local_path = art.source.download(
+                    path=path, cache_dir=get_http_cache_dir())
             if isinstance(
                 art.source, (InputArtifact, OutputArtifact, LocalArtifact,
                              S3Artifact, HTTPArtifact)):
@@ -2143,6 +2165,11 @@ def render_script(script, parameters, workflow_id=None, step_id=None):
     return script
 
 
+def get_http_cache_dir():
+    # HTTP artifacts are cached for all steps of a local workflow run
+    return s3_config["cache_dir"] or os.path.abspath("download/.http_cache")
+
+
 def backup(path):
     import os
     import shutil
@@ -1,7 +1,11 @@
 import abc
+import asyncio
 import contextlib
 import hashlib
+import heapq
 import inspect
+import io
+import json
 import logging
 import os
 import pkgutil
@@ -14,23 +18,235 @@ import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import uuid
+import zlib
 from abc import ABC
-from functools import partial
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial, wraps
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple, Union
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
 
 import jsonpickle
 
 from .common import LocalArtifact, S3Artifact
 from .config import config, s3_config
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 try:
     from minio import Minio
     from minio.api import CopySource
 except Exception:
     pass
 
+storage_client_cache = {}
+storage_client_cache_lock = threading.Lock()
+object_caches = {}
+object_cache_lock = threading.Lock()
+# catalogs keyed by the identities of storages and the keys of artifacts
+catalog_cache = {}
+catalog_cache_lock = threading.Lock()
+
+
+# upper bounds in seconds of the buckets of request latency histograms
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+class TransferMetrics:
+    """
+    Metrics of storage requests by operation (counts of requests, objects,
+    bytes, errors and retries, total seconds and a latency histogram) and
+    of storage helper calls (counts and total seconds)
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.helpers = {}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.operations = {}
+            self.helpers = {}
+
+    def get_operation(self, op: str) -> dict:
+        if op not in self.operations:
+            self.operations[op] = {
+                "requests": 0, "objects": 0, "bytes": 0, "errors": 0,
+                "retries": 0, "seconds": 0.0,
+                "latency_buckets": [0] * (len(latency_buckets) + 1)}
+        return self.operations[op]
+
+    def record(self, op: str, latency: float, nbytes: int = 0,
+               objects: int = 0, error: bool = False) -> None:
+        i = next((i for i, b in enumerate(latency_buckets) if latency <= b),
+                 len(latency_buckets))
+        with self.lock:
+            m = self.get_operation(op)
+            m["requests"] += 1
+            m["objects"] += objects
+            m["bytes"] += nbytes
+            m["errors"] += int(error)
+            m["seconds"] += latency
+            m["latency_buckets"][i] += 1
+
+    def record_retry(self, op: str) -> None:
+        with self.lock:
+            self.get_operation(op)["retries"] += 1
+
+    def record_helper(self, name: str, seconds: float) -> None:
+        with self.lock:
+            if name not in self.helpers:
+                self.helpers[name] = {"calls": 0, "seconds": 0.0}
+            self.helpers[name]["calls"] += 1
+            self.helpers[name]["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the metrics, with the throughput in bytes per second of the
+        time spent in requests of each operation
+        """
+        with self.lock:
+            operations = {op: dict(m, latency_buckets=list(
+                m["latency_buckets"])) for op, m in self.operations.items()}
+            helpers = {name: dict(m) for name, m in self.helpers.items()}
+        for m in operations.values():
+            m["throughput"] = m["bytes"] / m["seconds"] if m["seconds"] \
+                else 0.0
+        return {"operations": operations, "helpers": helpers}
+
+
+transfer_metrics = TransferMetrics()
+metrics_client_cache = {}
+metrics_local = threading.local()
+
+
+def get_transfer_metrics() -> dict:
+    """
+    Get the metrics of storage requests and helpers of the current process
+    recorded since config["transfer_metrics"] is set
+    """
+    return transfer_metrics.snapshot()
+
+
+def reset_transfer_metrics() -> None:
+    transfer_metrics.reset()
+
+
+def latency_quantile(buckets: List[int], q: float) -> float:
+    """
+    Upper bound of the histogram bucket of a quantile of latencies
+    """
+    total = sum(buckets)
+    if total == 0:
+        return 0.0
+    count = 0
+    for i, n in enumerate(buckets):
+        count += n
+        if count >= q * total:
+            return latency_buckets[i] if i < len(latency_buckets) else \
+                float("inf")
+    return float("inf")
+
+
+def format_prometheus_metrics(metrics: dict) -> str:
+    """
+    Format transfer metrics in Prometheus text exposition format
+    """
+    lines = []
+    for name, field in [("requests", "requests"), ("objects", "objects"),
+                        ("bytes", "bytes"), ("errors", "errors"),
+                        ("retries", "retries")]:
+        lines.append("# TYPE dflow_storage_%s_total counter" % name)
+        for op, m in sorted(metrics["operations"].items()):
+            lines.append('dflow_storage_%s_total{operation="%s"} %s' % (
+                name, op, m[field]))
+    lines.append("# TYPE dflow_storage_request_duration_seconds histogram")
+    for op, m in sorted(metrics["operations"].items()):
+        count = 0
+        for b, n in zip(list(latency_buckets) + ["+Inf"],
+                        m["latency_buckets"]):
+            count += n
+            lines.append('dflow_storage_request_duration_seconds_bucket'
+                         '{operation="%s",le="%s"} %s' % (op, b, count))
+        lines.append('dflow_storage_request_duration_seconds_sum'
+                     '{operation="%s"} %s' % (op, m["seconds"]))
+        lines.append('dflow_storage_request_duration_seconds_count'
+                     '{operation="%s"} %s' % (op, m["requests"]))
+    lines.append("# TYPE dflow_storage_helper_calls_total counter")
+    for name, m in sorted(metrics["helpers"].items()):
+        lines.append('dflow_storage_helper_calls_total{helper="%s"} %s' % (
+            name, m["calls"]))
+    lines.append("# TYPE dflow_storage_helper_seconds_total counter")
+    for name, m in sorted(metrics["helpers"].items()):
+        lines.append('dflow_storage_helper_seconds_total{helper="%s"} %s' % (
+            name, m["seconds"]))
+    return "\n".join(lines) + "\n"
+
+
+def emit_transfer_metrics() -> None:
+    """
+    Send the transfer metrics to the sink config["transfer_metrics"],
+    "logging" for a summary in the log, "prometheus:<path>" for a text file
+    collected by the node exporter, or a function called with the metrics
+    """
+    sink = config["transfer_metrics"]
+    metrics = get_transfer_metrics()
+    try:
+        if callable(sink):
+            sink(metrics)
+        elif sink == "logging":
+            for op, m in sorted(metrics["operations"].items()):
+                logging.info(
+                    "transfer metrics: %s: %s requests, %s objects, %s "
+                    "bytes, %.2f MB/s, %s errors, %s retries, p50 %ss, p99 "
+                    "%ss" % (op, m["requests"], m["objects"], m["bytes"],
+                             m["throughput"] / 1e6, m["errors"],
+                             m["retries"],
+                             latency_quantile(m["latency_buckets"], 0.5),
+                             latency_quantile(m["latency_buckets"], 0.99)))
+        elif isinstance(sink, str) and sink.startswith("prometheus:"):
+            path = sink[len("prometheus:"):]
+            tmp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+            with open(tmp, "w") as f:
+                f.write(format_prometheus_metrics(metrics))
+            # the collector never reads a partial file
+            os.replace(tmp, path)
+        else:
+            raise RuntimeError("Transfer metrics sink %s not supported" %
+                               sink)
+    except Exception as e:
+        logging.warning("Failed to emit transfer metrics: %s" % e)
+
+
+def instrument_helper(func):
+    """
+    Record the calls of a storage helper if config["transfer_metrics"] is
+    set, the metrics are emitted when the outermost helper returns
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if config["transfer_metrics"] is None:
+            return func(*args, **kwargs)
+        depth = getattr(metrics_local, "depth", 0)
+        metrics_local.depth = depth + 1
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics_local.depth = depth
+            transfer_metrics.record_helper(func.__name__, time.time() - start)
+            if depth == 0:
+                emit_transfer_metrics()
+    return wrapper
+
 
 def get_key(artifact, raise_error=True):
     if hasattr(artifact, "s3") and hasattr(artifact.s3, "key"):
@@ -62,14 +278,17 @@ def set_key(artifact, key):
         artifact.key = key
 
 
+@instrument_helper
 def download_artifact(
         artifact,
         extract: bool = True,
         sub_path: Optional[str] = None,
         slice: Optional[int] = None,
+        slices: Optional[List[int]] = None,
         path: os.PathLike = ".",
         debug_download: bool = False,
         remove_catalog: bool = True,
+        stream: bool = True,
         **kwargs,
 ) -> List[str]:
     """
@@ -80,6 +299,8 @@ def download_artifact(
         extract: extract files if the artifact is compressed
         sub_path: download a subdir of an artifact
         slice: download a slice of an artifact
+        slices: download multiple slices of an artifact concurrently,
+            a list of paths is returned
         path: local path
         endpoint: endpoint for Minio
         access_key: access key for Minio
@@ -87,48 +308,195 @@ def download_artifact(
         secure: secure or not for Minio
         bucket_name: bucket name for Minio
         skip_exists: skip files with the same MD5
+        stream: extract a compressed artifact while downloading it instead
+            of saving the archive to disk first
+        bandwidth_limit: bandwidth limit in bytes per second of this call
+        priority: priority of the transfers under bandwidth limits, higher
+            first
     """
+    kwargs = resolve_bandwidth_limit(kwargs)
     if config["mode"] == "debug" and not debug_download:
         linktree(artifact.local_path, path)
         return assemble_path_list(path, remove=remove_catalog)
 
+    parts = parts_of_artifact(artifact, **kwargs)
+    if parts is not None:
+        return download_concat_artifact(
+            parts, extract=extract, sub_path=sub_path, slice=slice,
+            slices=slices, path=path, remove_catalog=remove_catalog,
+            stream=stream, **kwargs)
+
     key = get_key(artifact)
 
+    if slices is not None:
+        path_list = path_list_of_artifact(artifact, **kwargs)
+        sub_paths = [path_list[i] for i in slices]
+        download_sub_paths(key, [p for p in sub_paths if p is not None],
+                           path, **kwargs)
+        return [os.path.join(path, p) if p is not None else None
+                for p in sub_paths]
+
     if slice is not None:
-        sub_path = path_list_of_artifact(artifact)[slice]
+        sub_path = path_list_of_artifact(artifact, **kwargs)[slice]
 
     if sub_path is not None:
-        key = key + "/" + sub_path
-        path = os.path.join(path, os.path.dirname(sub_path))
-        download_s3(key=key, recursive=True, path=path, keep_dir=True,
-                    **kwargs)
-        path = os.path.join(path, os.path.basename(sub_path))
-        remove_empty_dir_tag(path)
-        return path
+        download_sub_paths(key, [sub_path], path, **kwargs)
+        return os.path.join(path, sub_path)
 
-    path = download_s3(key=key, recursive=True, path=path, **kwargs)
-    if key[-4:] == ".tgz" and extract:
-        path = os.path.join(path, os.path.basename(key))
-        tf = tarfile.open(path, "r:gz")
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tf.extractall(tmpdir)
-            tf.close()
+    codec = get_archive_codec(key)
+    # go through the object cache instead of streaming if it is enabled
+    if codec is not None and extract and stream and \
+            get_object_cache() is None:
+        os.makedirs(path, exist_ok=True)
+        client = get_storage_client(**kwargs)
+        # extract into a staging directory under the target path so that
+        # files are only renamed afterwards
+        staging = os.path.join(path, ".dflow_extract_%s" % uuid.uuid4())
+        try:
+            with client.download_stream(key=key) as f:
+                extract_tar(f, staging, codec)
+            merge_extracted_dir(staging, path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return assemble_path_list(path, remove=remove_catalog)
 
-            os.remove(path)
-            path = os.path.dirname(path)
+    path = download_s3(key=key, recursive=True, path=path,
+                       keep_empty_dir_tag=False, **kwargs)
+    if codec is not None and extract:
+        extract_downloaded_archive(path, key)
+    elif codec is None:
+        download_blobs(path, **kwargs)
+        extract_shards(path, kwargs.get("max_concurrency"))
 
-            # if the artifact contains only one directory, merge the
-            # directory with the target directory
-            ld = os.listdir(tmpdir)
-            if len(ld) == 1 and os.path.isdir(os.path.join(tmpdir, ld[0])):
-                merge_dir(os.path.join(tmpdir, ld[0]), path)
-            else:
-                merge_dir(tmpdir, path)
+    return assemble_path_list(path, remove=remove_catalog)
+
+
+def download_concat_artifact(
+        parts: List[str],
+        sub_path: Optional[str] = None,
+        slice: Optional[int] = None,
+        slices: Optional[List[int]] = None,
+        path: os.PathLike = ".",
+        remove_catalog: bool = True,
+        **kwargs,
+) -> List[str]:
+    """
+    Download a concatenated artifact by downloading its parts into the same
+    path and writing the concatenated catalog
+    """
+    catalog = concat_catalogs(parts, **kwargs)
+    if slices is not None or slice is not None:
+        catalog.sort(key=lambda item: item["order"])
+        items = [catalog[i] for i in (slices if slices is not None
+                                      else [slice])]
+        res = parallel_transfer(
+            lambda item: download_artifact(
+                S3Artifact(key=item["dflow_key"]),
+                sub_path=item["dflow_list_item"], path=path, **kwargs),
+            [{"item": item} for item in items])
+        return res if slices is not None else res[0]
+
+    if sub_path is not None:
+        item = find_concat_item(catalog, sub_path, parts)
+        return download_artifact(S3Artifact(key=item["dflow_key"]),
+                                 sub_path=sub_path, path=path, **kwargs)
 
-    remove_empty_dir_tag(path)
+    for part in parts:
+        download_artifact(S3Artifact(key=part), path=path,
+                          remove_catalog=True, **kwargs)
+    write_concat_catalog(path, catalog)
     return assemble_path_list(path, remove=remove_catalog)
 
 
+def find_concat_item(catalog: List[dict], sub_path: str,
+                     parts: List[str]) -> dict:
+    """
+    The item of a concatenated catalog containing a sub path
+    """
+    for item in catalog:
+        p = item["dflow_list_item"]
+        if p is not None and (sub_path == p or sub_path.startswith(
+                p.rstrip("/") + "/")):
+            return item
+    raise FileNotFoundError("%s not found in artifacts %s" % (sub_path,
+                                                              parts))
+
+
+def write_concat_catalog(path: os.PathLike, catalog: List[dict]) -> None:
+    """
+    Write a concatenated catalog into the downloaded parts, whose own
+    catalogs are removed
+    """
+    if catalog:
+        write_catalog(path, str(uuid.uuid4()), [
+            {k: v for k, v in item.items() if k != "dflow_key"}
+            for item in catalog])
+
+
+def download_sub_paths(
+        key: str,
+        sub_paths: List[str],
+        path: os.PathLike = ".",
+        skip_exists: bool = False,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> None:
+    """
+    Download sub paths of an artifact concurrently, by ranged reads for an
+    indexed archive
+    """
+    client = get_storage_client(**kwargs)
+    if get_archive_codec(key) == "tar":
+        index = load_archive_index(client, key)
+        if index is not None:
+            download_indexed_members(client, key, index, sub_paths, path,
+                                     max_concurrency)
+            return
+    else:
+        catalog = catalog_of_artifact(S3Artifact(key=key), **kwargs)
+        if any(item.get("dflow_shard") for item in catalog):
+            download_shard_members(client, key, catalog, sub_paths, path,
+                                   max_concurrency)
+            return
+
+    tasks = []
+
+    def list_tasks(sub_path):
+        tasks.extend(list_download_tasks(
+            client, key + "/" + sub_path, os.path.join(
+                path, os.path.dirname(sub_path)), True, skip_exists,
+            keep_empty_dir_tag=False))
+    parallel_transfer(list_tasks, [{"sub_path": p} for p in sub_paths],
+                      max_concurrency)
+    parallel_transfer(download_s3_object, tasks, max_concurrency,
+                      progress=len(sub_paths) > 1)
+
+
+def extract_downloaded_archive(path: os.PathLike, key: str) -> None:
+    """
+    Extract the archive of an artifact downloaded into a path in place
+    """
+    archive_path = os.path.join(path, os.path.basename(key))
+    staging = os.path.join(path, ".dflow_extract_%s" % uuid.uuid4())
+    try:
+        with open(archive_path, "rb") as f:
+            extract_tar(f, staging, get_archive_codec(key))
+        os.remove(archive_path)
+        merge_extracted_dir(staging, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def merge_extracted_dir(src, dst):
+    # if the artifact contains only one directory, merge the directory with
+    # the target directory
+    ld = os.listdir(src)
+    if len(ld) == 1 and os.path.isdir(os.path.join(src, ld[0])):
+        merge_dir(os.path.join(src, ld[0]), dst)
+    else:
+        merge_dir(src, dst)
+
+
 def flatten(d: Union[list, dict]) -> dict:
     def handle(obj, prefix):
         if isinstance(obj, dict):
@@ -182,12 +550,17 @@ def expand(d: dict) -> Union[list, dict]:
     return exp
 
 
+@instrument_helper
 def upload_artifact(
         path: Union[os.PathLike, List[os.PathLike], Set[os.PathLike],
                     Dict[str, os.PathLike], list, dict],
         archive: str = "default",
         namespace: Optional[str] = None,
         dataset_name: Optional[str] = None,
+        content_addressed: bool = False,
+        materialize: bool = False,
+        shards: Optional[int] = None,
+        resume_key: Optional[str] = None,
         **kwargs,
 ) -> S3Artifact:
     """
@@ -195,50 +568,61 @@ def upload_artifact(
 
     Args:
         path: local path
-        archive: compress format of the artifact, None for no compression
+        archive: compress format of the artifact, "tar" (gzip), "zstd",
+            "lz4", "indexed" (gzip with an index of entries for downloading
+            sub paths or slices by ranged reads), "auto" (chosen by
+            sampling the content) or None for no compression, "zstd" and
+            "lz4" artifacts are extracted in the pods of Python OPs only
+        content_addressed: upload files as content-addressed blobs and skip
+            those already in the storage, implies no compression
+        materialize: copy blobs to the artifact on server side so that it
+            can be used in workflows, otherwise (by default) only a catalog
+            referring to blobs is saved which can be downloaded by
+            download_artifact
+        shards: group the paths into this number of archives balanced by
+            size and upload them concurrently, the shard of each path is
+            recorded in the catalog so that slices are downloaded from
+            their shards only
+        resume_key: a key identifying the upload across runs, the artifact
+            is uploaded to the same storage key in every run with the key
+            so that large files interrupted in a run resume from the parts
+            uploaded, archived artifacts are streamed and not resumable
         endpoint: endpoint for Minio
         access_key: access key for Minio
         secret_key: secret key for Minio
         secure: secure or not for Minio
         bucket_name: bucket name for Minio
+        bandwidth_limit: bandwidth limit in bytes per second of this call
+        priority: priority of the transfers under bandwidth limits, higher
+            first
     """
+    kwargs = resolve_bandwidth_limit(kwargs)
     if archive == "default":
         archive = config["archive_mode"]
+    if config["mode"] == "debug" or content_addressed:
+        shards = None
     cwd = os.getcwd()
     with tempfile.TemporaryDirectory() as tmpdir:
-        if isinstance(path, dict):
-            pairs = flatten(path).items()
-        elif isinstance(path, (list, set)):
-            pairs = enumerate(path)
-        else:
-            pairs = [(0, path)]
-        path_list = []
-        for i, p in pairs:
-            logging.debug("upload artifact: handle path: %s" % p)
-            if p is None:
-                continue
-            if not os.path.exists(p):
-                raise RuntimeError("File or directory %s not found" % p)
-            abspath = os.path.abspath(p)
-            # subpath of current dir
-            if abspath.find(cwd + "/") == 0 or abspath.find(cwd + "\\") == 0:
-                relpath = abspath[len(cwd)+1:]
-            else:
-                if abspath[0] == "/":
-                    relpath = abspath[1:]
-                else:
-                    # For Windows
-                    relpath = abspath[abspath.find(":")+2:]
-            target = os.path.join(tmpdir, relpath)
-            os.makedirs(os.path.dirname(target), exist_ok=True)
-            os.symlink(abspath, target)
-            path_list.append({"dflow_list_item": relpath.replace("\\", "/"),
-                              "order": i})
-
-        catalog_dir = os.path.join(tmpdir, config["catalog_dir_name"])
-        os.makedirs(catalog_dir, exist_ok=True)
-        with open(os.path.join(catalog_dir, str(uuid.uuid4())), "w") as f:
-            f.write(jsonpickle.dumps({"path_list": path_list}))
+        if resume_key is not None and config["mode"] != "debug":
+            # the name of the staging directory is part of the storage key
+            tmpdir = os.path.join(tmpdir, "upload_%s" % uuid.uuid5(
+                uuid.NAMESPACE_URL, resume_key).hex)
+            os.makedirs(tmpdir)
+        pairs = list_artifact_paths(path)
+        if archive == "auto":
+            archive = choose_archive([p for _, p in pairs if p is not None])
+            logging.info("upload artifact: choose archive %s" % archive)
+        # a run with the same resume key overwrites the catalog fragment
+        catalog_name = str(uuid.uuid4()) if resume_key is None else \
+            str(uuid.uuid5(uuid.NAMESPACE_URL, resume_key))
+        # shards are archived from the paths directly
+        path_list = stage_artifact(pairs, tmpdir, cwd,
+                                   link=shards is None)
+
+        if shards is not None:
+            key = upload_shards(path_list, shards, archive, **kwargs)
+
+        catalog_dir = write_catalog(tmpdir, catalog_name, path_list)
 
         if config["mode"] == "debug":
             os.makedirs("upload", exist_ok=True)
@@ -247,17 +631,36 @@ def upload_artifact(
             os.makedirs(tmpdir, exist_ok=True)
             return LocalArtifact(local_path=os.path.abspath(resdir))
 
-        if archive == "tar":
-            os.chdir(os.path.dirname(tmpdir))
-            tf = tarfile.open(os.path.basename(tmpdir) +
-                              ".tgz", "w:gz", dereference=True)
-            tf.add(os.path.basename(tmpdir))
-            tf.close()
-            os.chdir(cwd)
-            key = upload_s3(path=tmpdir + ".tgz", **kwargs)
-            os.remove(tmpdir + ".tgz")
+        if shards is not None:
+            upload_s3(path=catalog_dir, prefix=key, **kwargs)
+        elif content_addressed:
+            key = upload_s3(path=tmpdir, content_addressed=True,
+                            materialize=materialize, resume_key=resume_key,
+                            **kwargs)
+        elif archive is None:
+            key = upload_s3(path=tmpdir, resume_key=resume_key, **kwargs)
+        elif archive == "indexed":
+            index = {"path_list": path_list}
+            key = upload_s3_stream(
+                partial(write_indexed_tar, tmpdir, index=index),
+                os.path.basename(tmpdir) + archive_suffixes[archive],
+                resume_key=resume_key, **kwargs)
+            with open(tmpdir + ".index", "w") as f:
+                f.write(json.dumps(index))
+            try:
+                get_storage_client(**kwargs).upload(
+                    key=get_archive_index_key(key), path=tmpdir + ".index")
+            finally:
+                os.remove(tmpdir + ".index")
+        elif archive in archive_suffixes:
+            # compress and upload at the same time without a temporary
+            # archive on disk
+            key = upload_s3_stream(
+                partial(write_tar, tmpdir, codec=archive),
+                os.path.basename(tmpdir) + archive_suffixes[archive],
+                resume_key=resume_key, **kwargs)
         else:
-            key = upload_s3(path=tmpdir, **kwargs)
+            raise RuntimeError("Archive type %s not supported" % archive)
 
     logging.debug("upload artifact: finished")
 
@@ -272,7 +675,267 @@ def upload_artifact(
     return S3Artifact(key=key, path_list=path_list, urn=urn)
 
 
-def copy_artifact(src, dst, sort=False) -> S3Artifact:
+def list_artifact_paths(path) -> List[tuple]:
+    """
+    Pairs of orders and paths of the path argument of upload_artifact
+    """
+    if isinstance(path, dict):
+        return list(flatten(path).items())
+    elif isinstance(path, (list, set)):
+        return list(enumerate(path))
+    else:
+        return [(0, path)]
+
+
+def stage_artifact(
+        pairs: List[tuple],
+        tmpdir: os.PathLike,
+        cwd: str,
+        link: bool = True,
+) -> List[dict]:
+    """
+    Link the paths of an artifact into a staging directory by their paths
+    relative to cwd, return the catalog items
+
+    Args:
+        pairs: orders and paths of the artifact
+        tmpdir: staging directory
+        cwd: current directory
+        link: link the paths or record their absolute paths in the items
+            as "dflow_path"
+    """
+    path_list = []
+    for i, p in pairs:
+        logging.debug("upload artifact: handle path: %s" % p)
+        if p is None:
+            continue
+        if not os.path.exists(p):
+            raise RuntimeError("File or directory %s not found" % p)
+        abspath = os.path.abspath(p)
+        # subpath of current dir
+        if abspath.find(cwd + "/") == 0 or abspath.find(cwd + "\\") == 0:
+            relpath = abspath[len(cwd)+1:]
+        else:
+            if abspath[0] == "/":
+                relpath = abspath[1:]
+            else:
+                # For Windows
+                relpath = abspath[abspath.find(":")+2:]
+        path_list.append({"dflow_list_item": relpath.replace("\\", "/"),
+                          "order": i})
+        if not link:
+            path_list[-1]["dflow_path"] = abspath
+            continue
+        target = os.path.join(tmpdir, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.symlink(abspath, target)
+    return path_list
+
+
+def write_catalog(path: os.PathLike, name: str,
+                  path_list: List[dict]) -> str:
+    """
+    Write a catalog fragment under a directory, return the catalog
+    directory
+    """
+    catalog_dir = os.path.join(path, config["catalog_dir_name"])
+    os.makedirs(catalog_dir, exist_ok=True)
+    with open(os.path.join(catalog_dir, name), "w") as f:
+        f.write(jsonpickle.dumps({"path_list": path_list}))
+    return catalog_dir
+
+
+# suffixes of files whose content is compressed already
+incompressible_suffixes = (
+    ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".zip", ".7z", ".rar",
+    ".npz", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4",
+    ".mkv", ".avi", ".mov", ".pdf",
+)
+
+
+def choose_archive(
+        paths: List[os.PathLike],
+        max_files: int = 1024,
+        sample_files: int = 64,
+        sample_size: int = 64 * 1024,
+) -> Optional[str]:
+    """
+    Choose the archive mode of paths by sampling their files, files with
+    compressed suffixes are regarded as incompressible and the others are
+    estimated by compressing their heads at the fastest level
+
+    Returns:
+        None if the content is mostly incompressible, otherwise "tar", zstd
+        and lz4 are never chosen as the pods may not decode them
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+        for dn, ds, fs in os.walk(path, followlinks=True):
+            files += [os.path.join(dn, f) for f in fs]
+            if len(files) >= max_files:
+                break
+        if len(files) >= max_files:
+            break
+    step = max(1, len(files) // sample_files)
+    total = 0
+    compressed = 0
+    for f in files[::step]:
+        try:
+            size = os.path.getsize(f)
+            if size == 0:
+                continue
+            if f.lower().endswith(incompressible_suffixes):
+                ratio = 1.0
+            else:
+                with open(f, "rb") as fd:
+                    data = fd.read(sample_size)
+                ratio = len(zlib.compress(data, 1)) / len(data)
+        except OSError:
+            continue
+        total += size
+        compressed += size * ratio
+    if total == 0:
+        return "tar"
+    if compressed / total >= 0.9:
+        return None
+    return "tar"
+
+
+def get_path_size(path: os.PathLike) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for dn, ds, fs in os.walk(path, followlinks=True):
+        for f in fs:
+            try:
+                size += os.path.getsize(os.path.join(dn, f))
+            except OSError:
+                pass
+    return size
+
+
+def upload_shards(
+        path_list: List[dict],
+        shards: int,
+        archive: Optional[str] = "tar",
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> str:
+    """
+    Group the paths of catalog items into balanced shards by size, archive
+    and upload the shards concurrently, the shard of each item is recorded
+    as "dflow_shard" in the item
+    """
+    codec = archive if archive in ["zstd", "lz4"] else "tar"
+    sizes = parallel_transfer(get_path_size, [
+        {"path": item["dflow_path"]} for item in path_list], max_concurrency)
+    # assign the largest paths first to the least loaded shard
+    heap = [(0, i) for i in range(max(1, min(shards, len(path_list))))]
+    members = [[] for _ in heap]
+    for size, item in sorted(zip(sizes, path_list), key=lambda x: -x[0]):
+        load, i = heapq.heappop(heap)
+        members[i].append(item)
+        heapq.heappush(heap, (load + size, i))
+
+    client = get_storage_client(**kwargs)
+    key = resolve_upload_key(client, "dflow_shards_%s" % uuid.uuid4().hex,
+                             None, None)
+    tasks = []
+    for i, items in enumerate(members):
+        if not items:
+            continue
+        name = "shard_%05d%s" % (i, archive_suffixes[codec])
+        for item in items:
+            item["dflow_shard"] = name
+        tasks.append({"write": partial(write_shard, [(
+            item.pop("dflow_path"), item["dflow_list_item"]) for item in
+            sorted(items, key=lambda x: x["dflow_list_item"])], codec=codec),
+            "name": name, "key": key + "/" + name})
+    parallel_transfer(partial(upload_s3_stream, **kwargs), tasks,
+                      max_concurrency, progress=True)
+    return key
+
+
+def write_shard(members: List[Tuple[str, str]], fileobj,
+                codec: str = "tar") -> None:
+    with compress_stream(fileobj, codec) as f:
+        with tarfile.open(fileobj=f, mode="w|", dereference=True) as tf:
+            for path, arcname in members:
+                tf.add(path, arcname=arcname)
+
+
+def extract_shards(
+        path: os.PathLike,
+        max_concurrency: Optional[int] = None,
+) -> None:
+    """
+    Extract the downloaded shards of a sharded artifact in place according
+    to its catalog
+    """
+    catalog_dir = os.path.join(path, config["catalog_dir_name"])
+    if not os.path.isdir(catalog_dir):
+        return
+    shards = set(item.get("dflow_shard") for item in read_catalog_dir(
+        catalog_dir)) - {None}
+
+    def extract(shard):
+        shard_path = os.path.join(path, shard)
+        if not os.path.isfile(shard_path):
+            return
+        with open(shard_path, "rb") as f:
+            extract_tar(f, path, get_archive_codec(shard))
+        os.remove(shard_path)
+    parallel_transfer(extract, [{"shard": s} for s in sorted(shards)],
+                      max_concurrency)
+
+
+def shards_of_sub_paths(key: str, catalog: List[dict],
+                        sub_paths: List[str]) -> set:
+    """
+    Names of the shards of a sharded artifact containing sub paths
+    """
+    shards = set()
+    for sub_path in sub_paths:
+        found = False
+        for item in catalog:
+            p = item["dflow_list_item"]
+            if p is not None and item.get("dflow_shard") and (
+                    p == sub_path or p.startswith(sub_path + "/") or
+                    sub_path.startswith(p + "/")):
+                shards.add(item["dflow_shard"])
+                found = True
+        if not found:
+            raise FileNotFoundError("%s not found in artifact %s" % (
+                sub_path, key))
+    return shards
+
+
+def download_shard_members(
+        client: "StorageClient",
+        key: str,
+        catalog: List[dict],
+        sub_paths: List[str],
+        path: os.PathLike,
+        max_concurrency: Optional[int] = None,
+) -> None:
+    """
+    Download sub paths of a sharded artifact by streaming only the shards
+    containing them and extracting the matched members
+    """
+    shards = shards_of_sub_paths(key, catalog, sub_paths)
+
+    def extract(shard):
+        with client.download_stream(key=key + "/" + shard) as f:
+            extract_tar_members(f, path, sub_paths, get_archive_codec(shard))
+    parallel_transfer(extract, [{"shard": s} for s in sorted(shards)],
+                      max_concurrency)
+
+
+@instrument_helper
+def copy_artifact(src, dst, sort=False,
+                  max_concurrency: Optional[int] = None) -> S3Artifact:
     """
     Copy an artifact to another on server side
 
@@ -280,6 +943,7 @@ def copy_artifact(src, dst, sort=False) -> S3Artifact:
         src: source artifact
         dst: destination artifact
         sort: append the path list of dst after that of src
+        max_concurrency: maximum number of objects copied concurrently
     """
     src_key = get_key(src)
     dst_key = get_key(dst)
@@ -302,468 +966,3534 @@ def copy_artifact(src, dst, sort=False) -> S3Artifact:
                 upload_s3(path=catalog_dir, prefix=dst_key)
                 ignore_catalog = True
 
-    copy_s3(src_key, dst_key, ignore_catalog=ignore_catalog)
+    copy_s3(src_key, dst_key, ignore_catalog=ignore_catalog,
+            max_concurrency=max_concurrency)
     return S3Artifact(key=dst_key)
 
 
 def get_md5(f):
     md5 = hashlib.md5()
     with open(f, "rb") as fd:
-        for chunk in iter(lambda: fd.read(4096), b""):
+        for chunk in iter(lambda: fd.read(1 << 20), b""):
             md5.update(chunk)
     return md5.hexdigest()
 
 
-def download_s3(
-        key: str,
-        path: os.PathLike = ".",
-        recursive: bool = True,
-        skip_exists: bool = False,
-        keep_dir: bool = False,
-        **kwargs,
-) -> str:
-    if s3_config["storage_client"] is not None:
-        client = s3_config["storage_client"]
-    else:
-        client = MinioClient(**kwargs)
-    if recursive:
+def get_multipart_etag(f, part_size: int) -> str:
+    digests = []
+    with open(f, "rb") as fd:
+        for part in iter(lambda: fd.read(part_size), b""):
+            digests.append(hashlib.md5(part).digest())
+    return "%s-%s" % (hashlib.md5(b"".join(digests)).hexdigest(),
+                      len(digests))
+
+
+def match_etag(f, etag: str) -> bool:
+    """
+    Check whether a local file matches an ETag, for an ETag of a multipart
+    upload, part sizes consistent with the number of parts are tried
+    """
+    etag = etag.strip('"').lower()
+    if "-" not in etag:
+        return get_md5(f) == etag
+    n_parts = int(etag.split("-")[-1])
+    size = os.path.getsize(f)
+    mib = 1024 * 1024
+    candidates = [s3_config["part_size"]] + [i * mib for i in [
+        5, 8, 16, 32, 64, 128, 256, 512]]
+    if n_parts > 1:
+        # part size rounded up to MiB
+        candidates.append(-(-size // n_parts // mib) * mib)
+        candidates.append(-(-size // (n_parts - 1) // mib) * mib)
+    for part_size in sorted(set(candidates)):
+        if part_size > 0 and -(-size // part_size) == n_parts and \
+                get_multipart_etag(f, part_size) == etag:
+            return True
+    return False
+
+
+def parallel_transfer(
+        func,
+        tasks: List[dict],
+        max_concurrency: Optional[int] = None,
+        progress: bool = False,
+) -> list:
+    """
+    Run transfer tasks with a bounded thread pool, return the results in
+    the order of tasks
+
+    Args:
+        func: function called with each task as keyword arguments
+        tasks: list of keyword arguments, one for each transfer
+        max_concurrency: maximum number of concurrent transfers, use
+            s3_config["max_concurrency"] by default
+        progress: show a progress bar or not
+
+    Raises:
+        the error of the first failed transfer in the order of tasks, with
+        the number of failed transfers noted, all errors are logged
+    """
+    if max_concurrency is None:
+        max_concurrency = s3_config["max_concurrency"]
+    max_concurrency = max(1, min(int(max_concurrency), len(tasks)))
+    if progress:
         from tqdm import tqdm
-        for obj in tqdm(client.list(prefix=key, recursive=True)):
-            rel_path = obj[len(key):]
-            if rel_path[:1] == "/":
-                rel_path = rel_path[1:]
-            if rel_path == "":
-                file_path = os.path.join(path, os.path.basename(key))
-            elif keep_dir:
-                file_path = os.path.join(path, os.path.basename(key), rel_path)
-            else:
-                file_path = os.path.join(path, rel_path)
+        pbar = tqdm(total=len(tasks))
 
-            if skip_exists and os.path.isfile(file_path):
-                remote_md5 = client.get_md5(key=obj)
-                local_md5 = get_md5(file_path)
-                if remote_md5 == local_md5:
-                    logging.debug("skip object: %s" % obj)
-                    continue
+    def run(task):
+        result = func(**task)
+        if progress:
+            pbar.update()
+        return result
 
-            client.download(key=obj, path=file_path)
+    results = []
+    errors = []
+    if max_concurrency == 1:
+        for task in tasks:
+            try:
+                results.append(run(task))
+            except Exception as e:
+                errors.append((task, e))
+                break
     else:
-        path = os.path.join(path, os.path.basename(key))
-        client.download(key=key, path=path)
-    return path
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [executor.submit(run, task) for task in tasks]
+            done, not_done = wait(futures, return_when="FIRST_EXCEPTION")
+            # stop scheduling new transfers once one has failed
+            for future in not_done:
+                future.cancel()
+        errors = [(task, future.exception()) for task, future in zip(
+            tasks, futures) if not future.cancelled() and
+            future.exception() is not None]
+        if not errors:
+            results = [future.result() for future in futures]
+    if progress:
+        pbar.close()
+    if errors:
+        for task, e in errors:
+            logging.error("Transfer %s failed: %s" % (task, e))
+        raise_transfer_error(errors, len(tasks))
+    return results
 
 
-def upload_s3(
+def raise_transfer_error(errors: List[tuple], n_tasks: int) -> None:
+    """
+    Re-raise the error of the first failed transfer unchanged so that
+    callers can catch the errors of the storage client, noting the number
+    of failed transfers on Python 3.11+
+    """
+    task, e = errors[0]
+    if hasattr(e, "add_note"):
+        e.add_note("%s of %s transfers failed, the first failed transfer is "
+                   "%s" % (len(errors), n_tasks, task))
+    raise e
+
+
+async def async_transfer(
+        func,
+        tasks: List[dict],
+        max_concurrency: Optional[int] = None,
+) -> list:
+    """
+    Run transfer coroutines with bounded concurrency on the event loop,
+    return the results in the order of tasks
+
+    Args:
+        func: coroutine function called with each task as keyword arguments
+        tasks: list of keyword arguments, one for each transfer
+        max_concurrency: maximum number of concurrent transfers, use
+            s3_config["max_concurrency"] by default
+
+    Raises:
+        the error of the first failed transfer in the order of tasks, with
+            the number of failed transfers noted, all errors are logged
+    """
+    if max_concurrency is None:
+        max_concurrency = s3_config["max_concurrency"]
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    async def transfer(task):
+        async with semaphore:
+            return await func(**task)
+
+    results = await asyncio.gather(*[transfer(task) for task in tasks],
+                                   return_exceptions=True)
+    errors = [(task, r) for task, r in zip(tasks, results)
+              if isinstance(r, Exception)]
+    if errors:
+        for task, e in errors:
+            logging.error("Transfer %s failed: %s" % (task, e))
+        raise_transfer_error(errors, len(tasks))
+    return results
+
+
+async def async_upload_s3(
         path: os.PathLike,
-        key: Optional[str] = None,
-        prefix: Optional[str] = None,
+        key: str,
+        max_concurrency: Optional[int] = None,
         **kwargs,
 ) -> str:
-    if s3_config["storage_client"] is not None:
-        client = s3_config["storage_client"]
-    else:
-        client = MinioClient(**kwargs)
-    if key is not None:
-        pass
-    elif prefix is not None:
-        if prefix[-1] != "/":
-            prefix += "/"
-        objs = client.list(prefix=prefix)
-        if len(objs) == 1 and objs[0][-1] == "/":
-            prefix = objs[0]
-        key = "%s%s" % (prefix, os.path.basename(path))
-    else:
-        key = "%supload/%s/%s" % (s3_config["prefix"],
-                                  uuid.uuid4(), os.path.basename(path))
+    """
+    Upload a file or a directory to a key through the async storage client
+    """
+    client = get_async_storage_client(**kwargs)
+    invalidate_catalog_cache(key)
     if os.path.isfile(path):
-        client.upload(key=key, path=path)
+        await client.upload(key=key, path=path)
     elif os.path.isdir(path):
+        tasks = []
         for dn, ds, fs in os.walk(path, followlinks=True):
-            rel_path = dn[len(path):]
-            if rel_path == "":
-                pass
-            elif rel_path[0] != "/":
-                rel_path = "/" + rel_path
+            rel_path = os.path.relpath(dn, path)
             for f in fs:
-                client.upload(key="%s%s/%s" % (key, rel_path, f),
-                              path=os.path.join(dn, f))
+                obj = f if rel_path == "." else "%s/%s" % (rel_path, f)
+                tasks.append({"key": "%s/%s" % (key, obj),
+                              "path": os.path.join(dn, f)})
+        await async_transfer(client.upload, tasks, max_concurrency)
     return key
 
 
-def copy_s3(
+async def async_download_s3(
+        key: str,
+        path: os.PathLike = ".",
+        keep_dir: bool = False,
+        max_concurrency: Optional[int] = None,
+        keep_empty_dir_tag: bool = True,
+        **kwargs,
+) -> str:
+    """
+    Download the objects under a key through the async storage client, the
+    directories of empty directory tags are created instead of downloading
+    the tags if keep_empty_dir_tag is False
+    """
+    client = get_async_storage_client(**kwargs)
+    tasks = []
+    for obj in await client.list(prefix=key, recursive=True):
+        rel_path = obj[len(key):].lstrip("/")
+        if rel_path == "":
+            file_path = os.path.join(path, os.path.basename(key))
+        elif keep_dir:
+            file_path = os.path.join(path, os.path.basename(key), rel_path)
+        else:
+            file_path = os.path.join(path, rel_path)
+        if not keep_empty_dir_tag and \
+                os.path.basename(file_path) == empty_dir_tag:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            continue
+        tasks.append({"key": obj, "path": file_path})
+    await async_transfer(client.download, tasks, max_concurrency)
+    return path
+
+
+async def async_copy_s3(
         src_key: str,
         dst_key: str,
-        recursive: bool = True,
         ignore_catalog: bool = False,
+        max_concurrency: Optional[int] = None,
         **kwargs,
 ) -> None:
-    if s3_config["storage_client"] is not None:
-        client = s3_config["storage_client"]
-    else:
-        client = MinioClient(**kwargs)
-    if recursive:
-        if src_key[-1] != "/":
-            src_key += "/"
-        src_objs = client.list(prefix=src_key)
-        if len(src_objs) == 1 and src_objs[0][-1] == "/":
-            src_key = src_objs[0]
-        if dst_key[-1] != "/":
-            dst_key += "/"
-        dst_objs = client.list(prefix=dst_key)
-        if len(dst_objs) == 1 and dst_objs[0][-1] == "/":
+    """
+    Copy the objects under a key to another through the async storage
+    client
+    """
+    client = get_async_storage_client(**kwargs)
+    invalidate_catalog_cache(dst_key)
+    if src_key[-1] != "/":
+        src_key += "/"
+    if dst_key[-1] != "/":
+        dst_key += "/"
+    tasks = []
+    for obj in await client.list(prefix=src_key, recursive=True):
+        fields = obj.split("/")
+        if ignore_catalog and len(fields) > 1 and \
+                fields[-2] == config["catalog_dir_name"]:
+            continue
+        tasks.append({"src": obj, "dst": dst_key + obj[len(src_key):]})
+    await async_transfer(client.copy, tasks, max_concurrency)
+
+
+async def async_upload_artifact(
+        path: Union[os.PathLike, List[os.PathLike], Set[os.PathLike],
+                    Dict[str, os.PathLike], list, dict],
+        archive: str = "default",
+        namespace: Optional[str] = None,
+        dataset_name: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> S3Artifact:
+    """
+    Upload an artifact through the async storage client, the arguments are
+    those of upload_artifact except content_addressed, shards and
+    resume_key. Archives are written to temporary files in the thread pool
+    shared by async storage helpers and uploaded as single objects
+    """
+    if archive == "default":
+        archive = config["archive_mode"]
+    if config["mode"] == "debug":
+        # nothing is transferred in the debug mode
+        return upload_artifact(path, archive=archive, namespace=namespace,
+                               dataset_name=dataset_name, **kwargs)
+    pairs = list_artifact_paths(path)
+    if archive == "auto":
+        archive = await run_in_async_executor(choose_archive, [
+            p for _, p in pairs if p is not None])
+    if archive is not None and archive not in archive_suffixes:
+        raise RuntimeError("Archive type %s not supported" % archive)
+    client = get_async_storage_client(**kwargs)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_list = stage_artifact(pairs, tmpdir, os.getcwd())
+        write_catalog(tmpdir, str(uuid.uuid4()), path_list)
+        if archive is None:
+            key = resolve_upload_key(None, os.path.basename(tmpdir))
+            await async_upload_s3(tmpdir, key, max_concurrency, **kwargs)
+        else:
+            key = resolve_upload_key(None, os.path.basename(tmpdir) +
+                                     archive_suffixes[archive])
+            with tempfile.TemporaryDirectory() as archive_dir:
+                archive_path = os.path.join(archive_dir, "archive")
+                index = {"path_list": path_list}
+                await run_in_async_executor(
+                    write_archive_file, tmpdir, archive_path, archive, index)
+                await client.upload(key=key, path=archive_path)
+                if archive == "indexed":
+                    with open(archive_path + ".index", "w") as f:
+                        f.write(json.dumps(index))
+                    await client.upload(key=get_archive_index_key(key),
+                                        path=archive_path + ".index")
+
+    urn = ""
+    if namespace is not None and dataset_name is not None:
+        if config["lineage"]:
+            urn = await run_in_async_executor(
+                config["lineage"].register_artifact, namespace,
+                dataset_name, key, **kwargs)
+        else:
+            logging.warn("Lineage client not provided")
+
+    return S3Artifact(key=key, path_list=path_list, urn=urn)
+
+
+def write_archive_file(path: os.PathLike, archive_path: os.PathLike,
+                       archive: str, index: dict) -> None:
+    """
+    Archive a directory into a file, the index is filled for an indexed
+    archive
+    """
+    with open(archive_path, "wb") as f:
+        if archive == "indexed":
+            write_indexed_tar(path, f, index)
+        else:
+            write_tar(path, f, archive)
+
+
+async def async_download_artifact(
+        artifact,
+        extract: bool = True,
+        sub_path: Optional[str] = None,
+        slice: Optional[int] = None,
+        slices: Optional[List[int]] = None,
+        path: os.PathLike = ".",
+        debug_download: bool = False,
+        remove_catalog: bool = True,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> List[str]:
+    """
+    Download an artifact through the async storage client, the arguments
+    are those of download_artifact. Catalogs are read by the sync helpers
+    in the thread pool shared by async storage helpers, archives are
+    downloaded as files and extracted in the thread pool
+    """
+    if config["mode"] == "debug" and not debug_download:
+        linktree(artifact.local_path, path)
+        return assemble_path_list(path, remove=remove_catalog)
+
+    parts = await run_in_async_executor(parts_of_artifact, artifact,
+                                        **kwargs)
+    if parts is not None:
+        return await async_download_concat_artifact(
+            parts, extract=extract, sub_path=sub_path, slice=slice,
+            slices=slices, path=path, remove_catalog=remove_catalog,
+            max_concurrency=max_concurrency, **kwargs)
+
+    key = get_key(artifact)
+    if slices is not None or slice is not None:
+        path_list = await run_in_async_executor(
+            path_list_of_artifact, artifact, **kwargs)
+        sub_paths = [path_list[i] for i in (
+            slices if slices is not None else [slice])]
+        await async_download_sub_paths(
+            key, [p for p in sub_paths if p is not None], path,
+            max_concurrency, **kwargs)
+        res = [os.path.join(path, p) if p is not None else None
+               for p in sub_paths]
+        return res if slices is not None else res[0]
+
+    if sub_path is not None:
+        await async_download_sub_paths(key, [sub_path], path,
+                                       max_concurrency, **kwargs)
+        return os.path.join(path, sub_path)
+
+    client = get_async_storage_client(**kwargs)
+    codec = get_archive_codec(key)
+    await async_download_s3(key, path, max_concurrency=max_concurrency,
+                            keep_empty_dir_tag=False, **kwargs)
+    if codec is not None and extract:
+        await run_in_async_executor(extract_downloaded_archive, path, key)
+    elif codec is None:
+        await async_transfer(client.download, list_blob_tasks(path),
+                             max_concurrency)
+        await run_in_async_executor(extract_shards, path, max_concurrency)
+    return assemble_path_list(path, remove=remove_catalog)
+
+
+async def async_download_concat_artifact(
+        parts: List[str],
+        sub_path: Optional[str] = None,
+        slice: Optional[int] = None,
+        slices: Optional[List[int]] = None,
+        path: os.PathLike = ".",
+        remove_catalog: bool = True,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> List[str]:
+    """
+    Download a concatenated artifact through the async storage client
+    """
+    catalog = await run_in_async_executor(concat_catalogs, parts, **kwargs)
+    if slices is not None or slice is not None:
+        catalog.sort(key=lambda item: item["order"])
+        items = [catalog[i] for i in (slices if slices is not None
+                                      else [slice])]
+        res = await async_transfer(
+            lambda item: async_download_artifact(
+                S3Artifact(key=item["dflow_key"]),
+                sub_path=item["dflow_list_item"], path=path,
+                max_concurrency=max_concurrency, **kwargs),
+            [{"item": item} for item in items], max_concurrency)
+        return res if slices is not None else res[0]
+
+    if sub_path is not None:
+        item = find_concat_item(catalog, sub_path, parts)
+        return await async_download_artifact(
+            S3Artifact(key=item["dflow_key"]), sub_path=sub_path, path=path,
+            max_concurrency=max_concurrency, **kwargs)
+
+    for part in parts:
+        await async_download_artifact(
+            S3Artifact(key=part), path=path, remove_catalog=True,
+            max_concurrency=max_concurrency, **kwargs)
+    write_concat_catalog(path, catalog)
+    return assemble_path_list(path, remove=remove_catalog)
+
+
+async def async_download_sub_paths(
+        key: str,
+        sub_paths: List[str],
+        path: os.PathLike = ".",
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> None:
+    """
+    Download sub paths of an artifact through the async storage client, an
+    archive or the shards containing the sub paths are downloaded as files
+    and the members under the sub paths are extracted
+    """
+    client = get_async_storage_client(**kwargs)
+    codec = get_archive_codec(key)
+    if codec is not None:
+        archives = {key: True}
+    else:
+        catalog = await run_in_async_executor(
+            catalog_of_artifact, S3Artifact(key=key), **kwargs)
+        archives = {"%s/%s" % (key, shard): False for shard in
+                    shards_of_sub_paths(key, catalog, sub_paths)} \
+            if any(item.get("dflow_shard") for item in catalog) else {}
+    if not archives:
+        await async_transfer(partial(
+            async_download_s3, keep_dir=True, max_concurrency=max_concurrency,
+            keep_empty_dir_tag=False, **kwargs), [{
+                "key": key + "/" + p, "path": os.path.join(
+                    path, os.path.dirname(p))} for p in sub_paths],
+            max_concurrency)
+        return
+
+    async def extract(archive_key, strip_root):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_path = os.path.join(tmpdir, "archive")
+            await client.download(key=archive_key, path=archive_path)
+            with open(archive_path, "rb") as f:
+                await run_in_async_executor(
+                    extract_tar_members, f, path, sub_paths,
+                    get_archive_codec(archive_key), strip_root)
+    await async_transfer(extract, [
+        {"archive_key": k, "strip_root": v} for k, v in archives.items()],
+        max_concurrency)
+
+
+async def async_copy_artifact(
+        src,
+        dst,
+        sort: bool = False,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> S3Artifact:
+    """
+    Copy an artifact to another on server side through the async storage
+    client, the arguments are those of copy_artifact
+    """
+    src_key = get_key(src)
+    dst_key = get_key(dst)
+
+    ignore_catalog = False
+    if sort:
+        src_catalog = await run_in_async_executor(catalog_of_artifact, src,
+                                                  **kwargs)
+        dst_catalog = await run_in_async_executor(catalog_of_artifact, dst,
+                                                  **kwargs)
+        if src_catalog and dst_catalog:
+            offset = max(dst_catalog,
+                         key=lambda item: item["order"])["order"] + 1
+            for item in src_catalog:
+                item["order"] += offset
+            with tempfile.TemporaryDirectory() as tmpdir:
+                catalog_dir = write_catalog(tmpdir, str(uuid.uuid4()),
+                                            src_catalog)
+                await async_upload_s3(catalog_dir, "%s/%s" % (
+                    dst_key.rstrip("/"), config["catalog_dir_name"]),
+                    **kwargs)
+                ignore_catalog = True
+
+    await async_copy_s3(src_key, dst_key, ignore_catalog=ignore_catalog,
+                        max_concurrency=max_concurrency, **kwargs)
+    return S3Artifact(key=dst_key)
+
+
+@instrument_helper
+def download_s3(
+        key: str,
+        path: os.PathLike = ".",
+        recursive: bool = True,
+        skip_exists: bool = False,
+        keep_dir: bool = False,
+        max_concurrency: Optional[int] = None,
+        keep_empty_dir_tag: bool = True,
+        **kwargs,
+) -> str:
+    kwargs = resolve_bandwidth_limit(kwargs)
+    client = get_storage_client(**kwargs)
+    if recursive:
+        tasks = list_download_tasks(client, key, path, keep_dir, skip_exists,
+                                    keep_empty_dir_tag)
+        parallel_transfer(download_s3_object, tasks, max_concurrency,
+                          progress=True)
+    else:
+        path = os.path.join(path, os.path.basename(key))
+        download_object(client, key=key, path=path)
+    return path
+
+
+def list_download_tasks(
+        client: "StorageClient",
+        key: str,
+        path: os.PathLike = ".",
+        keep_dir: bool = False,
+        skip_exists: bool = False,
+        keep_empty_dir_tag: bool = True,
+) -> List[dict]:
+    """
+    List objects under a key as tasks for download_s3_object, the
+    directories of empty directory tags are created instead of downloading
+    the tags if keep_empty_dir_tag is False
+    """
+    tasks = []
+    for meta in client.list_with_meta(prefix=key, recursive=True):
+        obj = meta["key"]
+        rel_path = obj[len(key):]
+        if rel_path[:1] == "/":
+            rel_path = rel_path[1:]
+        if rel_path == "":
+            file_path = os.path.join(path, os.path.basename(key))
+        elif keep_dir:
+            file_path = os.path.join(path, os.path.basename(key), rel_path)
+        else:
+            file_path = os.path.join(path, rel_path)
+        if not keep_empty_dir_tag and \
+                os.path.basename(file_path) == empty_dir_tag:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            continue
+        tasks.append({"client": client, "obj": obj, "file_path": file_path,
+                      "etag": meta.get("etag"), "size": meta.get("size"),
+                      "skip_exists": skip_exists})
+    return tasks
+
+
+def download_s3_object(
+        client: "StorageClient",
+        obj: str,
+        file_path: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+        skip_exists: bool = False,
+) -> None:
+    if skip_exists and os.path.isfile(file_path) and (
+            size is None or os.path.getsize(file_path) == size):
+        if etag is None:
+            etag = client.get_md5(key=obj)
+        if match_etag(file_path, etag):
+            logging.debug("skip object: %s" % obj)
+            return
+    download_object(client, key=obj, path=file_path, etag=etag, size=size)
+
+
+def download_object(
+        client: "StorageClient",
+        key: str,
+        path: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+) -> None:
+    """
+    Download an object through the local object cache if it is enabled
+    """
+    cache = get_object_cache()
+    if cache is None:
+        download_file(client, key=key, path=path, etag=etag, size=size)
+    else:
+        cache.download(client, key=key, path=path, etag=etag, size=size)
+
+
+def download_file(
+        client: "StorageClient",
+        key: str,
+        path: str,
+        etag: Optional[str] = None,
+        size: Optional[int] = None,
+        partial_path: Optional[str] = None,
+) -> None:
+    """
+    Download an object to a file, in resumable ranged parts if the storage
+    client supports it and the object is large, see download_multipart for
+    partial_path
+    """
+    if client.resumable and size is not None and \
+            size > s3_config["multipart_threshold"]:
+        download_multipart(client, key, path, size, etag,
+                           partial_path=partial_path)
+    else:
+        download_whole(client, key, path, size)
+
+
+def download_whole(
+        client: "StorageClient",
+        key: str,
+        path: str,
+        size: Optional[int] = None,
+) -> None:
+    """
+    Download an object in one request, the size listed by the caller is
+    charged before the transfer by a throttled storage client
+    """
+    if size is not None and isinstance(client, ThrottledStorageClient):
+        client.download(key=key, path=path, size=size)
+    else:
+        client.download(key=key, path=path)
+
+
+def upload_file(client: "StorageClient", key: str, path: str) -> None:
+    """
+    Upload a file to an object, in resumable parts if the storage client
+    supports it and the file is large
+    """
+    if client.resumable and \
+            os.path.getsize(path) > s3_config["multipart_threshold"]:
+        upload_multipart(client, key, path)
+    else:
+        client.upload(key=key, path=path)
+
+
+def split_ranges(size: int, part_size: int) -> List[tuple]:
+    """
+    Split an object into byte ranges [start, end) of part_size
+    """
+    return [(start, min(start + part_size, size))
+            for start in range(0, size, part_size)]
+
+
+def get_part_size(client: "StorageClient", size: int) -> int:
+    # at most 10000 parts are allowed for a multipart upload
+    part_size = client.part_size or s3_config["part_size"]
+    return max(part_size, -(-size // 10000))
+
+
+def get_checkpoint_path(*fields) -> str:
+    checkpoint_dir = s3_config["checkpoint_dir"] or os.path.join(
+        tempfile.gettempdir(), "dflow_checkpoints")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return os.path.join(checkpoint_dir, hashlib.sha256("\n".join(
+        str(f) for f in fields).encode()).hexdigest() + ".json")
+
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp = "%s.%s.tmp" % (path, uuid.uuid4())
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def upload_multipart(
+        client: "StorageClient",
+        key: str,
+        path: str,
+        max_concurrency: Optional[int] = None,
+) -> None:
+    """
+    Upload a file in parts concurrently, the upload ID is saved in a local
+    checkpoint so that an interrupted upload of the same file to the same
+    key resumes with the parts not uploaded yet, the upload is aborted if
+    it fails with an error which is not transient
+    """
+    # a file staged by a symbolic link is identified by its source
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    part_size = get_part_size(client, st.st_size)
+    checkpoint_path = get_checkpoint_path(
+        "upload", getattr(client, "bucket_name", ""), key, path, st.st_size,
+        st.st_mtime_ns, part_size)
+    checkpoint = load_checkpoint(checkpoint_path)
+    parts = {}
+    if checkpoint is not None:
+        try:
+            # the uploaded parts listed by the server are preferred
+            try:
+                parts = client.list_parts(key, checkpoint["upload_id"])
+            except NotImplementedError:
+                parts = {int(n): etag for n, etag in checkpoint[
+                    "parts"].items()}
+            logging.info("Resume uploading %s with %s parts uploaded" % (
+                path, len(parts)))
+        except Exception as e:
+            logging.warning("Failed to resume uploading %s: %s" % (path, e))
+            checkpoint = None
+    if checkpoint is None:
+        checkpoint = {"key": key,
+                      "upload_id": client.create_multipart_upload(key),
+                      "parts": {}}
+        save_checkpoint(checkpoint_path, checkpoint)
+    upload_id = checkpoint["upload_id"]
+    lock = threading.Lock()
+
+    def upload_part(part_number, start, end):
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        etag = client.upload_part(key, upload_id, part_number, data)
+        with lock:
+            parts[part_number] = etag
+            checkpoint["parts"][str(part_number)] = etag
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    tasks = [{"part_number": i + 1, "start": start, "end": end}
+             for i, (start, end) in enumerate(split_ranges(
+                 st.st_size, part_size)) if i + 1 not in parts]
+    try:
+        parallel_transfer(upload_part, tasks, max_concurrency or
+                          client.max_concurrency)
+        client.complete_multipart_upload(key, upload_id,
+                                         sorted(parts.items()))
+    except Exception as e:
+        if not is_transient_error(e):
+            logging.warning("Abort uploading %s: %s" % (path, e))
+            abort_multipart_upload(client, key, upload_id)
+            os.remove(checkpoint_path)
+        raise
+    os.remove(checkpoint_path)
+
+
+# names of the classes of errors after which a transfer may succeed if
+# resumed, those of urllib3 included
+transient_errors = ["ConnectionError", "TimeoutError", "ProtocolError",
+                    "MaxRetryError", "IncompleteRead"]
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether an error is a connection error or a timeout, or retried by
+    s3_config["retry_errors"]
+    """
+    for cls in type(error).__mro__:
+        if cls.__name__ in s3_config["retry_errors"]:
+            return s3_config["retry_errors"][cls.__name__] > 0
+        if cls.__name__ in transient_errors:
+            return True
+    return False
+
+
+def abort_multipart_upload(client: "StorageClient", key: str,
+                           upload_id: str) -> None:
+    try:
+        client.abort_multipart_upload(key, upload_id)
+    except Exception as e:
+        logging.warning("Failed to abort uploading %s: %s" % (key, e))
+
+
+def clean_checkpoints(
+        max_age: float = 7 * 86400,
+        **kwargs,
+) -> int:
+    """
+    Remove checkpoints of interrupted transfers not resumed for max_age
+    seconds, aborting their multipart uploads and removing their partial
+    downloads
+
+    Args:
+        max_age: age in seconds of the checkpoints to be removed
+        endpoint: endpoint for Minio
+        access_key: access key for Minio
+        secret_key: secret key for Minio
+        secure: secure or not for Minio
+        bucket_name: bucket name for Minio
+    Returns:
+        number of checkpoints removed
+    """
+    checkpoint_dir = os.path.dirname(get_checkpoint_path())
+    now = time.time()
+    n = 0
+    for name in os.listdir(checkpoint_dir):
+        path = os.path.join(checkpoint_dir, name)
+        try:
+            if not name.endswith(".json") or \
+                    now - os.path.getmtime(path) < max_age:
+                continue
+        except FileNotFoundError:
+            continue
+        checkpoint = load_checkpoint(path) or {}
+        if "upload_id" in checkpoint and "key" in checkpoint:
+            abort_multipart_upload(get_storage_client(**kwargs),
+                                   checkpoint["key"], checkpoint["upload_id"])
+        elif "partial" in checkpoint and os.path.isfile(
+                checkpoint["partial"]):
+            os.remove(checkpoint["partial"])
+        try:
+            os.remove(path)
+            n += 1
+        except FileNotFoundError:
+            pass
+    return n
+
+
+def download_multipart(
+        client: "StorageClient",
+        key: str,
+        path: str,
+        size: int,
+        etag: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        partial_path: Optional[str] = None,
+) -> None:
+    """
+    Download an object by ranged reads concurrently into a partial file,
+    completed parts are recorded in a local checkpoint so that an
+    interrupted download resumes with the remaining parts unless the
+    object has changed, the partial file and the checkpoint are removed
+    if the download fails with an error which is not transient
+
+    Args:
+        partial_path: path of the partial file identifying the download
+            across retries, path + ".dflow_partial" by default
+    """
+    if etag is None:
+        etag = client.get_md5(key=key)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    part_size = get_part_size(client, size)
+    if partial_path is None:
+        partial_path = path + ".dflow_partial"
+    partial_path = os.path.abspath(partial_path)
+    checkpoint_path = get_checkpoint_path(
+        "download", getattr(client, "bucket_name", ""), key, partial_path)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is None or checkpoint["etag"] != etag or \
+            checkpoint["size"] != size or \
+            checkpoint["part_size"] != part_size or \
+            not os.path.isfile(partial_path):
+        checkpoint = {"partial": partial_path, "etag": etag,
+                      "size": size, "part_size": part_size, "parts": []}
+        with open(partial_path, "wb") as f:
+            f.truncate(size)
+        save_checkpoint(checkpoint_path, checkpoint)
+    elif checkpoint["parts"]:
+        logging.info("Resume downloading %s with %s parts downloaded" % (
+            key, len(checkpoint["parts"])))
+    lock = threading.Lock()
+
+    def download_part(part_number, start, end):
+        data = client.download_range(key=key, start=start, end=end)
+        if len(data) != end - start:
+            raise RuntimeError("Expect %s bytes for part %s of %s, got %s" % (
+                end - start, part_number, key, len(data)))
+        with open(partial_path, "r+b") as f:
+            f.seek(start)
+            f.write(data)
+        with lock:
+            checkpoint["parts"].append(part_number)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    done = set(checkpoint["parts"])
+    tasks = [{"part_number": i + 1, "start": start, "end": end}
+             for i, (start, end) in enumerate(split_ranges(size, part_size))
+             if i + 1 not in done]
+    try:
+        parallel_transfer(download_part, tasks, max_concurrency or
+                          client.max_concurrency)
+    except Exception as e:
+        if not is_transient_error(e):
+            for f in [partial_path, checkpoint_path]:
+                if os.path.exists(f):
+                    os.remove(f)
+        raise
+    os.replace(partial_path, path)
+    os.remove(checkpoint_path)
+
+
+def get_object_cache(
+        cache_dir: Optional[os.PathLike] = None,
+) -> Optional["ObjectCache"]:
+    """
+    Get the local object cache in cache_dir, s3_config["cache_dir"] by
+    default, with the size limit s3_config["cache_size"], None if the cache
+    is disabled
+    """
+    if cache_dir is None:
+        cache_dir = s3_config["cache_dir"]
+    if not cache_dir:
+        return None
+    with object_cache_lock:
+        cache = object_caches.get(cache_dir)
+        if cache is None:
+            cache = ObjectCache(cache_dir)
+            object_caches[cache_dir] = cache
+        cache.max_size = s3_config["cache_size"]
+        return cache
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """
+    Materialize a file by reflink, hardlink or copy, whichever works first
+    """
+    if os.path.dirname(dst):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        import fcntl
+        FICLONE = 0x40049409
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return
+    except Exception:
+        if os.path.exists(dst):
+            os.remove(dst)
+    try:
+        os.link(src, dst)
+    except Exception:
+        shutil.copyfile(src, dst)
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock of a file across processes, no lock is held on
+    platforms without fcntl
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ObjectCache:
+    """
+    Local on-disk cache of objects keyed by storage key and ETag with LRU
+    eviction, cached files are materialized by reflinks or hardlinks when
+    possible, so files downloaded through the cache should not be modified
+    in place
+
+    Args:
+        cache_dir: directory of the cache
+        max_size: size limit of the cache in bytes
+    """
+
+    def __init__(self, cache_dir: os.PathLike, max_size: int = 10 << 30):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0
+        self.miss_bytes = 0
+        self.evictions = 0
+        self.entry_locks = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # downloads in progress are not counted
+        self.size = sum(os.path.getsize(os.path.join(self.cache_dir, f))
+                        for f in os.listdir(self.cache_dir)
+                        if not f.endswith(".tmp"))
+
+    def entry_path(self, key: str, etag: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(
+            ("%s\n%s" % (key, etag)).encode()).hexdigest())
+
+    def download(self, client: "StorageClient", key: str, path: str,
+                 etag: Optional[str] = None,
+                 size: Optional[int] = None) -> None:
+        if etag is None:
+            etag = client.get_md5(key=key)
+        if not etag:
+            download_file(client, key, path, size=size)
+            return
+        self.fetch(key, etag, path, partial(download_file, client, key,
+                                            etag=etag, size=size))
+
+    def fetch(self, key: str, etag: str, path: str,
+              download: Callable[..., None]) -> None:
+        """
+        Materialize the entry of a key and an ETag at a path, the entry is
+        filled by calling download with a temporary path on a miss, and a
+        partial path of the entry so that an interrupted download resumes
+        """
+        entry = self.entry_path(key, etag)
+        if self.materialize(entry, path):
+            return
+        with self.lock:
+            entry_lock = self.entry_locks.setdefault(entry, threading.Lock())
+        # downloads of the same entry are done once, by one process if
+        # processes share the cache directory
+        with entry_lock, file_lock(entry + ".lock.tmp"):
+            if self.materialize(entry, path):
+                return
+            tmp = "%s.%s.tmp" % (entry, uuid.uuid4().hex)
+            try:
+                download(path=tmp, partial_path=entry + ".partial.tmp")
+                size = os.path.getsize(tmp)
+                # materialize before publishing the entry, which may be
+                # evicted by other threads right after it is published
+                link_or_copy(tmp, path)
+                os.replace(tmp, entry)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        with self.lock:
+            self.entry_locks.pop(entry, None)
+            self.misses += 1
+            self.miss_bytes += size
+            self.size += size
+        self.evict()
+
+    def materialize(self, entry: str, path: str) -> bool:
+        try:
+            # mark as recently used
+            os.utime(entry)
+            link_or_copy(entry, path)
+        except FileNotFoundError:
+            return False
+        with self.lock:
+            self.hits += 1
+            self.hit_bytes += os.path.getsize(path)
+        return True
+
+    def evict(self) -> None:
+        with self.lock:
+            if self.size <= self.max_size:
+                return
+            entries = []
+            for f in os.listdir(self.cache_dir):
+                # skip downloads in progress
+                if f.endswith(".tmp"):
+                    continue
+                fpath = os.path.join(self.cache_dir, f)
+                try:
+                    st = os.stat(fpath)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fpath))
+            self.size = sum(e[1] for e in entries)
+            entries.sort()
+            for _, size, fpath in entries:
+                if self.size <= self.max_size:
+                    break
+                try:
+                    os.remove(fpath)
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            for f in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, f))
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_bytes": self.hit_bytes,
+                "miss_bytes": self.miss_bytes,
+                "evictions": self.evictions,
+                "size": self.size,
+                "max_size": self.max_size,
+            }
+
+
+def cache_stats() -> dict:
+    """
+    Get hit/miss statistics of the local object cache
+    """
+    cache = get_object_cache()
+    return cache.stats() if cache is not None else {}
+
+
+http_session = None
+http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Get the requests session shared by the whole process for HTTP
+    artifacts, whose connection pool fits s3_config["max_concurrency"]
+    """
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            import requests
+            http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=max(10, s3_config["max_concurrency"]))
+            http_session.mount("http://", adapter)
+            http_session.mount("https://", adapter)
+        return http_session
+
+
+class HTTPDownloader:
+    """
+    Read-only client of HTTP URLs providing the methods used by
+    download_file, ranged reads are used if the server accepts them
+    """
+
+    part_size = None
+    max_concurrency = None
+
+    def __init__(self, verify: bool = False) -> None:
+        self.session = get_http_session()
+        self.verify = verify
+        self.resumable = False
+
+    def head(self, url: str) -> dict:
+        """
+        Get the ETag and size of a URL, and whether ranged reads are
+        accepted, empty if the server does not support HEAD requests
+        """
+        r = self.session.head(url, allow_redirects=True, verify=self.verify)
+        if not r.ok:
+            return {}
+        self.resumable = r.headers.get("Accept-Ranges") == "bytes"
+        size = r.headers.get("Content-Length")
+        return {"etag": r.headers.get("ETag"),
+                "size": int(size) if size is not None else None}
+
+    def get_md5(self, key: str) -> Optional[str]:
+        return self.head(key).get("etag")
+
+    def download(self, key: str, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.session.get(key, stream=True, verify=self.verify) as r:
+            r.raise_for_status()
+            with open(path, "wb") as f:
+                shutil.copyfileobj(r.raw, f, 1 << 20)
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        r = self.session.get(key, headers={"Range": "bytes=%s-%s" % (
+            start, end - 1)}, verify=self.verify)
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise RuntimeError("Range request to %s is not supported" % key)
+        return r.content
+
+
+def download_http(
+        url: str,
+        path: os.PathLike = ".",
+        cache_dir: Optional[os.PathLike] = None,
+) -> str:
+    """
+    Download a URL into a directory, large files are downloaded by
+    concurrent ranged reads which resume after failures if the server
+    accepts ranges, and files are cached by URL and ETag in the local
+    object cache if it is enabled
+
+    Args:
+        url: the URL
+        path: the local directory
+        cache_dir: directory of the local cache, s3_config["cache_dir"] by
+            default
+    """
+    file_path = os.path.join(path, os.path.basename(url))
+    downloader = HTTPDownloader()
+    meta = downloader.head(url)
+    download = partial(download_file, downloader, url, etag=meta.get("etag"),
+                       size=meta.get("size"))
+    cache = get_object_cache(cache_dir)
+    if cache is not None and meta.get("etag"):
+        cache.fetch(url, meta["etag"], file_path, download)
+    else:
+        download(path=file_path)
+    return file_path
+
+
+@instrument_helper
+def upload_s3(
+        path: os.PathLike,
+        key: Optional[str] = None,
+        prefix: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        content_addressed: bool = False,
+        materialize: bool = False,
+        resume_key: Optional[str] = None,
+        **kwargs,
+) -> str:
+    kwargs = resolve_bandwidth_limit(kwargs)
+    client = get_storage_client(**kwargs)
+    key = resolve_upload_key(client, os.path.basename(path), key, prefix,
+                             resume_key)
+    invalidate_catalog_cache(key)
+    if content_addressed:
+        upload_blobs(client, path, key, max_concurrency, materialize)
+    elif os.path.isfile(path):
+        upload_file(client, key=key, path=path)
+    elif os.path.isdir(path):
+        tasks = []
+        for dn, ds, fs in os.walk(path, followlinks=True):
+            rel_path = dn[len(path):]
+            if rel_path == "":
+                pass
+            elif rel_path[0] != "/":
+                rel_path = "/" + rel_path
+            for f in fs:
+                tasks.append({"key": "%s%s/%s" % (key, rel_path, f),
+                              "path": os.path.join(dn, f)})
+        parallel_transfer(partial(upload_file, client), tasks,
+                          max_concurrency)
+    return key
+
+
+def get_blob_key(digest: str) -> str:
+    return "%sblobs/%s/%s" % (s3_config["prefix"], digest[:2], digest)
+
+
+def get_sha256(f):
+    sha256 = hashlib.sha256()
+    with open(f, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def upload_blobs(
+        client: "StorageClient",
+        path: os.PathLike,
+        key: str,
+        max_concurrency: Optional[int] = None,
+        materialize: bool = False,
+) -> None:
+    """
+    Upload files as content-addressed blobs keyed by their SHA256, blobs
+    already in the storage are skipped. For a directory, a catalog mapping
+    relative paths to blobs is saved under the key, and the files are
+    copied from blobs on server side if materialize is True. Blobs are
+    checked for existence by listing their own keys, so that the cost does
+    not grow with the size of the blob store
+
+    Args:
+        client: storage client
+        path: local file or directory
+        key: key of the artifact
+        max_concurrency: maximum number of concurrent transfers
+        materialize: copy blobs to the key on server side so that the
+            artifact can be used without resolving the catalog, e.g. by Argo
+    """
+    if os.path.isfile(path):
+        files = {"": path}
+    else:
+        files = {}
+        for dn, ds, fs in os.walk(path, followlinks=True):
+            for f in fs:
+                rel_path = os.path.relpath(os.path.join(dn, f), path)
+                files[rel_path.replace("\\", "/")] = os.path.join(dn, f)
+
+    digests = {}
+
+    def hash_file(rel_path):
+        digests[rel_path] = get_sha256(files[rel_path])
+    parallel_transfer(hash_file, [{"rel_path": p} for p in files],
+                      max_concurrency)
+
+    blob_keys = sorted(set(get_blob_key(d) for d in digests.values()))
+    found = parallel_transfer(
+        lambda blob_key: blob_key in client.list(prefix=blob_key),
+        [{"blob_key": k} for k in blob_keys], max_concurrency)
+    existing = set(k for k, f in zip(blob_keys, found) if f)
+    tasks = {}
+    for rel_path, digest in digests.items():
+        blob_key = get_blob_key(digest)
+        if blob_key not in existing and blob_key not in tasks:
+            tasks[blob_key] = {"key": blob_key, "path": files[rel_path]}
+    logging.debug("upload blobs: %s of %s blobs exist" % (
+        len(set(digests.values())) - len(tasks), len(set(digests.values()))))
+    parallel_transfer(client.upload, list(tasks.values()), max_concurrency)
+
+    if os.path.isfile(path):
+        client.copy(get_blob_key(digests[""]), key)
+        return
+    if materialize:
+        parallel_transfer(client.copy, [{
+            "src": get_blob_key(digest), "dst": "%s/%s" % (key, rel_path)}
+            for rel_path, digest in digests.items()], max_concurrency)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fpath = os.path.join(tmpdir, str(uuid.uuid4()))
+        with open(fpath, "w") as f:
+            f.write(jsonpickle.dumps({"path_list": [], "blobs": {
+                rel_path: get_blob_key(digest)
+                for rel_path, digest in digests.items()}}))
+        client.upload(key="%s/%s/%s" % (key, config["catalog_dir_name"],
+                                        os.path.basename(fpath)), path=fpath)
+
+
+def download_blobs(
+        path: os.PathLike,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> None:
+    """
+    Download blobs referred by the catalog of a downloaded artifact which
+    are not materialized
+    """
+    tasks = list_blob_tasks(path)
+    if tasks:
+        client = get_storage_client(**kwargs)
+        parallel_transfer(partial(download_object, client), tasks,
+                          max_concurrency)
+
+
+def list_blob_tasks(path: os.PathLike) -> List[dict]:
+    """
+    Keys and paths of the blobs referred by the catalog of a downloaded
+    artifact which are not materialized
+    """
+    catalog_dir = os.path.join(path, config["catalog_dir_name"])
+    if not os.path.isdir(catalog_dir):
+        return []
+    tasks = []
+    for f in os.listdir(catalog_dir):
+        with open(os.path.join(catalog_dir, f), "r") as fd:
+            catalog = jsonpickle.loads(fd.read())
+        for rel_path, blob_key in catalog.get("blobs", {}).items():
+            file_path = os.path.join(path, rel_path)
+            if not os.path.exists(file_path):
+                tasks.append({"key": blob_key, "path": file_path})
+    return tasks
+
+
+def resolve_upload_key(
+        client: "StorageClient",
+        name: str,
+        key: Optional[str] = None,
+        prefix: Optional[str] = None,
+        resume_key: Optional[str] = None,
+) -> str:
+    if key is not None:
+        return key
+    elif prefix is not None:
+        if prefix[-1] != "/":
+            prefix += "/"
+        objs = client.list(prefix=prefix)
+        if len(objs) == 1 and objs[0][-1] == "/":
+            prefix = objs[0]
+        return "%s%s" % (prefix, name)
+    elif resume_key is not None:
+        # the same key in every run so that an interrupted upload resumes
+        return "%supload/%s/%s" % (s3_config["prefix"], uuid.uuid5(
+            uuid.NAMESPACE_URL, resume_key), name)
+    else:
+        return "%supload/%s/%s" % (s3_config["prefix"], uuid.uuid4(), name)
+
+
+def upload_s3_stream(
+        write,
+        name: str,
+        key: Optional[str] = None,
+        prefix: Optional[str] = None,
+        resume_key: Optional[str] = None,
+        **kwargs,
+) -> str:
+    """
+    Upload the data written by a function as one object, the data is
+    streamed to the storage while being produced, so that an interrupted
+    upload is not resumable and starts over in the next run
+
+    Args:
+        write: function writing the data to the file object passed in
+        name: name of the object if key is not specified
+        key: key of the object
+        prefix: prefix of the key if key is not specified
+        resume_key: the same key in every run with the resume key if
+            neither key nor prefix is specified
+    """
+    client = get_storage_client(**kwargs)
+    key = resolve_upload_key(client, name, key, prefix, resume_key)
+    stream = PipeStream(write)
+    try:
+        client.upload_stream(key=key, stream=stream)
+    finally:
+        stream.close()
+    return key
+
+
+class PipeStream:
+    """
+    Readable stream of the data written by a function in a background
+    thread, an error in the function is raised on reaching the end of the
+    stream so that a truncated stream is never taken as complete
+    """
+
+    def __init__(self, write) -> None:
+        r, w = os.pipe()
+        self.reader = os.fdopen(r, "rb")
+        self.error = None
+
+        def produce():
+            try:
+                with os.fdopen(w, "wb") as writer:
+                    write(writer)
+            except Exception as e:
+                self.error = e
+
+        self.thread = threading.Thread(target=produce, daemon=True)
+        self.thread.start()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.reader.read(size)
+        if size is None or size < 0 or len(data) < size:
+            # the end of the stream
+            self.thread.join()
+            if self.error is not None:
+                raise self.error
+        return data
+
+    def close(self) -> None:
+        # the producer gets a broken pipe if it is still writing
+        self.reader.close()
+        self.thread.join()
+
+
+# suffixes of storage keys of artifacts archived by each codec
+archive_suffixes = {
+    "tar": ".tgz",
+    "indexed": ".tgz",
+    "zstd": ".tar.zst",
+    "lz4": ".tar.lz4",
+}
+
+
+def get_archive_codec(key: str) -> Optional[str]:
+    for codec, suffix in archive_suffixes.items():
+        if key.endswith(suffix):
+            return codec
+    return None
+
+
+def import_codec_module(codec: str):
+    try:
+        if codec == "zstd":
+            import zstandard
+            return zstandard
+        elif codec == "lz4":
+            import lz4.frame
+            return lz4.frame
+    except ImportError:
+        raise ImportError("Archive mode %s requires package %s, please "
+                          "install it" % (codec, {"zstd": "zstandard",
+                                                  "lz4": "lz4"}[codec]))
+    import gzip
+    return gzip
+
+
+@contextlib.contextmanager
+def compress_stream(fileobj, codec: str = "tar"):
+    level = config["archive_level"]
+    mod = import_codec_module(codec)
+    if codec == "zstd":
+        cctx = mod.ZstdCompressor(level=level if level is not None else 3,
+                                  threads=config["archive_threads"])
+        f = cctx.stream_writer(fileobj, closefd=False)
+    elif codec == "lz4":
+        f = mod.LZ4FrameFile(fileobj, mode="wb", compression_level=level
+                             if level is not None else 0)
+    else:
+        f = mod.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level
+                         if level is not None else 9)
+    with f:
+        yield f
+
+
+@contextlib.contextmanager
+def decompress_stream(fileobj, codec: str = "tar"):
+    mod = import_codec_module(codec)
+    if codec == "zstd":
+        f = mod.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    elif codec == "lz4":
+        f = mod.LZ4FrameFile(fileobj, mode="rb")
+    else:
+        f = mod.GzipFile(fileobj=fileobj, mode="rb")
+    with f:
+        yield f
+
+
+def write_tar(path: os.PathLike, fileobj, codec: str = "tar") -> None:
+    if codec in ["zstd", "lz4"]:
+        fileobj.write(archive_marker)
+    with compress_stream(fileobj, codec) as f:
+        with tarfile.open(fileobj=f, mode="w|", dereference=True) as tf:
+            tf.add(path, arcname=os.path.basename(path))
+
+
+class MemberGzipWriter:
+    """
+    Writable file object compressing data into a gzip file of multiple
+    members, each of which can be decompressed independently
+    """
+
+    def __init__(self, fileobj, level: int = 9) -> None:
+        self.fileobj = fileobj
+        self.level = level
+        self.offset = 0
+        self.compressed_offset = 0
+        self.compressor = None
+
+    def new_member(self) -> None:
+        self.finish_member()
+        self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def finish_member(self) -> None:
+        if self.compressor is not None:
+            self.write_raw(self.compressor.flush())
+            self.compressor = None
+
+    def write_raw(self, data: bytes) -> None:
+        self.fileobj.write(data)
+        self.compressed_offset += len(data)
+
+    def write(self, data: bytes) -> int:
+        if self.compressor is None:
+            self.new_member()
+        self.write_raw(self.compressor.compress(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.offset
+
+
+def write_indexed_tar(path: os.PathLike, fileobj, index: dict) -> None:
+    """
+    Write a .tgz archive in which every entry starts a new gzip member, and
+    fill the index with the compressed byte range of each entry, so that
+    entries can be fetched by ranged reads. The archive is still a valid
+    .tgz file for other tools
+    """
+    level = config["archive_level"]
+    writer = MemberGzipWriter(fileobj, level if level is not None else 9)
+    root = os.path.basename(path)
+    starts = []
+    with tarfile.open(fileobj=writer, mode="w", dereference=True) as tf:
+        for dn, ds, fs in os.walk(path, followlinks=True):
+            ds.sort()
+            rel_dir = os.path.relpath(dn, path).replace("\\", "/")
+            arc_dir = root if rel_dir == "." else root + "/" + rel_dir
+            for name in [None] + sorted(fs):
+                arcname = arc_dir if name is None else arc_dir + "/" + name
+                writer.new_member()
+                starts.append((writer.compressed_offset, arcname))
+                tf.add(dn if name is None else os.path.join(dn, name),
+                       arcname=arcname, recursive=False)
+        # the end-of-archive blocks
+        writer.new_member()
+        end = writer.compressed_offset
+    writer.finish_member()
+    index["root"] = root
+    index["members"] = {
+        arcname: [start, starts[i + 1][0] if i + 1 < len(starts) else end]
+        for i, (start, arcname) in enumerate(starts)}
+
+
+def get_archive_index_key(key: str) -> str:
+    return "%s/%s/%s.index" % (os.path.dirname(key),
+                               config["catalog_dir_name"],
+                               os.path.basename(key))
+
+
+def load_archive_index(client: "StorageClient", key: str) -> Optional[dict]:
+    index_key = get_archive_index_key(key)
+    if index_key not in client.list(prefix=index_key):
+        return None
+    with client.download_stream(key=index_key) as f:
+        return loads_catalog(f.read())
+
+
+def download_indexed_members(
+        client: "StorageClient",
+        key: str,
+        index: dict,
+        sub_paths: List[str],
+        path: os.PathLike,
+        max_concurrency: Optional[int] = None,
+) -> None:
+    """
+    Download entries under sub paths of an indexed archive by ranged reads,
+    ranges of adjacent entries are coalesced up to the part size
+    """
+    root = index["root"]
+    ranges = set()
+    for sub_path in sub_paths:
+        target = root + "/" + sub_path.strip("/")
+        found = [tuple(r) for name, r in index["members"].items()
+                 if name == target or name.startswith(target + "/")]
+        if not found:
+            raise FileNotFoundError("%s not found in artifact %s" % (
+                sub_path, key))
+        ranges.update(found)
+    ranges = sorted(ranges)
+    part_size = client.part_size or s3_config["part_size"]
+    coalesced = [list(ranges[0])]
+    for start, end in ranges[1:]:
+        if start == coalesced[-1][1] and end - coalesced[-1][0] <= part_size:
+            coalesced[-1][1] = end
+        else:
+            coalesced.append([start, end])
+
+    def fetch(start, end):
+        f = RangeGzipReader(client, key, start, end, part_size)
+        with tarfile.open(fileobj=f, mode="r|") as tf:
+            for member in tf:
+                member.name = member.name[len(root) + 1:]
+                if member.name:
+                    extract_member(tf, member, path)
+
+    parallel_transfer(fetch, [{"start": start, "end": end}
+                              for start, end in coalesced], max_concurrency)
+
+
+class RangeGzipReader:
+    """
+    Readable file object decompressing a byte range of a gzip file of
+    multiple members, the range is fetched in windows and decompressed in
+    a streaming way so that it is never held in memory as a whole
+    """
+
+    def __init__(self, client: "StorageClient", key: str, start: int,
+                 end: int, window: int) -> None:
+        self.client = client
+        self.key = key
+        self.offset = start
+        self.end = end
+        self.window = window
+        self.pending = b""
+        self.decompressor = zlib.decompressobj(31)
+
+    def fetch(self) -> bytes:
+        end = min(self.offset + self.window, self.end)
+        data = self.client.download_range(key=self.key, start=self.offset,
+                                          end=end)
+        self.offset = end
+        return data
+
+    def read_chunk(self, size: int) -> bytes:
+        while True:
+            data = self.decompressor.unconsumed_tail
+            if not data:
+                data, self.pending = self.pending, b""
+            if not data and self.offset < self.end:
+                data = self.fetch()
+            if not data:
+                return b""
+            chunk = self.decompressor.decompress(data, size)
+            if self.decompressor.eof:
+                # the next entry starts a new gzip member
+                self.pending = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(31)
+            if chunk:
+                return chunk
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        n = 0
+        while size < 0 or n < size:
+            chunk = self.read_chunk(size - n if size >= 0 else 1 << 20)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            n += len(chunk)
+        return b"".join(chunks)
+
+
+def extract_tar(fileobj, path: os.PathLike, codec: str = "tar") -> None:
+    with decompress_stream(fileobj, codec) as f:
+        with tarfile.open(fileobj=f, mode="r|") as tf:
+            for member in tf:
+                extract_member(tf, member, path)
+
+
+# leading bytes of the frames written by each codec, Argo only extracts
+# gzip tarballs so that the others are placed at the artifact path as files
+archive_magics = {
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "lz4": b"\x04\x22\x4d\x18",
+}
+# skippable frame of zstd and lz4 written at the head of the tarballs of
+# artifacts archived by dflow, which is ignored by decoders
+archive_marker = b"\x5e\x2a\x4d\x18\x0d\x00\x00\x00dflow-archive"
+
+
+def extract_archive_file(path: os.PathLike) -> None:
+    """
+    Extract in place a tarball compressed by zstd or lz4 by dflow which is
+    placed at the path of an input artifact as a single file, the single
+    root entry of the tarball takes the path like Argo does for gzip
+    tarballs. Compressed files of users are not marked by dflow and kept
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, "rb") as f:
+        head = f.read(len(archive_marker) + 4)
+    if head[:len(archive_marker)] != archive_marker:
+        return
+    magic = head[len(archive_marker):]
+    codec = next((c for c, m in archive_magics.items() if m == magic), None)
+    if codec is None:
+        return
+    tmpdir = "%s.%s.dflow_extract" % (path, uuid.uuid4().hex)
+    try:
+        with open(path, "rb") as f:
+            extract_tar(f, tmpdir, codec)
+    except tarfile.TarError:
+        # a compressed file rather than a tarball
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return
+    os.remove(path)
+    entries = os.listdir(tmpdir)
+    if len(entries) == 1:
+        os.rename(os.path.join(tmpdir, entries[0]), path)
+        os.rmdir(tmpdir)
+    else:
+        os.rename(tmpdir, path)
+
+
+def extract_tar_members(fileobj, path: os.PathLike, sub_paths: List[str],
+                        codec: str = "tar", strip_root: bool = False) -> None:
+    """
+    Extract the members of a compressed tar stream under sub paths
+
+    Args:
+        fileobj: compressed tar stream
+        path: target path
+        sub_paths: sub paths to extract
+        codec: codec of the stream
+        strip_root: strip the root directory of the archive from the names
+            of members, e.g. for archived artifacts
+    """
+    with decompress_stream(fileobj, codec) as f:
+        with tarfile.open(fileobj=f, mode="r|") as tf:
+            for member in tf:
+                if strip_root:
+                    member.name = member.name.partition("/")[2]
+                if any(member.name == p or member.name.startswith(p + "/")
+                       for p in sub_paths):
+                    extract_member(tf, member, path)
+
+
+def extract_member(tf: tarfile.TarFile, member: tarfile.TarInfo,
+                   path: os.PathLike) -> None:
+    # only create the directory of an empty directory tag, so that no walk
+    # is needed to remove the tags afterwards
+    if os.path.basename(member.name) == empty_dir_tag:
+        os.makedirs(os.path.join(path, os.path.dirname(member.name)),
+                    exist_ok=True)
+    else:
+        tf.extract(member, path)
+
+
+@instrument_helper
+def copy_s3(
+        src_key: str,
+        dst_key: str,
+        recursive: bool = True,
+        ignore_catalog: bool = False,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> None:
+    client = get_storage_client(**kwargs)
+    invalidate_catalog_cache(dst_key)
+    if recursive:
+        if src_key[-1] != "/":
+            src_key += "/"
+        src_objs = client.list(prefix=src_key)
+        if len(src_objs) == 1 and src_objs[0][-1] == "/":
+            src_key = src_objs[0]
+        if dst_key[-1] != "/":
+            dst_key += "/"
+        dst_objs = client.list(prefix=dst_key)
+        if len(dst_objs) == 1 and dst_objs[0][-1] == "/":
             dst_key = dst_objs[0]
-        for obj in client.list(prefix=src_key, recursive=True):
+        tasks = []
+        for meta in client.list_with_meta(prefix=src_key, recursive=True):
+            obj = meta["key"]
             if ignore_catalog:
                 fields = obj.split("/")
                 if len(fields) > 1 and fields[-2] == \
                         config["catalog_dir_name"]:
                     continue
-            client.copy(obj, dst_key + obj[len(src_key):])
+            tasks.append({"client": client, "src": obj,
+                          "dst": dst_key + obj[len(src_key):],
+                          "size": meta.get("size"),
+                          "max_concurrency": max_concurrency})
+        parallel_transfer(copy_object, tasks, max_concurrency,
+                          progress=True)
+    else:
+        client.copy(src_key, dst_key)
+
+
+copy_part_size = 512 << 20
+
+
+def copy_object(
+        client: "StorageClient",
+        src: str,
+        dst: str,
+        size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+) -> None:
+    if size is not None and size > client.max_copy_size:
+        client.copy_multipart(src, dst, size, max_concurrency=max_concurrency)
+    else:
+        client.copy(src, dst)
+
+
+def get_copy_ranges(size: int) -> List[tuple]:
+    """
+    Split an object into byte ranges [start, end) for multipart copy, at
+    most 10000 parts are allowed
+    """
+    return split_ranges(size, max(copy_part_size, -(-size // 10000)))
+
+
+def loads_catalog(content: Union[str, bytes]) -> dict:
+    # catalogs are plain JSON, only fall back to jsonpickle for objects
+    # encoded by it
+    if isinstance(content, bytes):
+        content = content.decode()
+    if '"py/' in content:
+        return jsonpickle.loads(content)
+    return json_loads(content)
+
+
+def catalog_of_artifact(art, **kwargs) -> List[dict]:
+    key = get_key(art, raise_error=False)
+    if not key:
+        return []
+    if get_archive_codec(key) is None and key[-1] != "/":
+        key += "/"
+
+    client = get_storage_client(**kwargs)
+    # the same key in another storage is another artifact
+    cache_key = (client.storage_id, key)
+    with catalog_cache_lock:
+        cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        # items may be modified by the caller
+        return [dict(item) for item in cached]
+
+    parts = parts_of_artifact(art, **kwargs)
+    if parts is not None:
+        # not cached since the parts may change
+        return concat_catalogs(parts, **kwargs)
+
+    if get_archive_codec(key) is not None:
+        # the catalog of an indexed archive is saved in its index
+        index = load_archive_index(client, key)
+        catalog = index.get("path_list", []) if index is not None else []
+        if catalog:
+            with catalog_cache_lock:
+                catalog_cache[cache_key] = [dict(item) for item in catalog]
+        return catalog
+
+    prefix = get_catalog_prefix(client, key)
+    names = [obj[len(prefix):] for obj in client.list(prefix=prefix)]
+    contents = {}
+    names_to_read = list_uncovered_catalogs(names, lambda name: fetch_catalogs(
+        client, prefix, [name], contents)[name])
+    fetch_catalogs(client, prefix, names_to_read, contents)
+    catalog = read_catalogs(contents)
+    threshold = config["catalog_compact_threshold"]
+    if threshold and len(names_to_read) > threshold:
+        try:
+            write_catalog_manifest(client, prefix, catalog, names)
+        except Exception as e:
+            logging.warning("Failed to compact catalog of %s: %s" % (key, e))
+    # an artifact being produced may get more catalogs later
+    if catalog:
+        with catalog_cache_lock:
+            catalog_cache[cache_key] = [dict(item) for item in catalog]
+    return catalog
+
+
+concat_suffix = ".concat"
+
+
+def concat_artifacts(
+        artifacts: list,
+        key: Optional[str] = None,
+        prefix: Optional[str] = None,
+        **kwargs,
+) -> S3Artifact:
+    """
+    Concatenate artifacts into a composite artifact without copying data,
+    the composite artifact is a single object referencing the keys of its
+    parts, and its path list is that of the parts in order
+
+    Args:
+        artifacts: artifacts to be concatenated
+        key: key of the composite artifact, which should end with .concat
+        prefix: prefix of the key of the composite artifact
+    """
+    parts = []
+    for art in artifacts:
+        # flatten concatenated artifacts
+        parts += parts_of_artifact(art, **kwargs) or [get_key(art)]
+    client = get_storage_client(**kwargs)
+    key = resolve_upload_key(client, "artifacts" + concat_suffix, key,
+                             prefix)
+    if not key.endswith(concat_suffix):
+        raise RuntimeError("Key of a concatenated artifact should end with "
+                           "%s" % concat_suffix)
+    client.upload_stream(key=key, stream=io.BytesIO(json.dumps(
+        {"parts": parts}).encode()))
+    art = S3Artifact(key=key)
+    art.parts = parts
+    return art
+
+
+def is_concat_artifact(art) -> bool:
+    """
+    Whether an artifact is concatenated, without reading the storage
+    """
+    if getattr(art, "parts", None) is not None:
+        return True
+    key = get_key(art, raise_error=False)
+    return bool(key) and key.endswith(concat_suffix)
+
+
+def parts_of_artifact(art, **kwargs) -> Optional[List[str]]:
+    """
+    Keys of the parts of a concatenated artifact, or None if the artifact
+    is not concatenated
+    """
+    parts = getattr(art, "parts", None)
+    if parts is not None:
+        return list(parts)
+    key = get_key(art, raise_error=False)
+    if not key or not key.endswith(concat_suffix):
+        return None
+    client = get_storage_client(**kwargs)
+    with client.download_stream(key=key) as f:
+        return json_loads(f.read())["parts"]
+
+
+def concat_catalogs(
+        parts: List[str],
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> List[dict]:
+    """
+    Concatenate the catalogs of parts, orders of each part are shifted
+    after those of the previous parts and items are tagged with the keys
+    of their parts as "dflow_key"
+    """
+    catalogs = parallel_transfer(
+        lambda key: catalog_of_artifact(S3Artifact(key=key), **kwargs),
+        [{"key": part} for part in parts], max_concurrency)
+    concatenated = []
+    offset = 0
+    for part, catalog in zip(parts, catalogs):
+        orders = [item["order"] for item in catalog
+                  if isinstance(item["order"], int)]
+        for item in catalog:
+            if isinstance(item["order"], int):
+                item["order"] += offset
+            item["dflow_key"] = part
+            concatenated.append(item)
+        if orders:
+            offset += max(orders) + 1
+    return concatenated
+
+
+def get_catalog_prefix(client: "StorageClient", key: str) -> str:
+    objs = client.list(prefix=key)
+    if len(objs) == 1 and objs[0][-1] == "/":
+        key = objs[0]
+    return key + config["catalog_dir_name"] + "/"
+
+
+def fetch_catalogs(
+        client: "StorageClient",
+        prefix: str,
+        names: List[str],
+        contents: Optional[dict] = None,
+        max_concurrency: Optional[int] = None,
+) -> Dict[str, bytes]:
+    """
+    Read catalog fragments concurrently into memory
+    """
+    if contents is None:
+        contents = {}
+
+    def fetch(name):
+        with client.download_stream(key=prefix + name) as f:
+            contents[name] = f.read()
+
+    parallel_transfer(fetch, [{"name": n} for n in names
+                              if n not in contents], max_concurrency)
+    return contents
+
+
+def write_catalog_manifest(
+        client: "StorageClient",
+        prefix: str,
+        catalog: List[dict],
+        fragments: List[str],
+) -> None:
+    manifest_name = config["catalog_manifest_name"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fpath = os.path.join(tmpdir, manifest_name)
+        with open(fpath, "w") as f:
+            f.write(json.dumps({
+                "path_list": catalog,
+                "fragments": sorted(n for n in fragments
+                                    if n != manifest_name)}))
+        client.upload(key=prefix + manifest_name, path=fpath)
+
+
+def compact_catalog(
+        art,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+) -> List[dict]:
+    """
+    Merge catalog fragments of an artifact into a single sorted manifest
+    without duplicate items, which is preferred by readers of the catalog
+
+    Args:
+        art: the artifact
+        max_concurrency: maximum number of concurrent reads
+    """
+    key = get_key(art)
+    if key[-1] != "/":
+        key += "/"
+    invalidate_catalog_cache(key)
+    client = get_storage_client(**kwargs)
+    prefix = get_catalog_prefix(client, key)
+    names = [obj[len(prefix):] for obj in client.list(prefix=prefix)]
+    catalog = read_catalogs(fetch_catalogs(
+        client, prefix, names, max_concurrency=max_concurrency))
+    write_catalog_manifest(client, prefix, catalog, names)
+    return catalog
+
+
+def invalidate_catalog_cache(key: Optional[str] = None) -> None:
+    """
+    Remove cached catalogs of artifacts overlapping with a key in all
+    storages, or all cached catalogs if key is None
+    """
+    with catalog_cache_lock:
+        if key is None:
+            catalog_cache.clear()
+            return
+        for storage_id, k in list(catalog_cache):
+            if k.startswith(key) or key.startswith(k):
+                del catalog_cache[storage_id, k]
+
+
+def path_list_of_artifact(art, **kwargs) -> List[str]:
+    return convert_dflow_list(catalog_of_artifact(art, **kwargs))
+
+
+def force_move(src, dst):
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    shutil.move(src, dst)
+
+
+def merge_dir(src, dst, func=force_move):
+    for f in os.listdir(src):
+        src_file = os.path.join(src, f)
+        dst_file = os.path.join(dst, f)
+        if func is force_move and not os.path.lexists(dst_file) and \
+                not os.path.islink(src_file):
+            # move a whole directory by a single rename
+            shutil.move(src_file, dst_file)
+        elif os.path.isdir(src_file):
+            if os.path.isfile(dst_file):
+                os.remove(dst_file)
+            os.makedirs(dst_file, exist_ok=True)
+            merge_dir(src_file, dst_file, func)
+        elif os.path.isfile(src_file):
+            if os.path.isdir(dst_file):
+                shutil.rmtree(dst_file)
+            func(src_file, dst_file)
+
+
+def copy_file(src, dst, func=os.link):
+    os.makedirs(os.path.abspath(os.path.dirname(dst)), exist_ok=True)
+    if os.path.isdir(src):
+        try:
+            shutil.copytree(src, dst, copy_function=func)
+        except FileExistsError:
+            pass
+    elif os.path.isfile(src):
+        func(src, dst)
     else:
-        client.copy(src_key, dst_key)
+        raise RuntimeError("File %s not found" % src)
+
+
+def merge_catalog(catalogs: List[List[dict]]) -> List[dict]:
+    """
+    Merge catalogs into one sorted list without duplicate items
+    """
+    seen = set()
+    merged = []
+    for catalog in catalogs:
+        for item in catalog:
+            h = tuple(sorted(item.items()))
+            if h not in seen:
+                seen.add(h)
+                merged.append(item)
+    try:
+        merged.sort(key=lambda x: x["order"])
+    except TypeError:
+        pass
+    return merged
+
+
+def read_catalogs(contents: Dict[str, Union[str, bytes]]) -> List[dict]:
+    """
+    Merge catalog fragments given the contents keyed by their names, the
+    fragments covered by the compact manifest are skipped
+    """
+    manifest_name = config["catalog_manifest_name"]
+    catalogs = []
+    covered = set()
+    if manifest_name in contents:
+        manifest = loads_catalog(contents[manifest_name])
+        catalogs.append(manifest["path_list"])
+        covered = set(manifest.get("fragments", []))
+    for name, content in contents.items():
+        if name != manifest_name and name not in covered:
+            catalogs.append(loads_catalog(content)["path_list"])
+    return merge_catalog(catalogs)
+
+
+def list_uncovered_catalogs(names: List[str], read) -> List[str]:
+    """
+    Names of catalog fragments to be read besides the compact manifest
+    """
+    manifest_name = config["catalog_manifest_name"]
+    if manifest_name not in names:
+        return names
+    covered = set(loads_catalog(read(manifest_name)).get("fragments", []))
+    return [manifest_name] + [n for n in names if n != manifest_name and
+                              n not in covered]
+
+
+def read_catalog_dir(catalog_dir: os.PathLike) -> List[dict]:
+    def read(name):
+        with open(os.path.join(catalog_dir, name), "r") as f:
+            return f.read()
+    names = list_uncovered_catalogs(os.listdir(catalog_dir), read)
+    return read_catalogs({name: read(name) for name in names})
+
+
+def assemble_path_list(art_path, remove=False):
+    path_list = []
+    if os.path.isdir(art_path):
+        dflow_list = []
+        catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
+        if os.path.exists(catalog_dir):
+            dflow_list = read_catalog_dir(catalog_dir)
+            if remove:
+                shutil.rmtree(catalog_dir)
+        if len(dflow_list) > 0:
+            path_list = list(map(lambda x: os.path.join(
+                art_path, x) if x is not None else None,
+                convert_dflow_list(dflow_list)))
+    return path_list
+
+
+def convert_dflow_list(dflow_list):
+    dflow_list.sort(key=lambda x: x['order'])
+    return list(map(lambda x: x['dflow_list_item'], dflow_list))
+
+
+def assemble_path_dict(art_path, remove=False):
+    path_dict = {}
+    if os.path.isdir(art_path):
+        dflow_list = []
+        catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
+        if os.path.exists(catalog_dir):
+            dflow_list = read_catalog_dir(catalog_dir)
+            if remove:
+                shutil.rmtree(catalog_dir)
+        if len(dflow_list) > 0:
+            for item in dflow_list:
+                if item["dflow_list_item"] is None:
+                    path_dict[item["order"]] = None
+                else:
+                    path_dict[item["order"]] = os.path.join(
+                        art_path, item["dflow_list_item"])
+    return path_dict
+
+
+def assemble_path_nested_dict(art_path, remove=False):
+    return expand(assemble_path_dict(art_path, remove))
 
 
-def catalog_of_artifact(art, **kwargs) -> List[dict]:
-    key = get_key(art, raise_error=False)
-    if not key:
-        return []
-    if key[-1] != "/":
-        key += "/"
+empty_dir_tag = ".empty_dir"
+
+
+def remove_empty_dir_tag(path):
+    for dn, ds, fs in os.walk(path, followlinks=True):
+        if empty_dir_tag in fs:
+            os.remove(os.path.join(dn, empty_dir_tag))
+
+
+def randstr(length: int = 5) -> str:
+    return "".join(random.sample(string.digits + string.ascii_lowercase,
+                                 length))
+
+
+@contextlib.contextmanager
+def set_directory(dirname: os.PathLike, mkdir: bool = False):
+    """
+    Set current workding directory within context
+
+    Parameters
+    ----------
+    dirname : os.PathLike
+        The directory path to change to
+    mkdir: bool
+        Whether make directory if `dirname` does not exist
+
+    Yields
+    ------
+    path: Path
+        The absolute path of the changed working directory
+
+    Examples
+    --------
+    >>> with set_directory("some_path"):
+    ...    do_something()
+    """
+    pwd = os.getcwd()
+    path = Path(dirname).resolve()
+    if mkdir:
+        path.mkdir(exist_ok=True, parents=True)
+    os.chdir(path)
+    yield path
+    os.chdir(pwd)
+
+
+def run_command(
+    cmd: Union[List[str], str],
+    raise_error: bool = True,
+    input: Optional[str] = None,
+    try_bash: bool = False,
+    interactive: bool = True,
+    print_oe: bool = False,
+    **kwargs,
+) -> Tuple[int, str, str]:
+    """
+    Run shell command in subprocess
+
+    Parameters:
+    ----------
+    cmd: list of str, or str
+        Command to execute
+    raise_error: bool
+        Wheter to raise an error if the command failed
+    input: str, optional
+        Input string for the command
+    try_bash: bool
+        Try to use bash if bash exists, otherwise use sh
+    **kwargs:
+        Arguments in subprocess.Popen
+
+    Raises:
+    ------
+    AssertionError:
+        Raises if the error failed to execute and `raise_error` set to `True`
+
+    Return:
+    ------
+    return_code: int
+        The return code of the command
+    out: str
+        stdout content of the executed command
+    err: str
+        stderr content of the executed command
+    """
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    elif isinstance(cmd, list):
+        cmd = [str(x) for x in cmd]
+
+    if try_bash:
+        arg = "-ic" if interactive else "-c"
+        script = "if command -v bash 2>&1 >/dev/null; then bash %s " % arg + \
+            shlex.quote(" ".join(cmd)) + "; else " + " ".join(cmd) + "; fi"
+        cmd = [script]
+        kwargs["shell"] = True
+
+    with subprocess.Popen(
+        args=cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **kwargs,
+    ) as sub:
+        if input is not None:
+            sub.stdin.write(bytes(input, encoding=sys.stdout.encoding))
+            sub.stdin.close()
+        if print_oe:
+            out = ""
+            err = ""
+            sel = selectors.DefaultSelector()
+            sel.register(sub.stdout, selectors.EVENT_READ)
+            sel.register(sub.stderr, selectors.EVENT_READ)
+            ok = True
+            while ok:
+                for key, _ in sel.select():
+                    line = key.fileobj.readline().decode(sys.stdout.encoding)
+                    if not line:
+                        ok = False
+                        break
+                    if key.fileobj is sub.stdout:
+                        sys.stdout.write(line)
+                        out += line
+                    else:
+                        sys.stderr.write(line)
+                        err += line
+            sub.wait()
+        else:
+            out, err = sub.communicate()
+            out = out.decode(sys.stdout.encoding)
+            err = err.decode(sys.stdout.encoding)
+        return_code = sub.poll()
+    if raise_error:
+        assert return_code == 0, "Command %s failed: \n%s" % (cmd, err)
+    return return_code, out, err
+
 
-    if s3_config["storage_client"] is not None:
-        client = s3_config["storage_client"]
+def subclass_or_none(m, cls):
+    if inspect.isclass(m) and issubclass(m, cls) and m != cls:
+        return m
+    elif isinstance(m, cls) and m.__class__ != cls:
+        return m.__class__
     else:
-        client = MinioClient(**kwargs)
-    catalog = []
-    with tempfile.TemporaryDirectory() as tmpdir:
-        objs = client.list(prefix=key)
-        if len(objs) == 1 and objs[0][-1] == "/":
-            key = objs[0]
-        prefix = key + config["catalog_dir_name"] + "/"
-        for obj in client.list(prefix=prefix):
-            fname = obj[len(prefix):]
-            client.download(key=obj, path=os.path.join(tmpdir, fname))
-            with open(os.path.join(tmpdir, fname), "r") as f:
-                catalog += jsonpickle.loads(f.read())['path_list']
-    return catalog
+        return None
 
 
-def path_list_of_artifact(art, **kwargs) -> List[str]:
-    return convert_dflow_list(catalog_of_artifact(art, **kwargs))
+def find_subclass(pkg, cls):
+    subclasses = []
+    for _, m in inspect.getmembers(pkg):
+        s = subclass_or_none(m, cls)
+        if s is not None and s not in subclasses:
+            subclasses.append(m)
+    if hasattr(pkg, "__path__"):
+        for path in pkg.__path__:
+            for dir, _, _ in os.walk(path):
+                subpkg = (pkg.__name__ + dir[len(path):]).replace("/", ".")
+                for _, name, _ in pkgutil.iter_modules([dir]):
+                    try:
+                        mod = __import__(subpkg + "." + name, fromlist=subpkg)
+                        for _, m in inspect.getmembers(mod):
+                            s = subclass_or_none(m, cls)
+                            if s is not None and s not in subclasses:
+                                subclasses.append(s)
+                    except Exception as e:
+                        logging.warning("Fail to inspect submodule %s: %s" % (
+                            name, e))
+    return subclasses
 
 
-def force_move(src, dst):
+def linktree(src, dst, func=os.symlink):
+    merge_dir(src, dst, partial(force_link, func=func))
+
+
+def force_link(src, dst, func=os.symlink):
     if os.path.exists(dst):
         if os.path.samefile(src, dst):
             return
         os.remove(dst)
-    shutil.move(src, dst)
+    func(src, dst)
 
 
-def merge_dir(src, dst, func=force_move):
-    for f in os.listdir(src):
-        src_file = os.path.join(src, f)
-        dst_file = os.path.join(dst, f)
-        if os.path.isdir(src_file):
-            if os.path.isfile(dst_file):
-                os.remove(dst_file)
-            os.makedirs(dst_file, exist_ok=True)
-            merge_dir(src_file, dst_file, func)
-        elif os.path.isfile(src_file):
-            if os.path.isdir(dst_file):
-                shutil.rmtree(dst_file)
-            func(src_file, dst_file)
+class StorageClient(ABC):
+    # objects larger than it are copied by copy_multipart
+    max_copy_size = 5 << 30
+    # storage clients implementing the multipart primitives and ranged
+    # reads should set it to True for resumable transfers of large objects
+    resumable = False
+    # part size and concurrency of multipart transfers of an object,
+    # s3_config["part_size"] and s3_config["max_concurrency"] by default
+    part_size = None
+    max_concurrency = None
 
+    @property
+    def storage_id(self) -> str:
+        """
+        Identity of the storage, objects of the same key are the same only
+        behind storage clients of the same identity, which is the endpoint
+        and the bucket if the client has them, otherwise the client itself
+        """
+        endpoint = getattr(self, "endpoint", None)
+        bucket_name = getattr(self, "bucket_name", None)
+        if endpoint is None and bucket_name is None:
+            return "%s@%s" % (type(self).__name__, id(self))
+        return "%s://%s/%s" % (type(self).__name__, endpoint, bucket_name)
 
-def copy_file(src, dst, func=os.link):
-    os.makedirs(os.path.abspath(os.path.dirname(dst)), exist_ok=True)
-    if os.path.isdir(src):
+    @abc.abstractmethod
+    def upload(self, key: str, path: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def download(self, key: str, path: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        pass
+
+    @abc.abstractmethod
+    def copy(self, src: str, dst: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_md5(self, key: str) -> str:
+        pass
+
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        """
+        List objects with metadata, each item is a dict with key "key" and
+        optional keys "etag" and "size", storage clients should override it
+        if the listing returns metadata to save per-object requests
+        """
+        return [{"key": key} for key in self.list(prefix=prefix,
+                                                  recursive=recursive)]
+
+    def create_multipart_upload(self, key: str) -> str:
+        """
+        Start a multipart upload and return the upload ID
+        """
+        raise NotImplementedError()
+
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        """
+        Upload a part of a multipart upload and return its ETag
+        """
+        raise NotImplementedError()
+
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        """
+        ETags of the uploaded parts of a multipart upload keyed by part
+        numbers
+        """
+        raise NotImplementedError()
+
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        """
+        Complete a multipart upload given part numbers and ETags of parts
+        """
+        raise NotImplementedError()
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        raise NotImplementedError()
+
+    def copy_multipart(self, src: str, dst: str, size: int,
+                       max_concurrency: Optional[int] = None) -> None:
+        """
+        Copy a large object on server side by copying its parts
+        concurrently, storage clients should override it if single copy
+        requests are limited in size
+        """
+        self.copy(src, dst)
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        """
+        Read the bytes in [start, end) of an object, storage clients should
+        override it with a ranged request
+        """
+        with self.download_stream(key=key) as f:
+            f.read(start)
+            return f.read(end - start)
+
+    def upload_stream(self, key: str, stream) -> None:
+        """
+        Upload the data read from a file-like object, storage clients
+        supporting multipart upload should override it to avoid spooling
+        the data to a temporary file
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, os.path.basename(key))
+            with open(path, "wb") as f:
+                shutil.copyfileobj(stream, f, 1 << 20)
+            self.upload(key=key, path=path)
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        """
+        Context manager yielding a readable file-like object of an object,
+        storage clients should override it to read the response body
+        directly instead of saving it to a temporary file
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, os.path.basename(key))
+            self.download(key=key, path=path)
+            with open(path, "rb") as f:
+                yield f
+
+
+def get_storage_client(
+        endpoint: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        secure: Optional[bool] = None,
+        bucket_name: Optional[str] = None,
+        bandwidth_limit: Union[float, "TokenBucket", None] = None,
+        priority: int = 0,
+        **kwargs,
+) -> StorageClient:
+    """
+    Get the storage client, s3_config["storage_client"] if it is set (a
+    URL of a local storage backend is resolved by
+    get_storage_client_by_url), otherwise a MinioClient shared by the
+    whole process for the same endpoint, credentials and bucket
+
+    Args:
+        endpoint: endpoint for Minio
+        access_key: access key for Minio
+        secret_key: secret key for Minio
+        secure: secure or not for Minio
+        bucket_name: bucket name for Minio
+        bandwidth_limit: bandwidth limit in bytes per second or a token
+            bucket shared with other calls, in addition to
+            s3_config["bandwidth_limit"]
+        priority: priority of the transfers under bandwidth limits, higher
+            first
+    """
+    client = get_plugin_storage_client()
+    if client is None:
+        client = get_minio_client(endpoint, access_key, secret_key, secure,
+                                  bucket_name)
+    return with_throttle(with_retry(with_metrics(client)), bandwidth_limit,
+                         priority)
+
+
+def get_minio_client(
+        endpoint: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        secure: Optional[bool] = None,
+        bucket_name: Optional[str] = None,
+) -> "MinioClient":
+    args = {
+        "endpoint": endpoint if endpoint is not None else
+        s3_config["endpoint"],
+        "access_key": access_key if access_key is not None else
+        s3_config["access_key"],
+        "secret_key": secret_key if secret_key is not None else
+        s3_config["secret_key"],
+        "secure": secure if secure is not None else s3_config["secure"],
+        "bucket_name": bucket_name if bucket_name is not None else
+        s3_config["bucket_name"],
+        "pool_size": s3_config["pool_size"],
+        "keep_alive": s3_config["keep_alive"],
+    }
+    cache_key = tuple(args.values())
+    with storage_client_cache_lock:
+        if cache_key not in storage_client_cache:
+            storage_client_cache[cache_key] = MinioClient(**args)
+        return storage_client_cache[cache_key]
+
+
+def get_plugin_storage_client() -> Optional[StorageClient]:
+    """
+    Get the client of s3_config["storage_client"], a URL of a local storage
+    backend is kept in the config so that it is passed to pods as is, and
+    resolved here by get_storage_client_by_url
+    """
+    if isinstance(s3_config["storage_client"], str):
+        return get_storage_client_by_url(s3_config["storage_client"])
+    return s3_config["storage_client"]
+
+
+def get_storage_client_by_url(url: str) -> StorageClient:
+    """
+    Get the local storage client for a URL, "memory://" for
+    MemoryStorageClient or "localfs:///path/to/root" for
+    LocalFSStorageClient, with query arguments passed to the client, the
+    client is shared by the whole process for the same URL
+    """
+    from urllib.parse import parse_qsl, urlparse
+
+    from .plugins.local import LocalFSStorageClient, MemoryStorageClient
+    result = urlparse(url)
+    kwargs = dict(parse_qsl(result.query))
+    with storage_client_cache_lock:
+        if url not in storage_client_cache:
+            if result.scheme == "memory":
+                client = MemoryStorageClient(**kwargs)
+            elif result.scheme == "localfs":
+                client = LocalFSStorageClient(root=result.path or None,
+                                              **kwargs)
+            else:
+                raise RuntimeError("Storage client %s not supported" % url)
+            storage_client_cache[url] = client
+        return storage_client_cache[url]
+
+
+def clear_storage_client_cache() -> None:
+    with storage_client_cache_lock:
+        storage_client_cache.clear()
+        retry_client_cache.clear()
+        metrics_client_cache.clear()
+
+
+retry_client_cache = {}
+hedge_executor = None
+hedge_executor_lock = threading.Lock()
+
+
+def with_retry(client: StorageClient) -> StorageClient:
+    """
+    Wrap a storage client with RetryStorageClient if retries or hedged
+    requests are enabled, the wrapper is shared for the same client
+    """
+    if isinstance(client, RetryStorageClient) or (
+            not s3_config["max_retries"] and not s3_config["retry_errors"]
+            and s3_config["hedge_percentile"] is None):
+        return client
+    with storage_client_cache_lock:
+        # the wrapper keeps the client alive so that its id is not reused
+        if id(client) not in retry_client_cache:
+            retry_client_cache[id(client)] = RetryStorageClient(client)
+        return retry_client_cache[id(client)]
+
+
+class HedgeExecutor(ThreadPoolExecutor):
+    """
+    Thread pool of hedged requests counting the requests not finished, so
+    that a duplicate request is only issued if a worker is idle
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        super().__init__(max_workers=max_workers,
+                         thread_name_prefix="dflow_hedge")
+        self.max_workers = max_workers
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.pending_lock:
+                    self.pending -= 1
+        with self.pending_lock:
+            self.pending += 1
+        return super().submit(run)
+
+    def idle(self) -> bool:
+        with self.pending_lock:
+            return self.pending < self.max_workers
+
+
+def get_hedge_executor() -> HedgeExecutor:
+    global hedge_executor
+    with hedge_executor_lock:
+        if hedge_executor is None:
+            hedge_executor = HedgeExecutor(s3_config["max_concurrency"] * 2)
+        return hedge_executor
+
+
+class StorageClientWrapper(StorageClient):
+    """
+    Storage client delegating requests to another storage client, base
+    class of wrappers overriding some of the requests
+    """
+
+    def __init__(self, client: StorageClient) -> None:
+        self.client = client
+        self.max_copy_size = client.max_copy_size
+        self.resumable = client.resumable
+        self.part_size = client.part_size
+        self.max_concurrency = client.max_concurrency
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    @property
+    def storage_id(self) -> str:
+        return self.client.storage_id
+
+    def upload(self, key: str, path: str) -> None:
+        self.client.upload(key=key, path=path)
+
+    def download(self, key: str, path: str) -> None:
+        self.client.download(key=key, path=path)
+
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        return self.client.list(prefix=prefix, recursive=recursive)
+
+    def copy(self, src: str, dst: str) -> None:
+        self.client.copy(src, dst)
+
+    def get_md5(self, key: str) -> str:
+        return self.client.get_md5(key=key)
+
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        return self.client.list_with_meta(prefix=prefix, recursive=recursive)
+
+    def create_multipart_upload(self, key: str) -> str:
+        return self.client.create_multipart_upload(key)
+
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        return self.client.upload_part(key, upload_id, part_number, data)
+
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        return self.client.list_parts(key, upload_id)
+
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        self.client.complete_multipart_upload(key, upload_id, parts)
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(key, upload_id)
+
+    def copy_multipart(self, src: str, dst: str, size: int,
+                       max_concurrency: Optional[int] = None) -> None:
+        self.client.copy_multipart(src, dst, size,
+                                   max_concurrency=max_concurrency)
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        return self.client.download_range(key, start, end)
+
+    def upload_stream(self, key: str, stream) -> None:
+        self.client.upload_stream(key, stream)
+
+    def download_stream(self, key: str):
+        return self.client.download_stream(key=key)
+
+
+class RetryStorageClient(StorageClientWrapper):
+    """
+    Wrapper of a storage client retrying failed requests with exponential
+    backoff and full jitter, and hedging ranged reads and stream opens by
+    issuing a duplicate request if the first one has not responded within
+    a percentile of recent latencies, per byte for ranged reads and to the
+    first byte for stream opens
+
+    The number of retries is s3_config["retry_errors"][name] for the first
+    class name of the error in its MRO found there, s3_config["max_retries"]
+    otherwise, NotImplementedError is never retried
+    """
+    # number of recorded latencies required before hedging
+    min_hedge_samples = 20
+
+    def __init__(self, client: StorageClient) -> None:
+        super().__init__(client)
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def get_max_retries(self, error: Exception) -> int:
+        if isinstance(error, NotImplementedError):
+            return 0
+        for cls in type(error).__mro__:
+            if cls.__name__ in s3_config["retry_errors"]:
+                return s3_config["retry_errors"][cls.__name__]
+        return s3_config["max_retries"]
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.get_max_retries(e):
+                    raise
+                backoff = min(s3_config["retry_max_backoff"],
+                              s3_config["retry_backoff"] * 2 ** attempt)
+                backoff = random.uniform(0, backoff)
+                attempt += 1
+                if config["transfer_metrics"] is not None:
+                    transfer_metrics.record_retry(
+                        getattr(func, "__name__", "unknown"))
+                logging.warning("%s failed: %s, retry %s in %.2f seconds" % (
+                    getattr(func, "__name__", func), e, attempt, backoff))
+                time.sleep(backoff)
+
+    def record_latency(self, name: str, latency: float) -> None:
+        with self.lock:
+            if name not in self.latencies:
+                self.latencies[name] = deque(maxlen=1000)
+            self.latencies[name].append(latency)
+
+    def get_hedge_timeout(self, name: str,
+                          size: Optional[int] = None) -> Optional[float]:
+        percentile = s3_config["hedge_percentile"]
+        if percentile is None:
+            return None
+        with self.lock:
+            latencies = sorted(self.latencies.get(name, []))
+        if len(latencies) < self.min_hedge_samples:
+            return None
+        i = min(int(len(latencies) * percentile / 100), len(latencies) - 1)
+        return latencies[i] * size if size is not None else latencies[i]
+
+    def hedge(self, name: str, func, release=None,
+              size: Optional[int] = None):
+        """
+        Call func, and call it again concurrently if the first call has not
+        returned within the hedge timeout since a worker started it and a
+        worker is idle, the result returned first is used, and release is
+        called with the result of the other call. Latencies are recorded
+        per byte if the size of the response is given
+        """
+        def timed(started=None):
+            start = time.time()
+            if started is not None:
+                started.set()
+            res = func()
+            latency = time.time() - start
+            self.record_latency(name, latency / size if size is not None
+                                else latency)
+            return res
+
+        # retries are counted by the name of the function
+        timed.__name__ = name
+
+        timeout = self.get_hedge_timeout(name, size)
+        if timeout is None:
+            return self.call(timed)
+        executor = get_hedge_executor()
+        started = threading.Event()
+        futures = [executor.submit(self.call, timed, started)]
+        # time waiting in the queue of the pool is not counted
+        started.wait()
+        done, _ = wait(futures, timeout=timeout)
+        if not done and executor.idle():
+            logging.debug("hedge %s after %.3f seconds" % (name, timeout))
+            futures.append(executor.submit(self.call, timed))
+        winner = None
+        pending = futures
+        while winner is None and pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in futures if f in done and
+                           f.exception() is None), None)
+        if winner is None:
+            return futures[0].result()
+
+        def release_result(f):
+            if f.exception() is None:
+                release(f.result())
+
+        if release is not None:
+            for f in futures:
+                if f is not winner:
+                    f.add_done_callback(release_result)
+        return winner.result()
+
+    def upload(self, key: str, path: str) -> None:
+        self.call(self.client.upload, key=key, path=path)
+
+    def download(self, key: str, path: str) -> None:
+        self.call(self.client.download, key=key, path=path)
+
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        return self.call(self.client.list, prefix=prefix,
+                         recursive=recursive)
+
+    def copy(self, src: str, dst: str) -> None:
+        self.call(self.client.copy, src, dst)
+
+    def get_md5(self, key: str) -> str:
+        return self.call(self.client.get_md5, key=key)
+
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        return self.call(self.client.list_with_meta, prefix=prefix,
+                         recursive=recursive)
+
+    def create_multipart_upload(self, key: str) -> str:
+        return self.call(self.client.create_multipart_upload, key)
+
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        return self.call(self.client.upload_part, key, upload_id,
+                         part_number, data)
+
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        return self.call(self.client.list_parts, key, upload_id)
+
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        self.call(self.client.complete_multipart_upload, key, upload_id,
+                  parts)
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.call(self.client.abort_multipart_upload, key, upload_id)
+
+    def copy_multipart(self, src: str, dst: str, size: int,
+                       max_concurrency: Optional[int] = None) -> None:
+        self.call(self.client.copy_multipart, src, dst, size,
+                  max_concurrency=max_concurrency)
+
+    # upload_stream is not retried as the stream cannot be read again
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        return self.hedge("download_range", partial(
+            self.client.download_range, key, start, end),
+            size=max(end - start, 1))
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        def open_stream():
+            cm = self.client.download_stream(key=key)
+            return cm, cm.__enter__()
+
+        cm, f = self.hedge("download_stream", open_stream,
+                           release=lambda res: res[0].__exit__(
+                               None, None, None))
         try:
-            shutil.copytree(src, dst, copy_function=func)
-        except FileExistsError:
-            pass
-    elif os.path.isfile(src):
-        func(src, dst)
-    else:
-        raise RuntimeError("File %s not found" % src)
+            yield f
+        except BaseException:
+            if not cm.__exit__(*sys.exc_info()):
+                raise
+        else:
+            cm.__exit__(None, None, None)
 
 
-def assemble_path_list(art_path, remove=False):
-    path_list = []
-    if os.path.isdir(art_path):
-        dflow_list = []
-        catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
-        if os.path.exists(catalog_dir):
-            for f in os.listdir(catalog_dir):
-                with open(os.path.join(catalog_dir, f), 'r') as fd:
-                    for item in jsonpickle.loads(fd.read())['path_list']:
-                        if item not in dflow_list:
-                            dflow_list.append(item)  # remove duplicate
-            if remove:
-                shutil.rmtree(catalog_dir)
-        if len(dflow_list) > 0:
-            path_list = list(map(lambda x: os.path.join(
-                art_path, x) if x is not None else None,
-                convert_dflow_list(dflow_list)))
-    return path_list
+class TokenBucket:
+    """
+    Token bucket limiting the rate of transferred bytes, the waiting
+    requests of higher priority are served first and those of the same
+    priority in order of arrival, a request larger than the burst is
+    admitted once the bucket is not empty and leaves it in debt
+
+    Args:
+        rate: bytes per second
+        burst: capacity of the bucket in bytes, one second of rate by
+            default
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else self.rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiters = []
+        self.seq = 0
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, n: int, priority: int = 0) -> None:
+        """
+        Wait until n bytes can be transferred
+        """
+        if n <= 0:
+            return
+        with self.cond:
+            ticket = (-priority, self.seq)
+            self.seq += 1
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    self.refill()
+                    if self.waiters[0] != ticket:
+                        self.cond.wait()
+                    elif self.tokens > 0:
+                        self.tokens -= n
+                        return
+                    else:
+                        self.cond.wait(-self.tokens / self.rate)
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+
+    def release(self, n: int) -> None:
+        """
+        Give back n bytes acquired but not transferred
+        """
+        if n <= 0:
+            return
+        with self.cond:
+            self.refill()
+            self.tokens = min(self.burst, self.tokens + n)
+            self.cond.notify_all()
+
+
+global_bucket = None
+global_bucket_lock = threading.Lock()
+
+
+def get_global_bucket() -> Optional[TokenBucket]:
+    """
+    Get the token bucket shared by the whole process for
+    s3_config["bandwidth_limit"], None if it is not set
+    """
+    global global_bucket
+    rate = s3_config["bandwidth_limit"]
+    if not rate:
+        return None
+    with global_bucket_lock:
+        if global_bucket is None or global_bucket.rate != rate:
+            global_bucket = TokenBucket(rate)
+        return global_bucket
+
+
+def resolve_bandwidth_limit(kwargs: dict) -> dict:
+    """
+    Replace the bandwidth limit in bytes per second of a call by a token
+    bucket, so that the nested helpers share the limit of the call
+    """
+    limit = kwargs.get("bandwidth_limit")
+    if limit is not None and not isinstance(limit, TokenBucket):
+        kwargs = dict(kwargs, bandwidth_limit=TokenBucket(limit))
+    return kwargs
+
+
+def with_throttle(
+        client: StorageClient,
+        bandwidth_limit: Union[float, TokenBucket, None] = None,
+        priority: int = 0,
+) -> StorageClient:
+    """
+    Wrap a storage client with ThrottledStorageClient if the global or the
+    given bandwidth limit is set
+    """
+    buckets = []
+    if get_global_bucket() is not None:
+        buckets.append(get_global_bucket())
+    if bandwidth_limit is not None:
+        if not isinstance(bandwidth_limit, TokenBucket):
+            bandwidth_limit = TokenBucket(bandwidth_limit)
+        buckets.append(bandwidth_limit)
+    if not buckets:
+        return client
+    return ThrottledStorageClient(client, buckets, priority)
+
+
+class CallbackReader:
+    """
+    File-like object calling a callback with the number of bytes read,
+    e.g. to acquire tokens or count bytes
+    """
+
+    def __init__(self, fileobj, callback: Callable[[int], None]) -> None:
+        self.fileobj = fileobj
+        self.callback = callback
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
 
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.callback(len(data))
+        return data
 
-def convert_dflow_list(dflow_list):
-    dflow_list.sort(key=lambda x: x['order'])
-    return list(map(lambda x: x['dflow_list_item'], dflow_list))
 
+class PrechargedReader(CallbackReader):
+    """
+    File-like object calling a callback with the number of bytes to read
+    before reading them in chunks, the bytes not read are given back by
+    calling refund, a short read is taken as the end of the stream which
+    is not charged
+    """
 
-def assemble_path_dict(art_path, remove=False):
-    path_dict = {}
-    if os.path.isdir(art_path):
-        dflow_list = []
-        catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
-        if os.path.exists(catalog_dir):
-            for f in os.listdir(catalog_dir):
-                with open(os.path.join(catalog_dir, f), 'r') as fd:
-                    for item in jsonpickle.loads(fd.read())['path_list']:
-                        if item not in dflow_list:
-                            dflow_list.append(item)  # remove duplicate
-            if remove:
-                shutil.rmtree(catalog_dir)
-        if len(dflow_list) > 0:
-            for item in dflow_list:
-                if item["dflow_list_item"] is None:
-                    path_dict[item["order"]] = None
-                else:
-                    path_dict[item["order"]] = os.path.join(
-                        art_path, item["dflow_list_item"])
-    return path_dict
+    chunk_size = 1 << 16
 
+    def __init__(self, fileobj, callback: Callable[[int], None],
+                 refund: Callable[[int], None]) -> None:
+        super().__init__(fileobj, callback)
+        self.refund = refund
+        self.eof = False
 
-def assemble_path_nested_dict(art_path, remove=False):
-    return expand(assemble_path_dict(art_path, remove))
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = None
+        chunks = []
+        while not self.eof and (size is None or size > 0):
+            n = self.chunk_size if size is None else min(
+                self.chunk_size, size)
+            self.callback(n)
+            chunk = self.fileobj.read(n)
+            self.refund(n - len(chunk))
+            chunks.append(chunk)
+            if len(chunk) < n:
+                self.eof = True
+            elif size is not None:
+                size -= n
+        return b"".join(chunks)
 
 
-def remove_empty_dir_tag(path):
-    for dn, ds, fs in os.walk(path, followlinks=True):
-        if ".empty_dir" in fs:
-            os.remove(os.path.join(dn, ".empty_dir"))
+class ThrottledStorageClient(StorageClientWrapper):
+    """
+    Wrapper of a storage client acquiring tokens from token buckets for the
+    bytes transferred before transferring them, whole files are throttled
+    as a unit with their listed sizes while parts, ranges and streams are
+    throttled as they are transferred
 
+    Args:
+        client: storage client to wrap
+        buckets: token buckets to acquire tokens from
+        priority: priority of the requests, higher first
+    """
 
-def randstr(length: int = 5) -> str:
-    return "".join(random.sample(string.digits + string.ascii_lowercase,
-                                 length))
+    def __init__(self, client: StorageClient, buckets: List[TokenBucket],
+                 priority: int = 0) -> None:
+        super().__init__(client)
+        self.buckets = buckets
+        self.priority = priority
 
+    def acquire(self, n: int) -> None:
+        for bucket in self.buckets:
+            bucket.acquire(n, self.priority)
 
-@contextlib.contextmanager
-def set_directory(dirname: os.PathLike, mkdir: bool = False):
-    """
-    Set current workding directory within context
+    def release(self, n: int) -> None:
+        for bucket in self.buckets:
+            bucket.release(n)
 
-    Parameters
-    ----------
-    dirname : os.PathLike
-        The directory path to change to
-    mkdir: bool
-        Whether make directory if `dirname` does not exist
+    def upload(self, key: str, path: str) -> None:
+        self.acquire(os.path.getsize(path))
+        self.client.upload(key=key, path=path)
 
-    Yields
-    ------
-    path: Path
-        The absolute path of the changed working directory
+    def download(self, key: str, path: str,
+                 size: Optional[int] = None) -> None:
+        """
+        Download an object whose size listed by the caller is charged
+        before the transfer, the size is charged after the transfer if it
+        is not given
+        """
+        if size is not None:
+            self.acquire(size)
+        self.client.download(key=key, path=path)
+        if size is None:
+            # the tokens of the download delay the next transfers
+            self.acquire(os.path.getsize(path))
 
-    Examples
-    --------
-    >>> with set_directory("some_path"):
-    ...    do_something()
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        self.acquire(len(data))
+        return self.client.upload_part(key, upload_id, part_number, data)
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        self.acquire(end - start)
+        return self.client.download_range(key, start, end)
+
+    def upload_stream(self, key: str, stream) -> None:
+        self.client.upload_stream(key, CallbackReader(stream, self.acquire))
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        with self.client.download_stream(key=key) as f:
+            yield PrechargedReader(f, self.acquire, self.release)
+
+
+def with_metrics(client: StorageClient) -> StorageClient:
     """
-    pwd = os.getcwd()
-    path = Path(dirname).resolve()
-    if mkdir:
-        path.mkdir(exist_ok=True, parents=True)
-    os.chdir(path)
-    yield path
-    os.chdir(pwd)
+    Wrap a storage client with InstrumentedStorageClient if
+    config["transfer_metrics"] is set, the wrapper is shared for the same
+    client
+    """
+    if config["transfer_metrics"] is None or isinstance(
+            client, InstrumentedStorageClient):
+        return client
+    with storage_client_cache_lock:
+        # the wrapper keeps the client alive so that its id is not reused
+        if id(client) not in metrics_client_cache:
+            metrics_client_cache[id(client)] = InstrumentedStorageClient(
+                client)
+        return metrics_client_cache[id(client)]
 
 
-def run_command(
-    cmd: Union[List[str], str],
-    raise_error: bool = True,
-    input: Optional[str] = None,
-    try_bash: bool = False,
-    interactive: bool = True,
-    print_oe: bool = False,
-    **kwargs,
-) -> Tuple[int, str, str]:
+class InstrumentedStorageClient(StorageClientWrapper):
+    """
+    Wrapper of a storage client recording the latency, bytes and objects
+    of each request in transfer_metrics
     """
-    Run shell command in subprocess
 
-    Parameters:
-    ----------
-    cmd: list of str, or str
-        Command to execute
-    raise_error: bool
-        Wheter to raise an error if the command failed
-    input: str, optional
-        Input string for the command
-    try_bash: bool
-        Try to use bash if bash exists, otherwise use sh
-    **kwargs:
-        Arguments in subprocess.Popen
+    def measure(self, op: str, func, size=None, objects: int = 0):
+        """
+        Call func and record it as a request of an operation, size is the
+        number of bytes transferred or a function of the result returning
+        it
+        """
+        start = time.time()
+        try:
+            res = func()
+        except Exception:
+            transfer_metrics.record(op, time.time() - start, error=True)
+            raise
+        nbytes = size(res) if callable(size) else size or 0
+        transfer_metrics.record(op, time.time() - start, nbytes, objects)
+        return res
 
-    Raises:
-    ------
-    AssertionError:
-        Raises if the error failed to execute and `raise_error` set to `True`
+    def upload(self, key: str, path: str) -> None:
+        self.measure("upload", partial(self.client.upload, key=key,
+                                       path=path),
+                     lambda _: os.path.getsize(path), 1)
 
-    Return:
-    ------
-    return_code: int
-        The return code of the command
-    out: str
-        stdout content of the executed command
-    err: str
-        stderr content of the executed command
-    """
-    if isinstance(cmd, str):
-        cmd = cmd.split()
-    elif isinstance(cmd, list):
-        cmd = [str(x) for x in cmd]
+    def download(self, key: str, path: str) -> None:
+        self.measure("download", partial(self.client.download, key=key,
+                                         path=path),
+                     lambda _: os.path.getsize(path), 1)
 
-    if try_bash:
-        arg = "-ic" if interactive else "-c"
-        script = "if command -v bash 2>&1 >/dev/null; then bash %s " % arg + \
-            shlex.quote(" ".join(cmd)) + "; else " + " ".join(cmd) + "; fi"
-        cmd = [script]
-        kwargs["shell"] = True
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        return self.measure("list", partial(
+            self.client.list, prefix=prefix, recursive=recursive))
 
-    with subprocess.Popen(
-        args=cmd,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        **kwargs,
-    ) as sub:
-        if input is not None:
-            sub.stdin.write(bytes(input, encoding=sys.stdout.encoding))
-            sub.stdin.close()
-        if print_oe:
-            out = ""
-            err = ""
-            sel = selectors.DefaultSelector()
-            sel.register(sub.stdout, selectors.EVENT_READ)
-            sel.register(sub.stderr, selectors.EVENT_READ)
-            ok = True
-            while ok:
-                for key, _ in sel.select():
-                    line = key.fileobj.readline().decode(sys.stdout.encoding)
-                    if not line:
-                        ok = False
-                        break
-                    if key.fileobj is sub.stdout:
-                        sys.stdout.write(line)
-                        out += line
-                    else:
-                        sys.stderr.write(line)
-                        err += line
-            sub.wait()
-        else:
-            out, err = sub.communicate()
-            out = out.decode(sys.stdout.encoding)
-            err = err.decode(sys.stdout.encoding)
-        return_code = sub.poll()
-    if raise_error:
-        assert return_code == 0, "Command %s failed: \n%s" % (cmd, err)
-    return return_code, out, err
+    def copy(self, src: str, dst: str) -> None:
+        self.measure("copy", partial(self.client.copy, src, dst),
+                     objects=1)
 
+    def get_md5(self, key: str) -> str:
+        return self.measure("get_md5", partial(self.client.get_md5,
+                                               key=key))
 
-def subclass_or_none(m, cls):
-    if inspect.isclass(m) and issubclass(m, cls) and m != cls:
-        return m
-    elif isinstance(m, cls) and m.__class__ != cls:
-        return m.__class__
-    else:
-        return None
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        return self.measure("list", partial(
+            self.client.list_with_meta, prefix=prefix, recursive=recursive))
 
+    def create_multipart_upload(self, key: str) -> str:
+        return self.measure("create_multipart_upload", partial(
+            self.client.create_multipart_upload, key))
 
-def find_subclass(pkg, cls):
-    subclasses = []
-    for _, m in inspect.getmembers(pkg):
-        s = subclass_or_none(m, cls)
-        if s is not None and s not in subclasses:
-            subclasses.append(m)
-    if hasattr(pkg, "__path__"):
-        for path in pkg.__path__:
-            for dir, _, _ in os.walk(path):
-                subpkg = (pkg.__name__ + dir[len(path):]).replace("/", ".")
-                for _, name, _ in pkgutil.iter_modules([dir]):
-                    try:
-                        mod = __import__(subpkg + "." + name, fromlist=subpkg)
-                        for _, m in inspect.getmembers(mod):
-                            s = subclass_or_none(m, cls)
-                            if s is not None and s not in subclasses:
-                                subclasses.append(s)
-                    except Exception as e:
-                        logging.warning("Fail to inspect submodule %s: %s" % (
-                            name, e))
-    return subclasses
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        return self.measure("upload_part", partial(
+            self.client.upload_part, key, upload_id, part_number, data),
+            len(data))
 
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        return self.measure("list_parts", partial(
+            self.client.list_parts, key, upload_id))
 
-def linktree(src, dst, func=os.symlink):
-    merge_dir(src, dst, partial(force_link, func=func))
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        self.measure("complete_multipart_upload", partial(
+            self.client.complete_multipart_upload, key, upload_id, parts),
+            objects=1)
 
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.measure("abort_multipart_upload", partial(
+            self.client.abort_multipart_upload, key, upload_id))
 
-def force_link(src, dst, func=os.symlink):
-    if os.path.exists(dst):
-        if os.path.samefile(src, dst):
-            return
-        os.remove(dst)
-    func(src, dst)
+    def copy_multipart(self, src: str, dst: str, size: int,
+                       max_concurrency: Optional[int] = None) -> None:
+        self.measure("copy", partial(
+            self.client.copy_multipart, src, dst, size,
+            max_concurrency=max_concurrency), size, 1)
 
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        return self.measure("download_range", partial(
+            self.client.download_range, key, start, end), len)
 
-class StorageClient(ABC):
+    def upload_stream(self, key: str, stream) -> None:
+        nbytes = [0]
+
+        def count(n):
+            nbytes[0] += n
+
+        self.measure("upload_stream", partial(
+            self.client.upload_stream, key, CallbackReader(stream, count)),
+            lambda _: nbytes[0], 1)
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        nbytes = [0]
+
+        def count(n):
+            nbytes[0] += n
+
+        start = time.time()
+        try:
+            with self.client.download_stream(key=key) as f:
+                yield CallbackReader(f, count)
+        except Exception:
+            transfer_metrics.record("download_stream", time.time() - start,
+                                    nbytes[0], error=True)
+            raise
+        transfer_metrics.record("download_stream", time.time() - start,
+                                nbytes[0], 1)
+
+
+class AsyncStorageClient(ABC):
+    """
+    Storage client for asyncio, whose methods are coroutines with the same
+    arguments as those of StorageClient
+    """
     @abc.abstractmethod
-    def upload(self, key: str, path: str) -> None:
+    async def upload(self, key: str, path: str) -> None:
         pass
 
     @abc.abstractmethod
-    def download(self, key: str, path: str) -> None:
+    async def download(self, key: str, path: str) -> None:
         pass
 
     @abc.abstractmethod
-    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+    async def list(self, prefix: str, recursive: bool = False) -> List[str]:
         pass
 
     @abc.abstractmethod
-    def copy(self, src: str, dst: str) -> None:
+    async def copy(self, src: str, dst: str) -> None:
         pass
 
     @abc.abstractmethod
-    def get_md5(self, key: str) -> str:
+    async def get_md5(self, key: str) -> str:
         pass
 
 
+async_executor = None
+async_executor_lock = threading.Lock()
+
+
+def get_async_executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool shared by async storage helpers, whose size is
+    s3_config["async_workers"]
+    """
+    global async_executor
+    with async_executor_lock:
+        if async_executor is None:
+            async_executor = ThreadPoolExecutor(
+                max_workers=s3_config["async_workers"],
+                thread_name_prefix="dflow_async")
+        return async_executor
+
+
+async def run_in_async_executor(func, *args, **kwargs):
+    """
+    Run a blocking function in the shared thread pool without blocking the
+    event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(),
+                                      partial(func, *args, **kwargs))
+
+
+class ThreadPoolStorageClient(AsyncStorageClient):
+    """
+    Adapter of a storage client for asyncio, which runs the blocking calls
+    in the thread pool shared by async storage helpers
+    """
+
+    def __init__(self, client: StorageClient) -> None:
+        self.client = client
+
+    async def upload(self, key: str, path: str) -> None:
+        await run_in_async_executor(self.client.upload, key=key, path=path)
+
+    async def download(self, key: str, path: str) -> None:
+        await run_in_async_executor(self.client.download, key=key,
+                                    path=path)
+
+    async def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        return await run_in_async_executor(self.client.list, prefix=prefix,
+                                           recursive=recursive)
+
+    async def copy(self, src: str, dst: str) -> None:
+        await run_in_async_executor(self.client.copy, src, dst)
+
+    async def get_md5(self, key: str) -> str:
+        return await run_in_async_executor(self.client.get_md5, key=key)
+
+
+def get_async_storage_client(**kwargs) -> AsyncStorageClient:
+    """
+    Get the async storage client, s3_config["async_storage_client"] if it
+    is set, otherwise the storage client wrapped in the shared thread pool
+    """
+    if s3_config["async_storage_client"] is not None:
+        return s3_config["async_storage_client"]
+    return ThreadPoolStorageClient(get_storage_client(**kwargs))
+
+
+# multipart requests of MinioClient call private methods of minio whose
+# signatures are checked with the versions in this range
+minio_multipart_versions = ((7, 2), (8, 0))
+
+
+def minio_supports_multipart() -> bool:
+    """
+    Whether the private multipart methods of the installed minio are those
+    checked, MinioClient transfers large objects in single requests and
+    copies them by the public compose_object otherwise
+    """
+    import minio
+    try:
+        version = tuple(int(v) for v in minio.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    low, high = minio_multipart_versions
+    return low <= version < high
+
+
 class MinioClient(StorageClient):
+
     def __init__(self,
                  endpoint: Optional[str] = None,
                  access_key: Optional[str] = None,
                  secret_key: Optional[str] = None,
                  secure: Optional[bool] = None,
                  bucket_name: Optional[str] = None,
+                 pool_size: Optional[int] = None,
+                 keep_alive: Optional[bool] = None,
+                 part_size: Optional[int] = None,
+                 max_concurrency: Optional[int] = None,
                  **kwargs,
                  ) -> None:
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        if pool_size is None:
+            pool_size = s3_config["pool_size"]
+        if pool_size is None:
+            # one connection for each concurrent transfer
+            pool_size = max(10, s3_config["max_concurrency"])
+        if keep_alive is None:
+            keep_alive = s3_config["keep_alive"]
+        self.endpoint = endpoint if endpoint is not None else \
+            s3_config["endpoint"]
         self.client = Minio(
-            endpoint=endpoint if endpoint is not None else
-            s3_config["endpoint"],
+            endpoint=self.endpoint,
             access_key=access_key if access_key is not None else
             s3_config["access_key"],
             secret_key=secret_key if secret_key is not None else
             s3_config["secret_key"],
             secure=secure if secure is not None else s3_config["secure"],
+            http_client=self.new_http_client(pool_size, keep_alive),
         )
         self.bucket_name = bucket_name if bucket_name is not None else \
             s3_config["bucket_name"]
+        self.resumable = minio_supports_multipart()
+        if not self.resumable:
+            import minio
+            logging.warning("Multipart transfers are disabled for minio %s,"
+                            " which is not in the supported range" %
+                            minio.__version__)
+
+    @staticmethod
+    def new_http_client(pool_size: int, keep_alive: bool):
+        import socket
+
+        import certifi
+        import urllib3
+        from urllib3.connection import HTTPConnection
+        socket_options = list(HTTPConnection.default_socket_options)
+        if keep_alive:
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        timeout = 300
+        return urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            maxsize=pool_size,
+            block=False,
+            socket_options=socket_options,
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(
+                total=5,
+                backoff_factor=0.2,
+                status_forcelist=[500, 502, 503, 504],
+            ),
+        )
 
     def upload(self, key: str, path: str) -> None:
         self.client.fput_object(bucket_name=self.bucket_name,
                                 object_name=key, file_path=path)
 
+    def upload_stream(self, key: str, stream) -> None:
+        self.client.put_object(bucket_name=self.bucket_name,
+                               object_name=key, data=stream, length=-1,
+                               part_size=s3_config["part_size"])
+
+    @contextlib.contextmanager
+    def download_stream(self, key: str):
+        response = self.client.get_object(bucket_name=self.bucket_name,
+                                          object_name=key)
+        try:
+            yield response
+        finally:
+            response.close()
+            response.release_conn()
+
+    def download_range(self, key: str, start: int, end: int) -> bytes:
+        response = self.client.get_object(bucket_name=self.bucket_name,
+                                          object_name=key, offset=start,
+                                          length=end - start)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
     def download(self, key: str, path: str) -> None:
         self.client.fget_object(bucket_name=self.bucket_name,
                                 object_name=key, file_path=path)
@@ -772,10 +4502,77 @@ class MinioClient(StorageClient):
         return [obj.object_name for obj in self.client.list_objects(
             bucket_name=self.bucket_name, prefix=prefix, recursive=recursive)]
 
+    def list_with_meta(self, prefix: str,
+                       recursive: bool = False) -> List[dict]:
+        return [{"key": obj.object_name, "etag": obj.etag.strip('"') if
+                 obj.etag else None, "size": obj.size}
+                for obj in self.client.list_objects(
+                    bucket_name=self.bucket_name, prefix=prefix,
+                    recursive=recursive)]
+
     def copy(self, src: str, dst: str) -> None:
         self.client.copy_object(self.bucket_name, dst,
                                 CopySource(self.bucket_name, src))
 
+    def create_multipart_upload(self, key: str) -> str:
+        return self.client._create_multipart_upload(
+            self.bucket_name, key,
+            {"Content-Type": "application/octet-stream"})
+
+    def upload_part(self, key: str, upload_id: str, part_number: int,
+                    data: bytes) -> str:
+        return self.client._upload_part(self.bucket_name, key, data, None,
+                                        upload_id, part_number)
+
+    def list_parts(self, key: str, upload_id: str) -> Dict[int, str]:
+        parts = {}
+        marker = None
+        while True:
+            r = self.client._list_parts(self.bucket_name, key, upload_id,
+                                        part_number_marker=marker)
+            for part in r.parts:
+                parts[part.part_number] = part.etag
+            if not r.is_truncated:
+                break
+            marker = r.next_part_number_marker
+        return parts
+
+    def complete_multipart_upload(self, key: str, upload_id: str,
+                                  parts: List[Tuple[int, str]]) -> None:
+        from minio.datatypes import Part
+        self.client._complete_multipart_upload(
+            self.bucket_name, key, upload_id, [Part(n, etag)
+                                               for n, etag in parts])
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client._abort_multipart_upload(self.bucket_name, key, upload_id)
+
+    def copy_multipart(self, src: str, dst: str, size: int,
+                       max_concurrency: Optional[int] = None) -> None:
+        if not self.resumable:
+            from minio.commonconfig import ComposeSource
+            self.client.compose_object(self.bucket_name, dst, [
+                ComposeSource(self.bucket_name, src)])
+            return
+        upload_id = self.create_multipart_upload(dst)
+        headers = CopySource(self.bucket_name, src).gen_copy_headers()
+
+        def copy_part(part_number, start, end):
+            etag, _ = self.client._upload_part_copy(
+                self.bucket_name, dst, upload_id, part_number, dict(
+                    headers, **{"x-amz-copy-source-range": "bytes=%s-%s" % (
+                        start, end - 1)}))
+            return part_number, etag
+
+        tasks = [{"part_number": i + 1, "start": start, "end": end}
+                 for i, (start, end) in enumerate(get_copy_ranges(size))]
+        try:
+            parts = parallel_transfer(copy_part, tasks, max_concurrency)
+            self.complete_multipart_upload(dst, upload_id, parts)
+        except Exception:
+            self.abort_multipart_upload(dst, upload_id)
+            raise
+
     def get_md5(self, key: str) -> str:
         return self.client.stat_object(bucket_name=self.bucket_name,
                                        object_name=key).etag
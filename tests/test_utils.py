@@ -0,0 +1,1094 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+import pytest
+from dflow import (S3Artifact, Step, async_copy_artifact,
+                   async_download_artifact, async_upload_artifact, config,
+                   copy_artifact, download_artifact, download_s3,
+                   path_list_of_artifact, s3_config, upload_artifact,
+                   upload_s3)
+from dflow.common import HTTPArtifact
+from dflow.python import OP, OPIO, Artifact, OPIOSign, PythonOPTemplate
+from dflow.python.utils import handle_input_artifact
+from dflow.utils import (AsyncStorageClient, MinioClient, PipeStream,
+                         StorageClient, ThrottledStorageClient, TokenBucket,
+                         archive_marker, async_copy_s3, async_download_s3,
+                         async_upload_s3, cache_stats, catalog_of_artifact,
+                         choose_archive, clean_checkpoints,
+                         clear_storage_client_cache, compact_catalog, copy_s3,
+                         download_file, get_archive_codec, get_copy_ranges,
+                         get_hedge_executor, get_md5, get_multipart_etag,
+                         get_object_cache, get_storage_client,
+                         get_transfer_metrics, invalidate_catalog_cache,
+                         match_etag, minio_supports_multipart,
+                         parallel_transfer, reset_transfer_metrics, write_tar)
+
+
+class DictStorageClient(StorageClient):
+    def __init__(self, latency=0.0):
+        self.objects = {}
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def upload(self, key: str, path: str) -> None:
+        time.sleep(self.latency)
+        with open(path, "rb") as f:
+            data = f.read()
+        with self.lock:
+            self.objects[key] = data
+
+    def download(self, key: str, path: str) -> None:
+        time.sleep(self.latency)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.objects[key])
+
+    def list(self, prefix: str, recursive: bool = False) -> List[str]:
+        return sorted(k for k in self.objects if k.startswith(prefix))
+
+    def copy(self, src: str, dst: str) -> None:
+        self.objects[dst] = self.objects[src]
+
+    def get_md5(self, key: str) -> str:
+        import hashlib
+        return hashlib.md5(self.objects[key]).hexdigest()
+
+
+@pytest.fixture
+def storage_client(tmp_path, monkeypatch):
+    client = DictStorageClient(latency=0.01)
+    monkeypatch.setitem(s3_config, "storage_client", client)
+    monkeypatch.chdir(tmp_path)
+    return client
+
+
+def test_concurrent_upload_download(storage_client):
+    os.makedirs("data/sub", exist_ok=True)
+    for i in range(50):
+        with open("data/sub/%s.txt" % i, "w") as f:
+            f.write(str(i))
+    key = upload_s3("data", max_concurrency=8)
+    assert len(storage_client.list(key)) == 50
+    download_s3(key, path="out", max_concurrency=8)
+    for i in range(50):
+        with open("out/sub/%s.txt" % i, "r") as f:
+            assert f.read() == str(i)
+    shutil.rmtree("out")
+
+
+def test_parallel_transfer_error_order():
+    def func(i):
+        if i in [3, 7]:
+            raise ValueError("failed %s" % i)
+
+    with pytest.raises(ValueError, match="failed 3") as e:
+        parallel_transfer(func, [{"i": i} for i in range(10)],
+                          max_concurrency=1)
+    # the error of the storage client is raised unchanged
+    assert type(e.value) is ValueError
+    with pytest.raises(ValueError, match="failed 3"):
+        parallel_transfer(func, [{"i": i} for i in range(10)],
+                          max_concurrency=10)
+
+
+def test_storage_client_cache(monkeypatch):
+    monkeypatch.setitem(s3_config, "storage_client", None)
+    clear_storage_client_cache()
+    client = get_storage_client()
+    assert get_storage_client() is client
+    assert get_storage_client(bucket_name="another-bucket") is not client
+    clear_storage_client_cache()
+    assert get_storage_client() is not client
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_upload_artifact_stream(storage_client, stream):
+    os.makedirs("foo", exist_ok=True)
+    with open("foo/bar.txt", "w") as f:
+        f.write("bar")
+    art = upload_artifact(["foo"], archive="tar")
+    assert art.key.endswith(".tgz")
+    assert download_artifact(art, path="out", stream=stream) == ["out/foo"]
+    with open("out/foo/bar.txt", "r") as f:
+        assert f.read() == "bar"
+    assert os.listdir("out") == ["foo"]
+
+
+def test_pipe_stream_error():
+    def write(f):
+        f.write(b"foo")
+        raise ValueError("broken")
+
+    stream = PipeStream(write)
+    with pytest.raises(ValueError, match="broken"):
+        while stream.read(2):
+            pass
+    stream.close()
+
+
+@pytest.mark.parametrize("archive", ["tar", "zstd", "lz4"])
+def test_archive_codecs(storage_client, archive):
+    pytest.importorskip({"tar": "gzip", "zstd": "zstandard",
+                         "lz4": "lz4"}[archive])
+    os.makedirs("foo", exist_ok=True)
+    with open("foo/bar.txt", "w") as f:
+        f.write("bar")
+    art = upload_artifact(["foo"], archive=archive)
+    assert get_archive_codec(art.key) == archive
+    assert download_artifact(art, path="out") == ["out/foo"]
+    with open("out/foo/bar.txt", "r") as f:
+        assert f.read() == "bar"
+
+
+@pytest.mark.parametrize("archive", ["zstd", "lz4"])
+def test_handle_archived_input_artifact(storage_client, archive):
+    pytest.importorskip({"zstd": "zstandard", "lz4": "lz4"}[archive])
+    os.makedirs("foo", exist_ok=True)
+    with open("foo/bar.txt", "w") as f:
+        f.write("bar")
+    art = upload_artifact(["foo"], archive=archive)
+    # Argo places tarballs not gzipped at the artifact path as files
+    os.makedirs("root/inputs/artifacts", exist_ok=True)
+    storage_client.download(art.key, "root/inputs/artifacts/foo")
+    path = handle_input_artifact("foo", Artifact(str), data_root="root")
+    assert path == "root/inputs/artifacts/foo/foo"
+    with open(os.path.join(path, "bar.txt"), "r") as f:
+        assert f.read() == "bar"
+
+    # a tarball of the user uploaded as a file is kept
+    with open("bar.tar", "wb") as f:
+        write_tar("foo", f, archive)
+    with open("bar.tar", "rb") as f:
+        data = f.read()
+    assert data.startswith(archive_marker)
+    with open("root/inputs/artifacts/bar", "wb") as f:
+        f.write(data[len(archive_marker):])
+    path = handle_input_artifact("bar", Artifact(str), data_root="root")
+    assert os.path.isfile(path)
+
+
+@pytest.mark.parametrize("materialize", [True, False])
+def test_content_addressed_upload(storage_client, monkeypatch, materialize):
+    os.makedirs("foo", exist_ok=True)
+    for name in ["a.txt", "b.txt"]:
+        with open("foo/%s" % name, "w") as f:
+            f.write("same")
+    art = upload_artifact(["foo"], content_addressed=True,
+                          materialize=materialize)
+    blobs = storage_client.list(s3_config["prefix"] + "blobs/")
+    # one for the identical files and one for the catalog
+    assert len(blobs) == 2
+    files = [k for k in storage_client.objects if k.startswith(art.key) and
+             k.endswith(".txt")]
+    assert len(files) == (2 if materialize else 0)
+    prefixes = []
+    list_ = storage_client.list
+    monkeypatch.setattr(storage_client, "list", lambda prefix, **kwargs: (
+        prefixes.append(prefix), list_(prefix, **kwargs))[1])
+    upload_artifact(["foo"], content_addressed=True, materialize=materialize)
+    assert storage_client.list(s3_config["prefix"] + "blobs/") == blobs
+    # blobs are checked by their own keys instead of listing their shards
+    assert not any(p.endswith("/") and "/blobs/" in "/" + p
+                   for p in prefixes[:-1])
+    assert download_artifact(art, path="out") == ["out/foo"]
+    for name in ["a.txt", "b.txt"]:
+        with open("out/foo/%s" % name, "r") as f:
+            assert f.read() == "same"
+
+
+def test_object_cache(storage_client, monkeypatch, tmp_path):
+    monkeypatch.setitem(s3_config, "cache_dir", str(tmp_path / "cache"))
+    os.makedirs("foo", exist_ok=True)
+    for i in range(3):
+        with open("foo/%s.txt" % i, "w") as f:
+            f.write("12345")
+    key = upload_s3("foo")
+    download_s3(key, path="out1")
+    download_s3(key, path="out2")
+    stats = cache_stats()
+    assert stats["misses"] == 3 and stats["hits"] == 3
+    with open("out2/0.txt", "r") as f:
+        assert f.read() == "12345"
+
+    monkeypatch.setitem(s3_config, "cache_size", 10)
+    download_s3(upload_s3("foo"), path="out3")
+    stats = cache_stats()
+    assert stats["evictions"] > 0 and stats["size"] <= 10
+
+
+def test_match_etag(tmp_path):
+    fpath = str(tmp_path / "foo.dat")
+    with open(fpath, "wb") as f:
+        f.write(os.urandom(12 * 1024 * 1024))
+    assert match_etag(fpath, '"%s"' % get_md5(fpath))
+    etag = get_multipart_etag(fpath, 5 * 1024 * 1024)
+    assert etag.endswith("-3")
+    assert match_etag(fpath, etag)
+    assert not match_etag(fpath, "0" * 32 + "-3")
+
+
+def test_download_skip_exists(storage_client, monkeypatch):
+    os.makedirs("foo", exist_ok=True)
+    with open("foo/bar.txt", "w") as f:
+        f.write("bar")
+    key = upload_s3("foo")
+    download_s3(key, path="out")
+    downloaded = []
+    download = storage_client.download
+    monkeypatch.setattr(storage_client, "download", lambda key, path: (
+        downloaded.append(key), download(key, path)))
+    download_s3(key, path="out", skip_exists=True)
+    assert downloaded == []
+    with open("out/bar.txt", "w") as f:
+        f.write("baz")
+    download_s3(key, path="out", skip_exists=True)
+    assert len(downloaded) == 1
+
+
+def test_catalog_of_artifact(storage_client):
+    for name in ["foo.txt", "bar.txt"]:
+        with open(name, "w"):
+            pass
+    art_1 = upload_artifact(["foo.txt"], archive=None)
+    art_2 = upload_artifact(["bar.txt"], archive=None)
+    assert path_list_of_artifact(art_2) == ["bar.txt"]
+    copy_artifact(art_1, art_2, sort=True)
+    assert path_list_of_artifact(art_2) == ["bar.txt", "foo.txt"]
+    catalog = catalog_of_artifact(art_2)
+    catalog[0]["order"] = 100
+    assert path_list_of_artifact(art_2) == ["bar.txt", "foo.txt"]
+
+
+def test_compact_catalog(storage_client, monkeypatch):
+    with open("foo.txt", "w"):
+        pass
+    art = upload_artifact(["foo.txt"], archive=None)
+    for i in range(1, 4):
+        copy_artifact(upload_artifact(["foo.txt"], archive=None), art,
+                      sort=True)
+    assert len(catalog_of_artifact(art)) == 4
+    compact_catalog(art)
+    prefix = art.key + "/" + config["catalog_dir_name"] + "/"
+    manifest = prefix + config["catalog_manifest_name"]
+    assert manifest in storage_client.list(prefix)
+    read = []
+    download = storage_client.download
+    monkeypatch.setattr(storage_client, "download", lambda key, path: (
+        read.append(key), download(key, path)))
+    invalidate_catalog_cache()
+    assert path_list_of_artifact(art) == ["foo.txt"] * 4
+    assert read == [manifest]
+
+
+def test_catalog_cache_per_storage(storage_client, monkeypatch):
+    for name in ["a.txt", "b.txt"]:
+        with open(name, "w") as f:
+            f.write(name)
+    art = upload_artifact(["a.txt"], archive=None)
+    assert path_list_of_artifact(art) == ["a.txt"]
+    other = DictStorageClient()
+    monkeypatch.setitem(s3_config, "storage_client", other)
+    key = upload_artifact(["b.txt"], archive=None).key
+    # the same key in another storage
+    for k in list(other.objects):
+        other.objects[art.key + k[len(key):]] = other.objects.pop(k)
+    assert get_storage_client().storage_id != \
+        ThrottledStorageClient(storage_client, []).storage_id
+    assert path_list_of_artifact(art) == ["b.txt"]
+
+
+def test_indexed_archive(storage_client, monkeypatch):
+    os.makedirs("foo/bar", exist_ok=True)
+    for name in ["foo/a.txt", "foo/bar/b.txt", "c.txt"]:
+        with open(name, "w") as f:
+            f.write(name)
+    art = upload_artifact(["c.txt", "foo"], archive="indexed")
+    assert path_list_of_artifact(art) == ["c.txt", "foo"]
+    ranges = []
+    download_range = storage_client.download_range
+    monkeypatch.setattr(storage_client, "download_range", lambda **kw: (
+        ranges.append(kw), download_range(**kw))[1])
+    assert download_artifact(art, slice=1, path="out") == "out/foo"
+    assert len(ranges) == 1
+    assert sorted(os.listdir("out")) == ["foo"]
+    with open("out/foo/bar/b.txt", "r") as f:
+        assert f.read() == "foo/bar/b.txt"
+    # the archive is still a valid .tgz
+    assert download_artifact(art, path="all") == ["all/c.txt", "all/foo"]
+    with open("all/foo/a.txt", "r") as f:
+        assert f.read() == "foo/a.txt"
+
+
+def test_indexed_archive_windows(storage_client, monkeypatch):
+    os.makedirs("foo", exist_ok=True)
+    data = {}
+    for i in range(5):
+        data[i] = os.urandom(10000)
+        with open("foo/%s.bin" % i, "wb") as f:
+            f.write(data[i])
+    art = upload_artifact(["foo"], archive="indexed")
+    monkeypatch.setitem(s3_config, "part_size", 4096)
+    ranges = []
+    download_range = storage_client.download_range
+    monkeypatch.setattr(storage_client, "download_range", lambda **kw: (
+        ranges.append(kw), download_range(**kw))[1])
+    assert download_artifact(art, slice=0, path="out") == "out/foo"
+    # the coalesced ranges are capped and fetched in windows
+    assert max(r["end"] - r["start"] for r in ranges) <= 4096
+    for i in range(5):
+        with open("out/foo/%s.bin" % i, "rb") as f:
+            assert f.read() == data[i]
+
+
+@pytest.mark.parametrize("archive", [None, "indexed"])
+def test_download_slices(storage_client, monkeypatch, archive):
+    for i in range(5):
+        os.makedirs("foo%s" % i, exist_ok=True)
+        with open("foo%s/bar.txt" % i, "w") as f:
+            f.write(str(i))
+    art = upload_artifact(["foo%s" % i for i in range(5)], archive=archive)
+    read = []
+    download = storage_client.download
+    monkeypatch.setattr(storage_client, "download", lambda key, path: (
+        read.append(key), download(key, path)))
+    assert download_artifact(art, slices=[1, 3], path="out") == [
+        "out/foo1", "out/foo3"]
+    assert sorted(os.listdir("out")) == ["foo1", "foo3"]
+    with open("out/foo3/bar.txt", "r") as f:
+        assert f.read() == "3"
+    assert not any(k.endswith("foo0/bar.txt") for k in read)
+
+
+def test_copy_s3(storage_client, monkeypatch):
+    os.makedirs("foo", exist_ok=True)
+    for i in range(20):
+        with open("foo/%s.txt" % i, "w") as f:
+            f.write("x" * i)
+    key = upload_s3("foo")
+    copied = []
+    monkeypatch.setattr(storage_client, "max_copy_size", 10)
+    monkeypatch.setattr(
+        storage_client, "list_with_meta", lambda prefix, **kw: [
+            {"key": k, "size": len(storage_client.objects[k])}
+            for k in storage_client.list(prefix)])
+    monkeypatch.setattr(
+        storage_client, "copy_multipart", lambda src, dst, size, **kw: (
+            copied.append(src), storage_client.copy(src, dst)))
+    copy_s3(key, "bar", max_concurrency=4)
+    assert len(storage_client.list("bar/")) == 20
+    assert len(copied) == 9
+    assert get_copy_ranges(1 << 30) == [(0, 1 << 29), (1 << 29, 1 << 30)]
+
+
+def test_concat_artifacts(storage_client):
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        with open(name, "w") as f:
+            f.write(name)
+    art_1 = upload_artifact(["a.txt", "b.txt"], archive=None)
+    art_2 = upload_artifact(["c.txt"], archive=None)
+    n_objs = len(storage_client.objects)
+    art = S3Artifact.concat([art_1, art_2])
+    assert len(storage_client.objects) == n_objs + 1
+    assert path_list_of_artifact(S3Artifact(key=art.key)) == [
+        "a.txt", "b.txt", "c.txt"]
+    assert download_artifact(art, path="out") == [
+        "out/a.txt", "out/b.txt", "out/c.txt"]
+    assert download_artifact(art, slice=2, path="out2") == "out2/c.txt"
+    assert os.listdir("out2") == ["c.txt"]
+    nested = S3Artifact.concat([art, art_1])
+    assert nested.parts == [art_1.key, art_2.key, art_1.key]
+    assert path_list_of_artifact(nested)[-2:] == ["a.txt", "b.txt"]
+
+
+class Cat(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({"foo": Artifact(List[str])})
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign()
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        return OPIO()
+
+
+def test_concat_artifact_step_input(storage_client, monkeypatch):
+    for name in ["a.txt", "b.txt"]:
+        with open(name, "w") as f:
+            f.write(name)
+    art_1 = upload_artifact(["a.txt"], archive=None)
+    art_2 = upload_artifact(["b.txt"], archive=None)
+    art = S3Artifact(key=S3Artifact.concat([art_1, art_2]).key)
+    read = []
+    download_stream = storage_client.download_stream
+    monkeypatch.setattr(storage_client, "download_stream", lambda key: (
+        read.append(key), download_stream(key))[1])
+    step = Step(name="cat", template=PythonOPTemplate(Cat),
+                artifacts={"foo": art})
+    # the parts are not read when the workflow is built
+    assert read == []
+    arts = [a for a in step.convert_to_argo().arguments.artifacts
+            if a.name.startswith("dflow_foo")]
+    assert [a.name for a in arts] == ["dflow_foo_0", "dflow_foo_1"]
+    assert [a.s3.key for a in arts] == [art_1.key, art_2.key]
+    assert step.template.n_parts["foo"] == 2
+
+
+class MultipartStorageClient(DictStorageClient):
+    resumable = True
+    part_size = 10
+
+    def __init__(self):
+        super().__init__()
+        self.uploads = {}
+        self.aborted = []
+        self.failures = set()
+        self.error = ConnectionError
+        self.requests = []
+
+    def create_multipart_upload(self, key):
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self.requests.append(part_number)
+        if part_number in self.failures:
+            raise self.error("part %s failed" % part_number)
+        self.uploads[upload_id][part_number] = data
+        return str(part_number)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.aborted.append(upload_id)
+
+    def list_parts(self, key, upload_id):
+        return {n: str(n) for n in self.uploads[upload_id]}
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.objects[key] = b"".join(self.uploads[upload_id][n]
+                                     for n, _ in parts)
+
+    def list_with_meta(self, prefix, recursive=False):
+        return [{"key": k, "etag": self.get_md5(k),
+                 "size": len(self.objects[k])} for k in self.list(prefix)]
+
+    def download_range(self, key, start, end):
+        self.requests.append(start // self.part_size + 1)
+        if start // self.part_size + 1 in self.failures:
+            raise ConnectionError("range %s failed" % start)
+        return self.objects[key][start:end]
+
+
+def test_resumable_transfer(tmp_path, monkeypatch):
+    client = MultipartStorageClient()
+    monkeypatch.setitem(s3_config, "storage_client", client)
+    monkeypatch.setitem(s3_config, "multipart_threshold", 20)
+    monkeypatch.setitem(s3_config, "checkpoint_dir", str(tmp_path / "ckpt"))
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(95)
+    with open("foo.dat", "wb") as f:
+        f.write(data)
+    client.failures = {7}
+    client.max_concurrency = 1
+    with pytest.raises(ConnectionError, match="part 7 failed"):
+        upload_s3("foo.dat", key="foo.dat")
+    client.failures = set()
+    client.requests = []
+    client.max_concurrency = None
+    upload_s3("foo.dat", key="foo.dat")
+    assert sorted(client.requests) == [7, 8, 9, 10]
+    assert client.objects["foo.dat"] == data
+
+    client.failures = {4}
+    client.max_concurrency = 1
+    with pytest.raises(ConnectionError, match="range 30 failed"):
+        download_s3("foo.dat", path="out")
+    client.failures = set()
+    client.max_concurrency = None
+    client.requests = []
+    download_s3("foo.dat", path="out")
+    assert sorted(client.requests) == [4, 5, 6, 7, 8, 9, 10]
+    with open("out/foo.dat", "rb") as f:
+        assert f.read() == data
+    assert os.listdir("out") == ["foo.dat"]
+    assert os.listdir(tmp_path / "ckpt") == []
+
+
+def test_resumable_cached_download(tmp_path, monkeypatch):
+    client = MultipartStorageClient()
+    monkeypatch.setitem(s3_config, "storage_client", client)
+    monkeypatch.setitem(s3_config, "multipart_threshold", 20)
+    monkeypatch.setitem(s3_config, "checkpoint_dir", str(tmp_path / "ckpt"))
+    monkeypatch.setitem(s3_config, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(95)
+    client.objects["foo.dat"] = data
+    client.failures = {4}
+    client.max_concurrency = 1
+    with pytest.raises(ConnectionError, match="range 30 failed"):
+        download_s3("foo.dat", path="out")
+    client.failures = set()
+    client.max_concurrency = None
+    client.requests = []
+    download_s3("foo.dat", path="out")
+    # the partial file of the cache entry is resumed
+    assert sorted(client.requests) == [4, 5, 6, 7, 8, 9, 10]
+    with open("out/foo.dat", "rb") as f:
+        assert f.read() == data
+    assert os.listdir(tmp_path / "ckpt") == []
+    assert [f for f in os.listdir(tmp_path / "cache")
+            if not f.endswith(".lock.tmp")] == [
+        os.path.basename(get_object_cache().entry_path(
+            "foo.dat", client.get_md5("foo.dat")))]
+
+    # the partial file is removed if the download is given up
+    client.objects["bar.dat"] = data
+    client.download_range = lambda key, start, end: (_ for _ in ()).throw(
+        PermissionError("denied"))
+    with pytest.raises(PermissionError):
+        download_s3("bar.dat", path="out")
+    assert os.listdir(tmp_path / "ckpt") == []
+    assert not any(f.endswith(".partial.tmp")
+                   for f in os.listdir(tmp_path / "cache"))
+
+
+def test_resumable_upload_artifact(tmp_path, monkeypatch):
+    client = MultipartStorageClient()
+    client.part_size = 100
+    monkeypatch.setitem(s3_config, "storage_client", client)
+    # the catalog is uploaded in a single request
+    monkeypatch.setitem(s3_config, "multipart_threshold", 200)
+    monkeypatch.setitem(s3_config, "checkpoint_dir", str(tmp_path / "ckpt"))
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(950)
+    with open("foo.dat", "wb") as f:
+        f.write(data)
+    client.failures = {7}
+    client.max_concurrency = 1
+    with pytest.raises(ConnectionError, match="part 7 failed"):
+        upload_artifact("foo.dat", archive=None, resume_key="foo")
+    client.failures = set()
+    client.requests = []
+    client.max_concurrency = None
+    art = upload_artifact("foo.dat", archive=None, resume_key="foo")
+    # the staged file is resumed in a new staging directory
+    assert sorted(client.requests) == [7, 8, 9, 10]
+    assert client.aborted == []
+    assert path_list_of_artifact(art) == ["foo.dat"]
+    with open(download_artifact(art, path="out")[0], "rb") as f:
+        assert f.read() == data
+
+    # errors which are not transient abort the upload
+    client.failures = {3}
+    client.error = PermissionError
+    with pytest.raises(PermissionError):
+        upload_s3("foo.dat", key="bar.dat")
+    assert len(client.aborted) == 1
+    assert os.listdir(tmp_path / "ckpt") == []
+
+    client.error = ConnectionError
+    with pytest.raises(ConnectionError):
+        upload_s3("foo.dat", key="bar.dat")
+    assert clean_checkpoints(max_age=3600) == 0
+    assert clean_checkpoints(max_age=0) == 1
+    assert len(client.aborted) == 2
+    assert os.listdir(tmp_path / "ckpt") == []
+
+
+def test_sharded_upload(storage_client):
+    paths = []
+    for i in range(10):
+        os.makedirs("foo%s" % i, exist_ok=True)
+        with open("foo%s/bar.txt" % i, "w") as f:
+            f.write("x" * (i + 1) * 100)
+        paths.append("foo%s" % i)
+    art = upload_artifact(paths, shards=3)
+    shards = [k for k in storage_client.list(art.key)
+              if k.endswith(".tgz")]
+    assert len(shards) == 3
+    assert path_list_of_artifact(art) == paths
+    assert download_artifact(art, path="out") == ["out/" + p for p in paths]
+    assert sorted(os.listdir("out")) == sorted(paths)
+    with open("out/foo9/bar.txt", "r") as f:
+        assert f.read() == "x" * 1000
+
+    read = []
+    download_stream = storage_client.download_stream
+    storage_client.download_stream = lambda key: (
+        read.append(key), download_stream(key))[1]
+    assert download_artifact(art, slices=[2, 7], path="part") == [
+        "part/foo2", "part/foo7"]
+    assert sorted(os.listdir("part")) == ["foo2", "foo7"]
+    assert len([k for k in read if k.endswith(".tgz")]) <= 2
+
+
+def test_archive_auto(storage_client):
+    os.makedirs("random", exist_ok=True)
+    os.makedirs("text", exist_ok=True)
+    for i in range(3):
+        with open("random/%s.dat" % i, "wb") as f:
+            f.write(os.urandom(10000))
+        with open("text/%s.txt" % i, "w") as f:
+            f.write("hello world\n" * 1000)
+    with open("random/empty.gz", "wb") as f:
+        f.write(b"\0" * 10000)
+    assert choose_archive(["random"]) is None
+    assert choose_archive(["text"]) == "tar"
+    art = upload_artifact(["random"], archive="auto")
+    assert get_archive_codec(art.key) is None
+    art = upload_artifact(["text"], archive="auto")
+    assert get_archive_codec(art.key) == "tar"
+    assert download_artifact(art, path="out") == ["out/text"]
+
+
+@pytest.mark.parametrize("archive", [None, "tar"])
+def test_empty_dir_tag(storage_client, archive):
+    os.makedirs("foo/empty", exist_ok=True)
+    with open("foo/empty/.empty_dir", "w"):
+        pass
+    with open("foo/bar.txt", "w") as f:
+        f.write("bar")
+    art = upload_artifact(["foo"], archive=archive)
+    assert download_artifact(art, path="out", stream=False) == ["out/foo"]
+    assert os.path.isdir("out/foo/empty")
+    assert os.listdir("out/foo/empty") == []
+    with open("out/foo/bar.txt", "r") as f:
+        assert f.read() == "bar"
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    import http.server
+    data = os.urandom(1000)
+    requests = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def send_meta(self, status, length):
+            self.send_response(status)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(length))
+            self.end_headers()
+
+        def do_HEAD(self):
+            self.send_meta(200, len(data))
+
+        def do_GET(self):
+            requests.append(self.headers.get("Range"))
+            r = self.headers.get("Range")
+            if r is None:
+                self.send_meta(200, len(data))
+                self.wfile.write(data)
+            else:
+                start, end = map(int, r[len("bytes="):].split("-"))
+                self.send_meta(206, end + 1 - start)
+                self.wfile.write(data[start:end + 1])
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%s/foo.dat" % server.server_port, data, requests
+    server.shutdown()
+
+
+def test_http_artifact(http_server, tmp_path, monkeypatch):
+    url, data, requests = http_server
+    monkeypatch.setitem(s3_config, "multipart_threshold", 100)
+    monkeypatch.setitem(s3_config, "part_size", 300)
+    monkeypatch.setitem(s3_config, "checkpoint_dir", str(tmp_path / "ckpt"))
+    cache_dir = str(tmp_path / "cache")
+    path = HTTPArtifact(url).download(path=str(tmp_path / "a"),
+                                      cache_dir=cache_dir)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert sorted(requests) == ["bytes=0-299", "bytes=300-599",
+                                "bytes=600-899", "bytes=900-999"]
+    path = HTTPArtifact(url).download(path=str(tmp_path / "b"),
+                                      cache_dir=cache_dir)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert len(requests) == 4
+
+
+class AsyncDictStorageClient(AsyncStorageClient):
+    def __init__(self, client=None):
+        self.client = client if client is not None else DictStorageClient()
+        self.calls = 0
+
+    async def upload(self, key, path):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        self.client.upload(key, path)
+
+    async def download(self, key, path):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        self.client.download(key, path)
+
+    async def list(self, prefix, recursive=False):
+        return self.client.list(prefix, recursive)
+
+    async def copy(self, src, dst):
+        self.client.copy(src, dst)
+
+    async def get_md5(self, key):
+        return self.client.get_md5(key)
+
+
+@pytest.mark.parametrize("archive", [None, "tar", "indexed"])
+def test_async_artifact(storage_client, monkeypatch, archive):
+    client = AsyncDictStorageClient(storage_client)
+    monkeypatch.setitem(s3_config, "async_storage_client", client)
+    for i in range(10):
+        os.makedirs("in/%s" % i)
+        with open("in/%s/foo.txt" % i, "w") as f:
+            f.write("foo%s" % i)
+    paths = ["in/%s" % i for i in range(10)]
+
+    async def run():
+        arts = await asyncio.gather(*[async_upload_artifact(
+            paths[i:i + 5], archive=archive) for i in [0, 5]])
+        if archive is None:
+            art = await async_copy_artifact(
+                arts[1], S3Artifact(key=arts[0].key), sort=True)
+        else:
+            art = arts[0]
+        return arts, await asyncio.gather(
+            async_download_artifact(art, path="out"),
+            async_download_artifact(arts[1], sub_path="in/8", path="sub"))
+
+    arts, (whole, sub) = asyncio.run(run())
+    assert client.calls > 0
+    n = 10 if archive is None else 5
+    assert whole == ["out/in/%s" % i for i in range(n)]
+    with open("out/in/%s/foo.txt" % (n - 1)) as f:
+        assert f.read() == "foo%s" % (n - 1)
+    assert sub == "sub/in/8"
+    with open("sub/in/8/foo.txt") as f:
+        assert f.read() == "foo8"
+    if archive != "tar":
+        # slices of an archive are listed by its index
+        slices = asyncio.run(async_download_artifact(
+            S3Artifact(key=arts[0].key), slices=[1, 3], path="slices"))
+        assert slices == ["slices/in/1", "slices/in/3"]
+        with open("slices/in/3/foo.txt") as f:
+            assert f.read() == "foo3"
+
+
+def test_async_storage_client(tmp_path, monkeypatch):
+    client = AsyncDictStorageClient()
+    monkeypatch.setitem(s3_config, "async_storage_client", client)
+    monkeypatch.chdir(tmp_path)
+    for i in range(50):
+        os.makedirs("in/%s" % i)
+        with open("in/%s/foo.txt" % i, "w") as f:
+            f.write("foo%s" % i)
+
+    async def run():
+        await async_upload_s3("in", "src")
+        await async_copy_s3("src", "dst")
+        await async_download_s3("dst", "out")
+
+    start = time.time()
+    asyncio.run(run())
+    # 50 uploads and 50 downloads of 10ms each with concurrency 8
+    assert time.time() - start < 1.0
+    assert len(client.client.objects) == 100
+    for i in range(50):
+        with open("out/%s/foo.txt" % i) as f:
+            assert f.read() == "foo%s" % i
+    with pytest.raises(OSError):
+        asyncio.run(async_download_s3("dst", "/proc/none"))
+
+
+@pytest.mark.parametrize("scheme", ["memory", "localfs"])
+def test_local_storage_client(tmp_path, monkeypatch, scheme):
+    url = "memory://?latency=0.01" if scheme == "memory" else \
+        "localfs://%s/storage?latency=0.01" % tmp_path
+    monkeypatch.setitem(s3_config, "storage_client", url)
+    monkeypatch.setitem(s3_config, "multipart_threshold", 1 << 10)
+    monkeypatch.setitem(s3_config, "part_size", 1 << 10)
+    monkeypatch.chdir(tmp_path)
+    clear_storage_client_cache()
+    client = get_storage_client()
+    assert client is get_storage_client()
+    assert client.latency == 0.01
+    os.makedirs("foo/sub")
+    os.makedirs("bar")
+    with open("foo/sub/baz.txt", "w") as f:
+        f.write("baz")
+    with open("bar/big.bin", "wb") as f:
+        f.write(os.urandom(5000))
+    for i in range(20):
+        with open("foo/%s.txt" % i, "w") as f:
+            f.write("foo%s" % i)
+
+    art = upload_artifact(["bar", "foo"], archive=None)
+    assert art.to_dict()["latency"] == 0.01
+    assert [item["dflow_list_item"] for item in sorted(
+        catalog_of_artifact(art), key=lambda i: i["order"])] == ["bar", "foo"]
+    assert client.list(art.key + "/foo/")[0] == art.key + "/foo/0.txt"
+    assert client.list(art.key + "/foo/")[-1] == art.key + "/foo/sub/"
+    copy = copy_artifact(art, S3Artifact(key="copy/"))
+    start = time.time()
+    download_artifact(copy, path="out")
+    # about 30 requests of 10ms each with concurrency 8
+    assert time.time() - start < 0.5
+    if scheme == "memory":
+        # uploaded in parts of 1 KiB
+        meta = client.list_with_meta(copy.key + "bar/big.bin")
+        assert meta[0]["etag"].endswith("-5")
+    assert get_md5("out/bar/big.bin") == get_md5("bar/big.bin")
+    with open("out/foo/7.txt") as f:
+        assert f.read() == "foo7"
+    clear_storage_client_cache()
+    subprocess.run([sys.executable, "-c", "import dflow"], check=True,
+                   env=dict(os.environ, DFLOW_S3_STORAGE_CLIENT=url))
+
+
+@pytest.mark.parametrize("link", ["hardlink", "reflink", "symlink", "copy"])
+def test_shared_fs_storage_client(tmp_path, monkeypatch, link):
+    root = tmp_path / "shared"
+    monkeypatch.setitem(s3_config, "storage_client",
+                        "localfs://%s?link=%s&index=1" % (root, link))
+    monkeypatch.chdir(tmp_path)
+    clear_storage_client_cache()
+    client = get_storage_client()
+    os.makedirs("foo")
+    for i in range(5):
+        with open("foo/%s.txt" % i, "w") as f:
+            f.write("foo" * i)
+
+    art = upload_artifact("foo", archive=None)
+    copy = copy_artifact(art, S3Artifact(key="copy/"))
+    meta = client.list_with_meta("copy/foo/")
+    assert [m["size"] for m in meta] == [0, 3, 6, 9, 12]
+    # sizes are listed from the index
+    with open(root / "copy" / "foo" / client.index_name) as f:
+        assert len(f.readlines()) == 5
+    assert client.list("copy/") == ["copy/.dflow/", "copy/foo/"]
+    with monkeypatch.context() as m:
+        # a single directory is scanned unless recursive
+        m.setattr(os, "walk", None)
+        assert client.list("copy/f") == ["copy/foo/"]
+        assert client.list_with_meta("copy/foo/2")[0]["size"] == 6
+
+    download_artifact(copy, path="out")
+    with open("out/foo/4.txt") as f:
+        assert f.read() == "foo" * 4
+    obj = str(root / "copy" / "foo" / "4.txt")
+    if link == "symlink":
+        assert os.path.realpath("out/foo/4.txt") == obj
+    elif link == "hardlink":
+        assert os.path.samefile("out/foo/4.txt", obj)
+    else:
+        assert not os.path.islink("out/foo/4.txt")
+        assert not os.path.samefile("out/foo/4.txt", obj)
+    # modifying a source file in place after the upload keeps the object
+    assert not os.path.samefile("foo/4.txt", obj)
+    with open("foo/3.txt", "r+") as f:
+        f.write("bar")
+    download_artifact(art, path="again")
+    with open("again/foo/3.txt") as f:
+        assert f.read() == "foo" * 3
+    clear_storage_client_cache()
+
+
+class FlakyStorageClient(DictStorageClient):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.calls = 0
+        self.slow_calls = 0
+
+    def upload(self, key, path):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("connection reset")
+        super().upload(key, path)
+
+    def get_md5(self, key):
+        self.calls += 1
+        raise KeyError(key)
+
+    def download_range(self, key, start, end):
+        with self.lock:
+            self.slow_calls += 1
+            slow = self.slow_calls == 1
+        # the first request is stuck, the hedged one is fast
+        time.sleep(1.0 if slow else 0.001)
+        return self.objects[key][start:end]
+
+
+def test_retry_and_hedge(tmp_path, monkeypatch):
+    client = FlakyStorageClient(failures=2)
+    monkeypatch.setitem(s3_config, "storage_client", client)
+    monkeypatch.setitem(s3_config, "max_retries", 3)
+    monkeypatch.setitem(s3_config, "retry_errors", {"LookupError": 0})
+    monkeypatch.setitem(s3_config, "retry_backoff", 0.01)
+    monkeypatch.chdir(tmp_path)
+    wrapped = get_storage_client()
+    assert wrapped is get_storage_client() and wrapped.client is client
+    with open("foo.txt", "w") as f:
+        f.write("foo")
+    upload_s3("foo.txt", "foo.txt")
+    assert client.calls == 3 and client.objects["foo.txt"] == b"foo"
+    client.calls = 0
+    with pytest.raises(KeyError):
+        wrapped.get_md5("foo.txt")
+    assert client.calls == 1
+
+    monkeypatch.setitem(s3_config, "hedge_percentile", 90)
+    # latencies of ranged reads are per byte
+    for _ in range(wrapped.min_hedge_samples):
+        wrapped.record_latency("download_range", 0.005)
+    start = time.time()
+    assert wrapped.download_range("foo.txt", 1, 3) == b"oo"
+    assert time.time() - start < 0.5
+    assert client.slow_calls == 2
+
+    # no duplicate request without an idle worker
+    client.slow_calls = 0
+    executor = get_hedge_executor()
+    monkeypatch.setattr(executor, "pending", executor.max_workers)
+    assert wrapped.download_range("foo.txt", 1, 3) == b"oo"
+    assert client.slow_calls == 1
+    clear_storage_client_cache()
+
+
+def test_token_bucket_priority():
+    bucket = TokenBucket(rate=1000)
+    bucket.acquire(1100)
+    order = []
+
+    def acquire(priority):
+        bucket.acquire(100, priority)
+        order.append(priority)
+
+    low = threading.Thread(target=acquire, args=(0,))
+    low.start()
+    time.sleep(0.02)
+    high = threading.Thread(target=acquire, args=(1,))
+    high.start()
+    low.join()
+    high.join()
+    assert order == [1, 0]
+
+
+def test_throttle_before_download(tmp_path):
+    client = MultipartStorageClient()
+    client.objects["foo.bin"] = b"x" * 3000
+    events = []
+
+    class Bucket:
+        def acquire(self, n, priority=0):
+            events.append(("acquire", n))
+
+        def release(self, n):
+            events.append(("release", n))
+
+    wrapped = ThrottledStorageClient(client, [Bucket()])
+    download = client.download
+    client.download = lambda key, path: (events.append(("download", key)),
+                                         download(key, path))
+    client.list_with_meta = None
+    # the size listed by the caller is charged before the transfer
+    download_file(wrapped, "foo.bin", str(tmp_path / "foo.bin"), size=3000)
+    assert events == [("acquire", 3000), ("download", "foo.bin")]
+
+    events.clear()
+    with wrapped.download_stream("foo.bin") as f:
+        assert f.read(1000) == b"x" * 1000
+        assert events[-2:] == [("acquire", 1000), ("release", 0)]
+        assert f.read() == b"x" * 2000
+        assert f.read() == b""
+    charged = sum(n if e == "acquire" else -n for e, n in events
+                  if e != "download")
+    assert charged == 3000
+    # the end of the stream is not charged again
+    assert events[-2:] == [("acquire", 1 << 16), ("release", (1 << 16) - 2000)]
+
+
+def test_throttled_download_lists_once(storage_client, monkeypatch):
+    for i in range(50):
+        storage_client.objects["foo/%s.txt" % i] = b"foo"
+    calls = []
+    list_ = storage_client.list
+    monkeypatch.setattr(storage_client, "list", lambda *args, **kwargs: (
+        calls.append(args), list_(*args, **kwargs))[1])
+    download_s3("foo", "out", bandwidth_limit=200000)
+    assert len(calls) == 1
+    assert open("out/7.txt").read() == "foo"
+
+
+def test_bandwidth_limit(storage_client, monkeypatch):
+    storage_client.latency = 0
+    os.makedirs("foo")
+    for i in range(5):
+        with open("foo/%s.bin" % i, "wb") as f:
+            f.write(os.urandom(60000))
+    start = time.time()
+    upload_s3("foo", "foo", bandwidth_limit=200000)
+    # 300 KB at 200 KB/s with a burst of 200 KB
+    assert time.time() - start > 0.15
+
+    monkeypatch.setitem(s3_config, "bandwidth_limit", 200000)
+    assert isinstance(get_storage_client(), ThrottledStorageClient)
+    start = time.time()
+    download_s3("foo", "out")
+    assert time.time() - start > 0.15
+    assert get_md5("out/3.bin") == get_md5("foo/3.bin")
+
+
+def test_transfer_metrics(storage_client, monkeypatch, tmp_path):
+    emitted = []
+    monkeypatch.setitem(config, "transfer_metrics", emitted.append)
+    reset_transfer_metrics()
+    os.makedirs("foo")
+    for i in range(5):
+        with open("foo/%s.txt" % i, "w") as f:
+            f.write("foo%s" % i)
+    art = upload_artifact("foo", archive=None)
+    download_artifact(art, path="out")
+    # metrics are emitted once for each outermost helper
+    assert len(emitted) == 2
+    metrics = get_transfer_metrics()
+    assert metrics["operations"]["upload"]["objects"] == 6
+    assert metrics["operations"]["download"]["bytes"] >= 20
+    assert sum(metrics["operations"]["download"]["latency_buckets"]) == \
+        metrics["operations"]["download"]["requests"]
+    assert metrics["operations"]["download"]["throughput"] > 0
+    assert metrics["helpers"]["upload_artifact"]["calls"] == 1
+    assert metrics["helpers"]["upload_s3"]["calls"] == 1
+
+    prom = tmp_path / "dflow.prom"
+    monkeypatch.setitem(config, "transfer_metrics", "prometheus:%s" % prom)
+    download_s3(art.key, "out2")
+    text = prom.read_text()
+    assert 'dflow_storage_objects_total{operation="upload"} 6' in text
+    assert 'dflow_storage_request_duration_seconds_bucket{operation=' \
+        '"download",le="+Inf"}' in text
+    clear_storage_client_cache()
+    reset_transfer_metrics()
+
+
+def test_minio_multipart_versions(monkeypatch):
+    minio = pytest.importorskip("minio")
+    monkeypatch.setattr(minio, "__version__", "7.2.20")
+    assert MinioClient(endpoint="127.0.0.1:9000").resumable
+    monkeypatch.setattr(minio, "__version__", "8.0.0")
+    # the private multipart methods are not used for unchecked versions
+    assert not minio_supports_multipart()
+    assert not MinioClient(endpoint="127.0.0.1:9000").resumable